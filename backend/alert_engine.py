@@ -0,0 +1,274 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left, bisect_right
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+import models as db_models
+
+logger = logging.getLogger(__name__)
+
+Pair = Tuple[str, str]
+
+
+class ThresholdList:
+    """Alert targets kept sorted, with alert ids in a parallel list"""
+
+    __slots__ = ("targets", "ids")
+
+    def __init__(self):
+        self.targets: List[float] = []
+        self.ids: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.targets)
+
+    def add(self, target: float, alert_id: int):
+        index = bisect_right(self.targets, target)
+        self.targets.insert(index, target)
+        self.ids.insert(index, alert_id)
+
+    def remove(self, target: float, alert_id: int) -> bool:
+        index = bisect_left(self.targets, target)
+        while index < len(self.targets) and self.targets[index] == target:
+            if self.ids[index] == alert_id:
+                del self.targets[index]
+                del self.ids[index]
+                return True
+            index += 1
+        return False
+
+    def pop_at_or_below(self, price: float) -> List[int]:
+        end = bisect_right(self.targets, price)
+        crossed = self.ids[:end]
+        del self.targets[:end]
+        del self.ids[:end]
+        return crossed
+
+    def pop_at_or_above(self, price: float) -> List[int]:
+        start = bisect_left(self.targets, price)
+        crossed = self.ids[start:]
+        del self.targets[start:]
+        del self.ids[start:]
+        return crossed
+
+
+class AlertIndex:
+    """Active alerts indexed by (coin_id, currency) into sorted threshold lists.
+
+    "Above" alerts fire once the price reaches their target, so the crossed
+    ones are a prefix of the ascending list; "below" alerts are a suffix.
+    Finding them is a binary search per watched pair.
+    """
+
+    def __init__(self):
+        self._above: Dict[Pair, ThresholdList] = {}
+        self._below: Dict[Pair, ThresholdList] = {}
+        self._alerts: Dict[int, Tuple[Pair, bool, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._alerts)
+
+    def __contains__(self, alert_id: int) -> bool:
+        return alert_id in self._alerts
+
+    def add(self, alert_id: int, coin_id: str, currency: str, target: float, is_above: bool):
+        if alert_id in self._alerts or target is None:
+            return
+        pair = (coin_id, (currency or "usd").lower())
+        table = self._above if is_above else self._below
+        table.setdefault(pair, ThresholdList()).add(target, alert_id)
+        self._alerts[alert_id] = (pair, is_above, target)
+
+    def remove(self, alert_id: int):
+        found = self._alerts.pop(alert_id, None)
+        if found is None:
+            return
+        pair, is_above, target = found
+        table = self._above if is_above else self._below
+        thresholds = table.get(pair)
+        if thresholds is not None:
+            thresholds.remove(target, alert_id)
+            if not thresholds:
+                del table[pair]
+
+    def pairs(self) -> List[Pair]:
+        return list(self._above.keys() | self._below.keys())
+
+    def pop_crossed(self, pair: Pair, price: float) -> List[int]:
+        crossed = []
+        for table, pop in ((self._above, ThresholdList.pop_at_or_below),
+                           (self._below, ThresholdList.pop_at_or_above)):
+            thresholds = table.get(pair)
+            if thresholds is None:
+                continue
+            crossed.extend(pop(thresholds, price))
+            if not thresholds:
+                del table[pair]
+        for alert_id in crossed:
+            del self._alerts[alert_id]
+        return crossed
+
+
+class AlertEngine:
+    """Evaluates every active PriceAlert on a fixed tick.
+
+    Alerts are loaded into an AlertIndex (fully every ``reload_interval``
+    seconds, and incrementally through ``add`` as they are created). Each
+    tick fetches prices for all watched pairs in batches, pops the crossed
+    alerts from the index and deactivates them with one bulk UPDATE per
+    chunk. Database work runs in a worker thread.
+
+    With several worker processes only one may evaluate alerts, or each
+    would fire them. ``lease(seconds)`` claims or renews that right for the
+    given time; workers that do not hold it skip their ticks and take over
+    once the holder stops renewing.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        get_prices: Callable[[List[str], List[str]], Awaitable[dict]],
+        interval: float = 5,
+        reload_interval: float = 300,
+        batch_size: int = 200,
+        on_trigger: Optional[Callable[[List[int]], None]] = None,
+        lease: Optional[Callable[[float], Awaitable[bool]]] = None,
+    ):
+        self.session_factory = session_factory
+        self.get_prices = get_prices
+        self.interval = interval
+        self.reload_interval = reload_interval
+        self.batch_size = batch_size
+        self.on_trigger = on_trigger
+        self.lease = lease
+        self.leader = lease is None
+        self.index = AlertIndex()
+        self._loaded_at: Optional[float] = None
+        # Alerts added while a reload is reading the table, replayed onto its result
+        self._added_during_reload: Optional[List[tuple]] = None
+        self.ticks = 0
+        self.triggered = 0
+        self.last_tick_seconds = 0.0
+
+    def add(self, alert: db_models.PriceAlert):
+        if not alert.is_active or not self.leader:
+            return
+        entry = (alert.id, alert.coin_id, alert.currency, alert.target_price, alert.is_above)
+        self.index.add(*entry)
+        if self._added_during_reload is not None:
+            self._added_during_reload.append(entry)
+
+    async def run(self):
+        while True:
+            try:
+                if await self._hold_lease():
+                    await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Price alert tick failed")
+            await asyncio.sleep(self.interval)
+
+    async def _hold_lease(self) -> bool:
+        if self.lease is None:
+            return True
+        # Outlives a few missed ticks, so a slow tick does not hand the lease over
+        leader = await self.lease(max(self.interval * 3, 30))
+        if not leader and self.leader:
+            # Another worker took over; reload in full if this one gets it back
+            self.index = AlertIndex()
+            self._loaded_at = None
+        self.leader = leader
+        return leader
+
+    async def tick(self):
+        started = time.time()
+        if self._loaded_at is None or started - self._loaded_at >= self.reload_interval:
+            self._added_during_reload = []
+            try:
+                index = await asyncio.to_thread(self._load_index)
+            finally:
+                added, self._added_during_reload = self._added_during_reload, None
+            for entry in added:
+                index.add(*entry)
+            self.index = index
+            self._loaded_at = started
+
+        by_currency: Dict[str, List[str]] = {}
+        for coin_id, currency in self.index.pairs():
+            by_currency.setdefault(currency, []).append(coin_id)
+
+        batches = [
+            (coin_ids[start:start + self.batch_size], currency)
+            for currency, coin_ids in by_currency.items()
+            for start in range(0, len(coin_ids), self.batch_size)
+        ]
+        results = await asyncio.gather(
+            *(self.get_prices(coin_ids, [currency]) for coin_ids, currency in batches),
+            return_exceptions=True,
+        )
+
+        triggered: List[int] = []
+        for (coin_ids, currency), prices in zip(batches, results):
+            if isinstance(prices, BaseException):
+                logger.warning("Price fetch for alerts failed: %s", prices)
+                continue
+            for coin_id, quotes in prices.items():
+                price = quotes.get(currency)
+                if price is not None:
+                    triggered.extend(self.index.pop_crossed((coin_id, currency), price))
+
+        if triggered:
+            await asyncio.to_thread(self._deactivate, triggered)
+            self.triggered += len(triggered)
+            if self.on_trigger is not None:
+                self.on_trigger(triggered)
+        self.ticks += 1
+        self.last_tick_seconds = time.time() - started
+
+    def _load_index(self) -> AlertIndex:
+        index = AlertIndex()
+        db = self.session_factory()
+        try:
+            rows = (
+                db.query(
+                    db_models.PriceAlert.id,
+                    db_models.PriceAlert.coin_id,
+                    db_models.PriceAlert.currency,
+                    db_models.PriceAlert.target_price,
+                    db_models.PriceAlert.is_above,
+                )
+                .filter(db_models.PriceAlert.is_active == True)
+                .yield_per(10000)
+            )
+            for alert_id, coin_id, currency, target_price, is_above in rows:
+                index.add(alert_id, coin_id, currency, target_price, is_above is not False)
+        finally:
+            db.close()
+        return index
+
+    def _deactivate(self, alert_ids: Iterable[int], chunk_size: int = 500):
+        alert_ids = list(alert_ids)
+        db = self.session_factory()
+        try:
+            for start in range(0, len(alert_ids), chunk_size):
+                db.query(db_models.PriceAlert).filter(
+                    db_models.PriceAlert.id.in_(alert_ids[start:start + chunk_size])
+                ).update({db_models.PriceAlert.is_active: False}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        return {
+            "indexed_alerts": len(self.index),
+            "watched_pairs": len(self.index.pairs()),
+            "ticks": self.ticks,
+            "triggered": self.triggered,
+            "last_tick_seconds": self.last_tick_seconds,
+            "interval": self.interval,
+            "leader": self.leader,
+        }
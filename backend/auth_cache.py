@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Read-only snapshot of the authenticated User row"""
+
+    id: int
+    username: str
+    email: str
+    preferred_currency: str
+    is_active: bool
+    is_admin: bool
+    created_at: Optional[datetime]
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            preferred_currency=user.preferred_currency,
+            is_active=user.is_active,
+            is_admin=user.is_admin,
+            created_at=user.created_at,
+        )
+
+
+class AuthCache:
+    """Short-lived cache of verified tokens and the principals they name.
+
+    Tokens map to their subject until the earlier of the cache TTL and the
+    token's own ``exp``; subjects map to a Principal for ``ttl`` seconds.
+    Any change to a user must call ``invalidate_user`` so the next request
+    in this process reloads it from the database. Other worker processes
+    learn about the change through a shared generation number: the change
+    bumps it in the database, each worker polls it and ``sync_generation``
+    drops every cached principal once it moves, so a change reaches all
+    workers within one poll interval rather than one ``ttl``.
+    """
+
+    def __init__(self, ttl: float = 30, max_entries: int = 10000, clock: Callable[[], float] = time.time):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._tokens: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._users: "OrderedDict[str, Tuple[Principal, float]]" = OrderedDict()
+        self._usernames: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self.generation: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.resyncs = 0
+
+    def subject_for(self, token: str) -> Optional[str]:
+        with self._lock:
+            cached = self._tokens.get(token)
+            if cached is None:
+                return None
+            subject, valid_until = cached
+            if self.clock() >= valid_until:
+                del self._tokens[token]
+                return None
+            self._tokens.move_to_end(token)
+            return subject
+
+    def remember_token(self, token: str, subject: str, expires_at: Optional[float]):
+        valid_until = self.clock() + self.ttl
+        if expires_at is not None:
+            valid_until = min(valid_until, expires_at)
+        with self._lock:
+            self._tokens[token] = (subject, valid_until)
+            self._tokens.move_to_end(token)
+            while len(self._tokens) > self.max_entries:
+                self._tokens.popitem(last=False)
+
+    def get_user(self, username: str) -> Optional[Principal]:
+        with self._lock:
+            cached = self._users.get(username)
+            if cached is None or self.clock() - cached[1] >= self.ttl:
+                self.misses += 1
+                return None
+            self._users.move_to_end(username)
+            self.hits += 1
+            return cached[0]
+
+    def put_user(self, user) -> Principal:
+        principal = Principal.from_user(user)
+        with self._lock:
+            self._users[principal.username] = (principal, self.clock())
+            self._users.move_to_end(principal.username)
+            self._usernames[principal.id] = principal.username
+            while len(self._users) > self.max_entries:
+                _, (evicted, _) = self._users.popitem(last=False)
+                self._usernames.pop(evicted.id, None)
+        return principal
+
+    def invalidate_user(self, user_id: Optional[int] = None, username: Optional[str] = None):
+        with self._lock:
+            if username is None and user_id is not None:
+                username = self._usernames.get(user_id)
+            if username is not None:
+                cached = self._users.pop(username, None)
+                if cached is not None:
+                    self._usernames.pop(cached[0].id, None)
+
+    def sync_generation(self, generation: int):
+        """Forget every principal if a user changed in another process since the last call"""
+        with self._lock:
+            if self.generation is not None and generation != self.generation:
+                self._users.clear()
+                self._usernames.clear()
+                self.resyncs += 1
+            self.generation = generation
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+            self._users.clear()
+            self._usernames.clear()
+
+    def stats(self) -> dict:
+        return {
+            "tokens": len(self._tokens),
+            "users": len(self._users),
+            "hits": self.hits,
+            "misses": self.misses,
+            "ttl": self.ttl,
+            "generation": self.generation,
+            "resyncs": self.resyncs,
+        }
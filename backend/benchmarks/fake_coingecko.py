@@ -0,0 +1,277 @@
+"""Local stand-in for the CoinGecko API with configurable latency, errors and 429s.
+
+Run from the backend directory:
+
+    python benchmarks/fake_coingecko.py --port 8900 --latency-ms 80 --throttle-rate 0.01
+
+and point the app at it with COINGECKO_BASE_URL=http://127.0.0.1:8900/api/v3.
+Payloads follow the shape of the real endpoints and are generated from a
+fixed seed, so every run sees the same coins and prices. GET /_stats
+returns the number of calls and the status codes served per endpoint.
+"""
+import argparse
+import asyncio
+import math
+import random
+import time
+from collections import Counter, defaultdict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+HEADLINERS = [("bitcoin", "btc", "Bitcoin"), ("ethereum", "eth", "Ethereum"), ("tether", "usdt", "Tether"),
+              ("solana", "sol", "Solana"), ("ripple", "xrp", "XRP"), ("dogecoin", "doge", "Dogecoin")]
+# Units of each vs currency per USD
+FX = {"usd": 1.0, "eur": 0.92, "gbp": 0.79, "jpy": 151.0, "ngn": 1500.0, "btc": 1 / 65000, "eth": 1 / 3200}
+CATEGORIES = 40
+# /coins/markets order -> (sort field, descending)
+ORDERS = {"market_cap_desc": ("market_cap", True), "market_cap_asc": ("market_cap", False),
+          "volume_desc": ("total_volume", True), "volume_asc": ("total_volume", False),
+          "id_desc": ("id", True), "id_asc": ("id", False)}
+
+
+def make_coins(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    # Separate stream, so adding fields doesn't change the coins themselves
+    extra_rng = random.Random(seed + 2)
+    coins = []
+    for rank in range(count):
+        if rank < len(HEADLINERS):
+            coin_id, symbol, name = HEADLINERS[rank]
+        else:
+            symbol = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 5)))
+            name = f"{symbol.upper()} Token {rank}"
+            coin_id = f"{symbol}-token-{rank}"
+        coins.append({
+            "id": coin_id,
+            "symbol": symbol,
+            "name": name,
+            "rank": rank + 1,
+            "price": 65000.0 / (rank + 1) ** 1.6 * rng.uniform(0.9, 1.1),
+            "supply": rng.uniform(1e7, 1e10),
+            "address": "0x" + "".join(rng.choice("0123456789abcdef") for _ in range(40)),
+            # Daily volume as a share of market cap, so volume order differs from market cap order
+            "turnover": extra_rng.uniform(0.005, 0.2),
+            # Skewed sizes: category-0 is the largest, the last ones hold a coin or two
+            "category": f"category-{min(int(extra_rng.expovariate(0.15)), CATEGORIES - 1)}",
+        })
+    return coins
+
+
+def create_app(coins: int = 500, seed: int = 7, latency_ms: float = 50, jitter_ms: float = 20,
+               error_rate: float = 0.0, throttle_rate: float = 0.0) -> FastAPI:
+    app = FastAPI(title="Fake CoinGecko")
+    catalogue = make_coins(coins, seed)
+    by_id = {coin["id"]: coin for coin in catalogue}
+    rng = random.Random(seed + 1)
+    calls = defaultdict(Counter)
+
+    def price(coin: dict, currency: str, at: float = None) -> float:
+        # Slow deterministic wobble so charts and alerts see movement
+        at = time.time() if at is None else at
+        wobble = 1 + 0.03 * math.sin(at / 3600 + coin["rank"])
+        return coin["price"] * wobble * FX.get(currency, 1.0)
+
+    def series(coin: dict, currency: str, start: float, end: float, step: float) -> dict:
+        times = [start + i * step for i in range(int((end - start) // step) + 1)]
+        prices = [[int(t * 1000), price(coin, currency, t)] for t in times]
+        return {
+            "prices": prices,
+            "market_caps": [[t, p * coin["supply"]] for t, p in prices],
+            "total_volumes": [[t, p * coin["supply"] * coin["turnover"]] for t, p in prices],
+        }
+
+    def coin_or_404(coin_id: str):
+        coin = by_id.get(coin_id)
+        if coin is None:
+            return None, JSONResponse({"error": "coin not found"}, status_code=404)
+        return coin, None
+
+    @app.middleware("http")
+    async def shape_traffic(request: Request, call_next):
+        if request.url.path == "/_stats":
+            return await call_next(request)
+        endpoint = request.url.path
+        await asyncio.sleep(max(0.0, rng.gauss(latency_ms, jitter_ms)) / 1000)
+        roll = rng.random()
+        if roll < throttle_rate:
+            response = JSONResponse({"status": {"error_code": 429, "error_message": "Throttled"}},
+                                    status_code=429, headers={"Retry-After": "1"})
+        elif roll < throttle_rate + error_rate:
+            response = JSONResponse({"error": "internal error"}, status_code=500)
+        else:
+            response = await call_next(request)
+            endpoint = request.scope["route"].path if "route" in request.scope else endpoint
+        calls[endpoint][response.status_code] += 1
+        return response
+
+    @app.get("/_stats")
+    async def stats():
+        return {endpoint: dict(statuses) for endpoint, statuses in calls.items()}
+
+    @app.get("/api/v3/simple/price")
+    async def simple_price(ids: str, vs_currencies: str):
+        currencies = vs_currencies.lower().split(",")
+        return {
+            coin_id: {currency: price(by_id[coin_id], currency) for currency in currencies}
+            for coin_id in ids.lower().split(",") if coin_id in by_id
+        }
+
+    @app.get("/api/v3/simple/supported_vs_currencies")
+    async def supported_vs_currencies():
+        return list(FX)
+
+    @app.get("/api/v3/exchange_rates")
+    async def exchange_rates():
+        btc_usd = 1 / FX["btc"]
+        return {"rates": {
+            currency: {"name": currency.upper(), "unit": currency, "value": btc_usd * rate,
+                       "type": "crypto" if currency in ("btc", "eth") else "fiat"}
+            for currency, rate in FX.items()
+        }}
+
+    @app.get("/api/v3/coins/list")
+    async def coins_list(include_platform: bool = False):
+        return [
+            {"id": coin["id"], "symbol": coin["symbol"], "name": coin["name"],
+             **({"platforms": {"ethereum": coin["address"]}} if include_platform else {})}
+            for coin in catalogue
+        ]
+
+    @app.get("/api/v3/coins/categories/list")
+    async def categories_list():
+        return [{"category_id": f"category-{i}", "name": f"Category {i}"} for i in range(CATEGORIES)]
+
+    @app.get("/api/v3/search/trending")
+    async def trending():
+        return {"coins": [{"item": {"id": coin["id"], "coin_id": coin["rank"], "name": coin["name"],
+                                    "symbol": coin["symbol"], "market_cap_rank": coin["rank"]}}
+                          for coin in catalogue[:15]]}
+
+    @app.get("/api/v3/global")
+    async def global_data():
+        total = sum(coin["price"] * coin["supply"] for coin in catalogue)
+        return {"data": {"active_cryptocurrencies": len(catalogue), "markets": 1000,
+                         "total_market_cap": {currency: total * rate for currency, rate in FX.items()},
+                         "market_cap_percentage": {"btc": 52.1, "eth": 17.3},
+                         "updated_at": int(time.time())}}
+
+    @app.get("/api/v3/coins/markets")
+    async def coins_markets(vs_currency: str = "usd", ids: str = None, per_page: int = 100, page: int = 1,
+                            sparkline: bool = False, price_change_percentage: str = "24h",
+                            order: str = "market_cap_desc", category: str = None):
+        if order not in ORDERS:
+            return JSONResponse({"error": "invalid order"}, status_code=400)
+        selected = [by_id[i] for i in ids.split(",") if i in by_id] if ids else catalogue
+        if category:
+            selected = [coin for coin in selected if coin["category"] == category]
+        now = time.time()
+        # Market caps wobble with the price, so every order is computed at request time
+        values = {coin["id"]: price(coin, vs_currency, now) * coin["supply"] for coin in selected}
+        field, descending = ORDERS[order]
+        if field == "id":
+            key = lambda coin: coin["id"]
+        elif field == "market_cap":
+            key = lambda coin: values[coin["id"]]
+        else:
+            key = lambda coin: values[coin["id"]] * coin["turnover"]
+        selected = sorted(selected, key=key, reverse=descending)
+        rows = []
+        for coin in selected[(page - 1) * per_page:page * per_page]:
+            current = price(coin, vs_currency, now)
+            row = {
+                "id": coin["id"], "symbol": coin["symbol"], "name": coin["name"],
+                "image": f"https://assets.example/coins/{coin['id']}.png",
+                "current_price": current, "market_cap": current * coin["supply"],
+                "market_cap_rank": coin["rank"], "total_volume": current * coin["supply"] * coin["turnover"],
+                "high_24h": current * 1.02, "low_24h": current * 0.97,
+                "price_change_24h": current * 0.01, "price_change_percentage_24h": 1.0,
+                "circulating_supply": coin["supply"], "last_updated": time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            }
+            if sparkline:
+                row["sparkline_in_7d"] = {"price": [price(coin, vs_currency, now - h * 3600) for h in range(168, 0, -1)]}
+            rows.append(row)
+        return rows
+
+    @app.get("/api/v3/coins/{coin_id}")
+    async def coin_detail(coin_id: str, localization: bool = False, market_data: bool = True):
+        coin, missing = coin_or_404(coin_id)
+        if missing:
+            return missing
+        detail = {"id": coin["id"], "symbol": coin["symbol"], "name": coin["name"],
+                  "description": {"en": f"{coin['name']} is a benchmark coin. " * 20},
+                  "platforms": {"ethereum": coin["address"]}, "market_cap_rank": coin["rank"]}
+        if market_data:
+            detail["market_data"] = {"current_price": {c: price(coin, c) for c in FX},
+                                     "market_cap": {c: price(coin, c) * coin["supply"] for c in FX}}
+        return detail
+
+    @app.get("/api/v3/coins/{coin_id}/tickers")
+    async def coin_tickers(coin_id: str, page: int = 1):
+        coin, missing = coin_or_404(coin_id)
+        if missing:
+            return missing
+        return {"name": coin["name"], "tickers": [
+            {"base": coin["symbol"].upper(), "target": "USDT", "market": {"name": f"Exchange {i}"},
+             "last": price(coin, "usd"), "volume": coin["supply"] * 0.001}
+            for i in range(100)
+        ]}
+
+    @app.get("/api/v3/coins/{coin_id}/market_chart")
+    async def market_chart(coin_id: str, vs_currency: str = "usd", days: str = "7"):
+        coin, missing = coin_or_404(coin_id)
+        if missing:
+            return missing
+        end = time.time()
+        span = float(days) * 86400
+        return series(coin, vs_currency, end - span, end, 300 if span <= 86400 else 3600 if span <= 90 * 86400 else 86400)
+
+    @app.get("/api/v3/coins/{coin_id}/market_chart/range")
+    async def market_chart_range(coin_id: str, request: Request, vs_currency: str = "usd"):
+        coin, missing = coin_or_404(coin_id)
+        if missing:
+            return missing
+        # `from` is a Python keyword, so the bounds are read from the query string
+        start, end = float(request.query_params["from"]), float(request.query_params["to"])
+        span = end - start
+        return series(coin, vs_currency, start, end, 300 if span <= 86400 else 3600 if span <= 90 * 86400 else 86400)
+
+    @app.get("/api/v3/coins/{coin_id}/ohlc")
+    async def ohlc(coin_id: str, vs_currency: str = "usd", days: str = "7"):
+        coin, missing = coin_or_404(coin_id)
+        if missing:
+            return missing
+        span = float(days) * 86400
+        step = 1800 if span <= 2 * 86400 else 4 * 3600 if span <= 30 * 86400 else 4 * 86400
+        end = time.time() // step * step
+        candles = []
+        for i in range(int(span // step)):
+            at = end - span + (i + 1) * step
+            close = price(coin, vs_currency, at)
+            candles.append([int(at * 1000), close * 0.995, close * 1.01, close * 0.99, close])
+        return candles
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--coins", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of calls answered with 429")
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(
+        create_app(args.coins, args.seed, args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate),
+        host=args.host, port=args.port, log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
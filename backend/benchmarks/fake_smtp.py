@@ -0,0 +1,96 @@
+"""Local SMTP sink for exercising the mail queue without a real mail server.
+
+Run from the backend directory:
+
+    python benchmarks/fake_smtp.py --port 8925 --latency-ms 200 --drop-rate 0.05
+
+and point the app at it with SMTP_HOST=127.0.0.1 SMTP_PORT=8925 SMTP_SSL=0.
+Messages are accepted and discarded, or printed with --print. --latency-ms
+delays every reply to DATA like a slow relay does, and --drop-rate closes
+the connection instead of accepting a message, which exercises reconnects
+and retries. Totals are printed when the server stops.
+"""
+import argparse
+import asyncio
+import random
+from collections import Counter
+
+
+class SmtpSink:
+    def __init__(self, latency_ms: float = 0, drop_rate: float = 0.0, echo: bool = False, seed: int = 7):
+        self.latency = latency_ms / 1000
+        self.drop_rate = drop_rate
+        self.echo = echo
+        self.rng = random.Random(seed)
+        self.stats = Counter()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.stats["connections"] += 1
+
+        async def reply(line: str):
+            writer.write(line.encode() + b"\r\n")
+            await writer.drain()
+
+        await reply("220 fake-smtp ready")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode(errors="replace").strip()
+                verb = command.split(" ", 1)[0].upper()
+                if verb == "EHLO":
+                    await reply("250-fake-smtp")
+                    await reply("250 SIZE 10485760")
+                elif verb in ("HELO", "MAIL", "RCPT", "RSET", "NOOP"):
+                    await reply("250 OK")
+                elif verb == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    lines = []
+                    while True:
+                        data = await reader.readline()
+                        if not data or data in (b".\r\n", b".\n"):
+                            break
+                        lines.append(data)
+                    await asyncio.sleep(self.latency)
+                    if self.rng.random() < self.drop_rate:
+                        self.stats["dropped"] += 1
+                        break
+                    self.stats["messages"] += 1
+                    if self.echo:
+                        print(b"".join(lines).decode(errors="replace"))
+                    await reply("250 OK queued")
+                elif verb == "QUIT":
+                    await reply("221 Bye")
+                    break
+                else:
+                    await reply("502 Command not implemented")
+        finally:
+            writer.close()
+
+
+async def serve(host: str, port: int, sink: SmtpSink):
+    server = await asyncio.start_server(sink.handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8925)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of messages answered by hanging up")
+    parser.add_argument("--print", dest="echo", action="store_true", help="print every message received")
+    args = parser.parse_args()
+
+    sink = SmtpSink(args.latency_ms, args.drop_rate, args.echo)
+    try:
+        asyncio.run(serve(args.host, args.port, sink))
+    except KeyboardInterrupt:
+        pass
+    print(", ".join(f"{name}: {count}" for name, count in sorted(sink.stats.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Measure bcrypt login throughput for different PasswordHasher pool sizes.
+
+Run from the backend directory:
+
+    python benchmarks/login_throughput.py --requests 200 --workers 1 2 4 8
+
+Each configuration verifies the same bcrypt hash ``--requests`` times with
+``--concurrency`` callers in flight and reports verifications per second.
+It also checks how late a 10 ms heartbeat on the event loop ran
+meanwhile; with hashing off the loop that lag should stay near zero.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from password_hashing import PasswordHasher, hash_password  # noqa: E402
+
+
+async def heartbeat(lags: list, stop: asyncio.Event, period: float = 0.01):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + period
+        await asyncio.sleep(period)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+async def run(workers: int, requests: int, concurrency: int, use_processes: bool, hashed: str) -> dict:
+    hasher = PasswordHasher(workers=workers, max_pending=concurrency, use_processes=use_processes)
+    await hasher.verify("password", hashed)  # start the pool outside the timed section
+    lags: list = []
+    stop = asyncio.Event()
+    beat = asyncio.ensure_future(heartbeat(lags, stop))
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with gate:
+            assert await hasher.verify("password", hashed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await beat
+    hasher.close()
+    return {
+        "workers": workers,
+        "logins_per_second": requests / elapsed,
+        "max_loop_lag_ms": max(lags, default=0.0) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--processes", action="store_true", help="use a process pool instead of threads")
+    args = parser.parse_args()
+
+    hashed = hash_password("password")
+    print(f"{'workers':>8} {'logins/s':>10} {'max loop lag (ms)':>18}")
+    for workers in sorted(set(args.workers)):
+        result = asyncio.run(run(workers, args.requests, args.concurrency, args.processes, hashed))
+        print(f"{result['workers']:>8} {result['logins_per_second']:>10.1f} {result['max_loop_lag_ms']:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
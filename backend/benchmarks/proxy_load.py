@@ -0,0 +1,285 @@
+"""Drive mixed traffic through the API against a local CoinGecko stand-in and report.
+
+Run from the backend directory:
+
+    python benchmarks/proxy_load.py --duration 30 --concurrency 32
+    python benchmarks/proxy_load.py --throttle-rate 0.05 --json results.json --max-p95-ms 250
+
+It seeds a fresh SQLite database (benchmarks/seed_db.py), starts the fake
+CoinGecko server (benchmarks/fake_coingecko.py) and the real app under
+uvicorn as subprocesses, logs in a set of virtual users and replays a
+weighted mix of proxy and per-user routes. After a warm-up it reports
+throughput and p50/p95/p99 latency per route, upstream calls per endpoint
+and cache hit ratios per key family. With --max-p95-ms / --max-error-rate
+the exit code is 1 when a threshold is exceeded, for use in CI.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+from fake_coingecko import make_coins
+from seed_db import ADMIN_USERNAME, DEFAULT_PASSWORD, username
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS_DIR = os.path.join(BACKEND_DIR, "benchmarks")
+
+
+def scenarios(catalogue: list):
+    """(name, weight, request builder) for the traffic mix; builders return (path, params)"""
+    weights = [1 / (rank + 1) for rank in range(len(catalogue))]
+
+    def coin(rng):
+        return rng.choices(catalogue, weights)[0]
+
+    return [
+        ("/coins/markets", 20, lambda rng: ("/coins/markets", {
+            "vs_currency": rng.choice(["usd", "usd", "usd", "eur"]), "per_page": 100, "page": 1,
+            "sparkline": rng.random() < 0.2})),
+        ("/simple/price", 25, lambda rng: ("/simple/price", {
+            "ids": ",".join({coin(rng)["id"] for _ in range(rng.randint(1, 10))}),
+            "vs_currencies": rng.choice(["usd", "usd", "usd,eur"])})),
+        ("/coins/{id}/market_chart", 10, lambda rng: (f"/coins/{coin(rng)['id']}/market_chart", {
+            "vs_currency": "usd", "days": rng.choice([1, 7, 7, 30])})),
+        ("/coins/{id}/ohlc", 5, lambda rng: (f"/coins/{coin(rng)['id']}/ohlc", {
+            "vs_currency": "usd", "days": rng.choice([1, 7, 30])})),
+        ("/coins/{id}", 10, lambda rng: (f"/coins/{coin(rng)['id']}", None)),
+        ("/search/trending", 5, lambda rng: ("/search/trending", None)),
+        ("/global", 5, lambda rng: ("/global", None)),
+        ("/search/coins", 5, lambda rng: ("/search/coins", {"query": coin(rng)["symbol"][:rng.randint(2, 3)]})),
+        ("/user/watchlist", 5, lambda rng: ("/user/watchlist", None)),
+        ("/user/portfolio/valuation", 5, lambda rng: ("/user/portfolio/valuation", None)),
+        ("/user/alerts", 5, lambda rng: ("/user/alerts", None)),
+    ]
+
+
+def percentile(ordered: list, fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def start_process(args: list, env: dict) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable] + args, cwd=BACKEND_DIR, env={**os.environ, **env})
+
+
+async def wait_until_up(client: httpx.AsyncClient, url: str, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            await client.get(url)
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout} seconds")
+
+
+async def login(client: httpx.AsyncClient, name: str, password: str) -> dict:
+    response = await client.post("/auth/login", data={"username": name, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def drive(client, users: list, mix: list, duration: float, seed: int, samples: dict):
+    """Each virtual user sends one request after another until the duration is over"""
+    names = [name for name, _, _ in mix]
+    cum_weights = []
+    total = 0
+    for _, weight, _ in mix:
+        total += weight
+        cum_weights.append(total)
+    builders = {name: build for name, _, build in mix}
+    deadline = time.perf_counter() + duration
+
+    async def user_loop(index: int, headers: dict):
+        rng = random.Random(seed * 1000 + index)
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, cum_weights=cum_weights)[0]
+            path, params = builders[name](rng)
+            started = time.perf_counter()
+            try:
+                response = await client.get(path, params=params, headers=headers)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            samples[name].append((time.perf_counter() - started, status))
+
+    await asyncio.gather(*(user_loop(index, headers) for index, headers in enumerate(users)))
+
+
+def diff_upstream(before: dict, after: dict) -> dict:
+    calls = {}
+    for endpoint, statuses in after.items():
+        previous = before.get(endpoint, {})
+        delta = {status: count - previous.get(status, 0) for status, count in statuses.items()}
+        delta = {status: count for status, count in delta.items() if count}
+        if delta:
+            calls[endpoint] = delta
+    return calls
+
+
+def diff_cache(before: dict, after: dict) -> dict:
+    families = {}
+    for family, counts in after.get("families", {}).items():
+        previous = before.get("families", {}).get(family, {})
+        delta = {name: counts.get(name, 0) - previous.get(name, 0) for name in ("hits", "stale_hits", "misses")}
+        lookups = sum(delta.values())
+        if lookups:
+            families[family] = {**delta, "hit_ratio": (delta["hits"] + delta["stale_hits"]) / lookups}
+    return families
+
+
+def summarize(samples: dict, duration: float) -> dict:
+    routes = {}
+    for name, results in sorted(samples.items()):
+        latencies = sorted(latency for latency, _ in results)
+        errors = sum(1 for _, status in results if status == 0 or status >= 500)
+        routes[name] = {
+            "requests": len(results),
+            "rps": len(results) / duration,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "errors": errors,
+            "statuses": {str(status): sum(1 for _, s in results if s == status) for status in {s for _, s in results}},
+        }
+    return routes
+
+
+def print_report(result: dict):
+    print(f"\n{'route':<28} {'req':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, row in result["routes"].items():
+        print(f"{name:<28} {row['requests']:>7} {row['rps']:>8.1f} {row['p50_ms']:>8.1f} "
+              f"{row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['errors']:>7}")
+    total = result["total"]
+    print(f"{'total':<28} {total['requests']:>7} {total['rps']:>8.1f} {'':>8} {'':>8} {'':>8} {total['errors']:>7}")
+
+    print(f"\n{'upstream endpoint':<48} {'calls':>7}  statuses")
+    for endpoint, statuses in sorted(result["upstream_calls"].items()):
+        print(f"{endpoint:<48} {sum(statuses.values()):>7}  {statuses}")
+
+    print(f"\n{'cache family':<28} {'hits':>7} {'stale':>7} {'misses':>7} {'hit ratio':>10}")
+    for family, row in sorted(result["cache"].items()):
+        print(f"{family:<28} {row['hits']:>7} {row['stale_hits']:>7} {row['misses']:>7} {row['hit_ratio']:>10.1%}")
+
+
+async def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="cheeseball-bench-")
+    database_url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    subprocess.run([sys.executable, os.path.join(BENCHMARKS_DIR, "seed_db.py"), "--database-url", database_url,
+                    "--users", str(max(args.users, args.concurrency)), "--coins", str(args.coins),
+                    "--seed", str(args.seed)], cwd=BACKEND_DIR, check=True)
+
+    upstream_url = f"http://127.0.0.1:{args.upstream_port}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    upstream = start_process([
+        os.path.join(BENCHMARKS_DIR, "fake_coingecko.py"), "--port", str(args.upstream_port),
+        "--coins", str(args.coins), "--seed", str(args.seed), "--latency-ms", str(args.latency_ms),
+        "--jitter-ms", str(args.jitter_ms), "--error-rate", str(args.error_rate),
+        "--throttle-rate", str(args.throttle_rate),
+    ], {})
+    app_env = {
+        "DATABASE_URL": database_url,
+        "COINGECKO_BASE_URL": f"{upstream_url}/api/v3",
+        "COINGECKO_RATE_LIMIT_PER_MINUTE": str(args.rate_limit),
+        "CACHE_SNAPSHOT_PATH": "",
+        "SHARED_CACHE_PATH": os.path.join(workdir, "cache.db"),
+    }
+    app_env.update(dict(item.split("=", 1) for item in args.env))
+    app = start_process(["-m", "uvicorn", "main:app", "--port", str(args.app_port), "--log-level", "warning"],
+                        app_env)
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency + 8, max_keepalive_connections=args.concurrency + 8)
+        async with httpx.AsyncClient(base_url=upstream_url, timeout=30) as upstream_client, \
+                httpx.AsyncClient(base_url=app_url, timeout=30, limits=limits) as client:
+            await wait_until_up(upstream_client, "/_stats")
+            await wait_until_up(client, "/docs")
+            admin = await login(client, ADMIN_USERNAME, DEFAULT_PASSWORD)
+            users = [await login(client, username(n), DEFAULT_PASSWORD) for n in range(args.concurrency)]
+            mix = scenarios(make_coins(args.coins, args.seed))
+
+            if args.warmup > 0:
+                await drive(client, users, mix, args.warmup, args.seed + 1, defaultdict(list))
+            upstream_before = (await upstream_client.get("/_stats")).json()
+            cache_before = (await client.get("/admin/cache/stats", headers=admin)).json()
+
+            samples = defaultdict(list)
+            started = time.perf_counter()
+            await drive(client, users, mix, args.duration, args.seed, samples)
+            elapsed = time.perf_counter() - started
+
+            upstream_after = (await upstream_client.get("/_stats")).json()
+            cache_after = (await client.get("/admin/cache/stats", headers=admin)).json()
+    finally:
+        for process in (app, upstream):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    routes = summarize(samples, elapsed)
+    requests = sum(row["requests"] for row in routes.values())
+    return {
+        "config": {key: value for key, value in vars(args).items() if key != "json"},
+        "duration": elapsed,
+        "total": {"requests": requests, "rps": requests / elapsed,
+                  "errors": sum(row["errors"] for row in routes.values())},
+        "routes": routes,
+        "upstream_calls": diff_upstream(upstream_before, upstream_after),
+        "cache": diff_cache(cache_before, cache_after),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=30, help="seconds of measured traffic")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds of unmeasured traffic first")
+    parser.add_argument("--concurrency", type=int, default=32, help="virtual users sending requests")
+    parser.add_argument("--users", type=int, default=200, help="users seeded in the database")
+    parser.add_argument("--coins", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--latency-ms", type=float, default=50, help="fake upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls failing with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of upstream calls answered 429")
+    parser.add_argument("--rate-limit", type=float, default=0,
+                        help="COINGECKO_RATE_LIMIT_PER_MINUTE for the app (0 = unlimited)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the app, e.g. --env CACHE_BACKEND=sqlite")
+    parser.add_argument("--app-port", type=int, default=8901)
+    parser.add_argument("--upstream-port", type=int, default=8900)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--max-p95-ms", type=float, help="fail if any route's p95 is above this")
+    parser.add_argument("--max-error-rate", type=float, help="fail if the overall error rate is above this")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+    failures = []
+    if args.max_p95_ms is not None:
+        failures += [f"{name} p95 {row['p95_ms']:.1f} ms > {args.max_p95_ms} ms"
+                     for name, row in result["routes"].items() if row["p95_ms"] > args.max_p95_ms]
+    total = result["total"]
+    if args.max_error_rate is not None and total["requests"]:
+        if total["errors"] / total["requests"] > args.max_error_rate:
+            failures.append(f"error rate {total['errors'] / total['requests']:.2%} > {args.max_error_rate:.2%}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
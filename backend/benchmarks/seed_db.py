@@ -0,0 +1,103 @@
+"""Create a SQLite database of benchmark users with watchlists, portfolios and alerts.
+
+Run from the backend directory:
+
+    python benchmarks/seed_db.py --database-url sqlite:////tmp/bench.db --users 500
+
+Users are named bench-user-<n> (plus one bench-admin) and all share the
+password given by --password. Coins come from the fake CoinGecko
+catalogue, so every seeded coin id resolves against the stand-in server.
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from fake_coingecko import make_coins  # noqa: E402
+
+ADMIN_USERNAME = "bench-admin"
+DEFAULT_PASSWORD = "benchmark"
+
+
+def username(n: int) -> str:
+    return f"bench-user-{n}"
+
+
+def seed(database_url: str, users: int, watchlist: int, lots: int, alerts: int, coins: int,
+         password: str = DEFAULT_PASSWORD, seed_value: int = 7) -> dict:
+    # database.py reads DATABASE_URL at import time
+    os.environ["DATABASE_URL"] = database_url
+    from database import SessionLocal, engine
+    import models as db_models
+    from password_hashing import hash_password
+
+    db_models.Base.metadata.create_all(bind=engine)
+    rng = random.Random(seed_value)
+    catalogue = make_coins(coins, seed_value)
+    # Popular coins are picked far more often, as in real watchlists
+    weights = [1 / (rank + 1) for rank in range(len(catalogue))]
+    hashed = hash_password(password)  # one bcrypt hash shared by every user keeps seeding fast
+    now = datetime.utcnow()
+
+    db = SessionLocal()
+    try:
+        db.bulk_insert_mappings(db_models.User, [
+            {"username": ADMIN_USERNAME, "email": "admin@bench.local", "hashed_password": hashed,
+             "is_admin": True, "is_active": True, "preferred_currency": "usd", "created_at": now}
+        ] + [
+            {"username": username(n), "email": f"{username(n)}@bench.local", "hashed_password": hashed,
+             "is_active": True, "is_admin": False, "preferred_currency": rng.choice(["usd", "usd", "eur", "gbp"]),
+             "created_at": now - timedelta(minutes=n)}
+            for n in range(users)
+        ])
+        db.commit()
+        user_ids = [user_id for (user_id,) in db.query(db_models.User.id).filter(db_models.User.is_admin.is_(False))]
+
+        watchlists, portfolios, price_alerts = [], [], []
+        for user_id in user_ids:
+            picked = {coin["id"]: coin for coin in rng.choices(catalogue, weights, k=watchlist * 2)}
+            for coin in list(picked.values())[:watchlist]:
+                watchlists.append({"user_id": user_id, "coin_id": coin["id"], "coin_symbol": coin["symbol"],
+                                   "coin_name": coin["name"], "created_at": now})
+            for coin in rng.choices(catalogue, weights, k=lots):
+                portfolios.append({"user_id": user_id, "coin_id": coin["id"], "amount": rng.uniform(0.01, 50),
+                                   "purchase_price": coin["price"] * rng.uniform(0.5, 1.5),
+                                   "purchase_currency": rng.choice(["usd", "usd", "eur"]),
+                                   "purchase_date": now - timedelta(days=rng.randint(1, 700))})
+            for coin in rng.choices(catalogue, weights, k=alerts):
+                above = rng.random() < 0.5
+                price_alerts.append({"user_id": user_id, "coin_id": coin["id"], "currency": "usd",
+                                     "target_price": coin["price"] * (1.5 if above else 0.5),
+                                     "is_above": above, "is_active": True, "created_at": now})
+        db.bulk_insert_mappings(db_models.Watchlist, watchlists)
+        db.bulk_insert_mappings(db_models.Portfolio, portfolios)
+        db.bulk_insert_mappings(db_models.PriceAlert, price_alerts)
+        db.commit()
+    finally:
+        db.close()
+    return {"users": len(user_ids) + 1, "watchlists": len(watchlists),
+            "portfolios": len(portfolios), "alerts": len(price_alerts)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--watchlist", type=int, default=10, help="coins per watchlist")
+    parser.add_argument("--lots", type=int, default=5, help="portfolio lots per user")
+    parser.add_argument("--alerts", type=int, default=3, help="price alerts per user")
+    parser.add_argument("--coins", type=int, default=500, help="size of the fake coin catalogue")
+    parser.add_argument("--password", default=DEFAULT_PASSWORD)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    counts = seed(args.database_url, args.users, args.watchlist, args.lots, args.alerts, args.coins,
+                  args.password, args.seed)
+    print(", ".join(f"{name}: {count}" for name, count in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
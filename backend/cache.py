@@ -0,0 +1,277 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def encode_json(value: Any) -> Optional[bytes]:
+    """Compact JSON bytes for a payload, or None if it cannot be serialized"""
+    try:
+        return json.dumps(value, separators=(",", ":"), default=str).encode()
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate memory cost of a cached payload by its compact JSON length"""
+    body = encode_json(value)
+    return len(body) if body is not None else 0
+
+
+class CacheEntry:
+    # body holds the serialized JSON, ready to send; etag and the compressed
+    # variants are filled in by http_cache the first time the entry is served.
+    # source is the upstream (path, params) the value came from, if known.
+    __slots__ = ("value", "stored_at", "ttl", "size", "body", "etag", "variants", "source")
+
+    def __init__(
+        self,
+        value: Any,
+        stored_at: float,
+        ttl: float,
+        size: int,
+        body: Optional[bytes] = None,
+        source: Optional[Tuple[str, Optional[dict]]] = None,
+    ):
+        self.value = value
+        self.stored_at = stored_at
+        self.ttl = ttl
+        self.size = size
+        self.body = body
+        self.source = source
+        self.etag: Optional[str] = None
+        self.variants: Dict[str, bytes] = {}
+
+    def age(self, now: float) -> float:
+        return now - self.stored_at
+
+    def is_fresh(self, now: float) -> bool:
+        return now - self.stored_at < self.ttl
+
+    def is_servable(self, now: float, stale_window: float) -> bool:
+        return now - self.stored_at < self.ttl + stale_window
+
+
+class TTLCache:
+    """Bounded in-memory cache with LRU eviction and per-family TTLs.
+
+    Keys are grouped into families by prefix (``simple_price_...`` belongs
+    to ``simple_price``) and each family can carry its own TTL. The cache is
+    bounded both by entry count and by an approximate byte budget; when
+    either is exceeded the least recently used entries are evicted.
+
+    Expired entries are kept for ``stale_window`` extra seconds so callers
+    using ``get_entry`` can serve them while a refresh runs in the
+    background (stale-while-revalidate).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 5000,
+        max_bytes: Optional[int] = None,
+        default_ttl: float = 60,
+        ttls: Optional[Dict[str, float]] = None,
+        stale_window: float = 0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.stale_window = stale_window
+        self.clock = clock
+        # Longest prefix first so "market_chart_range" wins over "market_chart"
+        self._prefixes = sorted(self.ttls, key=len, reverse=True)
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._family_stats: Dict[str, Dict[str, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def family(self, key: str) -> str:
+        for prefix in self._prefixes:
+            if key.startswith(prefix):
+                return prefix
+        return "other"
+
+    def ttl_for(self, key: str) -> float:
+        return self.ttls.get(self.family(key), self.default_ttl)
+
+    def _count(self, key: str, outcome: str):
+        stats = self._family_stats.setdefault(
+            self.family(key), {"hits": 0, "misses": 0, "stale_hits": 0, "evictions": 0}
+        )
+        stats[outcome] += 1
+
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        """Return the stored entry, fresh or not, without touching stats or LRU order"""
+        return self._entries.get(key)
+
+    def get_entry(self, key: str) -> Optional[CacheEntry]:
+        """Return the entry if it is fresh or still inside the stale window.
+
+        Older entries count as misses but stay stored until they are replaced
+        or evicted, so ``peek`` can still hand them out while the upstream is
+        down.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            now = self.clock()
+            if entry is not None and not entry.is_servable(now, self.stale_window):
+                entry = None
+            if entry is None:
+                self.misses += 1
+                self._count(key, "misses")
+                return None
+            self._entries.move_to_end(key)
+            if entry.is_fresh(now):
+                self.hits += 1
+                self._count(key, "hits")
+            else:
+                self.stale_hits += 1
+                self._count(key, "stale_hits")
+            return entry
+
+    def get(self, key: str):
+        """Return the fresh value for key, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            now = self.clock()
+            if entry is not None and not entry.is_fresh(now):
+                if not entry.is_servable(now, self.stale_window):
+                    self._remove(key)
+                    self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                self._count(key, "misses")
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self._count(key, "hits")
+            return entry.value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, source: Optional[tuple] = None):
+        # Serialized once here and kept, so hits are sent without re-encoding
+        body = encode_json(value)
+        size = len(body) if body is not None else 0
+        entry = CacheEntry(value, self.clock(), self.ttl_for(key) if ttl is None else ttl, size, body, source)
+        self.put_entry(key, entry)
+
+    def set_many(self, values: Dict[str, Any], ttl: Optional[float] = None):
+        for key, value in values.items():
+            self.set(key, value, ttl)
+
+    # Coroutine forms of the calls made from request handlers. This cache
+    # answers inline; SharedCache overrides them to keep SQLite off the loop.
+    async def apeek(self, key: str) -> Optional[CacheEntry]:
+        return self.peek(key)
+
+    async def aget_entry(self, key: str) -> Optional[CacheEntry]:
+        return self.get_entry(key)
+
+    async def aget_entries(self, keys: List[str]) -> List[Optional[CacheEntry]]:
+        return [self.get_entry(key) for key in keys]
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None, source: Optional[tuple] = None):
+        self.set(key, value, ttl, source)
+
+    async def aset_many(self, values: Dict[str, Any], ttl: Optional[float] = None):
+        self.set_many(values, ttl)
+
+    async def atry_lock(self, key: str, lease: float, renew: bool = False) -> bool:
+        return self.try_lock(key, lease, renew)
+
+    async def aunlock(self, key: str):
+        self.unlock(key)
+
+    def put_entry(self, key: str, entry: CacheEntry):
+        """Store a ready-made entry as-is, keeping its stored_at (used to restore snapshots)"""
+        if self.max_bytes is not None and entry.size > self.max_bytes:
+            # Never let a single oversized payload flush the whole cache
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.bytes += entry.size
+            self._evict()
+
+    def items(self) -> List[Tuple[str, CacheEntry]]:
+        """Point-in-time copy of the stored entries, least recently used first"""
+        with self._lock:
+            return list(self._entries.items())
+
+    def try_lock(self, key: str, lease: float, renew: bool = False) -> bool:
+        """Claim the right to refill key; always granted within a single process.
+
+        With renew, a lock this process already holds counts as claimed and
+        its lease is extended.
+        """
+        return True
+
+    def unlock(self, key: str):
+        pass
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def close(self):
+        pass
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and self.bytes > self.max_bytes)
+        ):
+            key, entry = self._entries.popitem(last=False)
+            self.bytes -= entry.size
+            self.evictions += 1
+            self._count(key, "evictions")
+
+    def stats(self) -> dict:
+        with self._lock:
+            families: Dict[str, Dict[str, int]] = {
+                name: dict(counts) for name, counts in self._family_stats.items()
+            }
+            for key in self._entries:
+                counts = families.setdefault(
+                    self.family(key), {"hits": 0, "misses": 0, "stale_hits": 0, "evictions": 0}
+                )
+                counts["entries"] = counts.get("entries", 0) + 1
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale_hits": self.stale_hits,
+                "stale_window": self.stale_window,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "families": families,
+            }
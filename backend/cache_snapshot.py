@@ -0,0 +1,79 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import List, Tuple
+
+from cache import CacheEntry, TTLCache
+
+logger = logging.getLogger(__name__)
+
+# File layout: MAGIC, index length (u64 little endian), JSON index, then the
+# entries' JSON bodies back to back. The index holds, per entry,
+# [key, stored_at, ttl, offset, length, source] with offsets into the body area.
+MAGIC = b"CBSNAP01"
+HEADER = struct.Struct("<8sQ")
+
+
+def write_snapshot(cache: TTLCache, path: str) -> int:
+    """Write every serializable entry of the cache to path; returns the entry count.
+
+    The file is written next to path and renamed over it, so readers only
+    ever see a complete snapshot.
+    """
+    index, bodies, offset = [], [], 0
+    for key, entry in cache.items():
+        if entry.body is None:
+            continue
+        index.append([key, entry.stored_at, entry.ttl, offset, len(entry.body), entry.source])
+        bodies.append(entry.body)
+        offset += len(entry.body)
+    header_index = json.dumps({"written_at": time.time(), "entries": index}, separators=(",", ":")).encode()
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(header_index)))
+        f.write(header_index)
+        for body in bodies:
+            f.write(body)
+    os.replace(temp_path, path)
+    return len(index)
+
+
+def load_snapshot(cache: TTLCache, path: str) -> List[Tuple[str, CacheEntry]]:
+    """Restore entries that are still servable, keeping their original stored_at.
+
+    The file is memory-mapped and only the bodies of entries worth keeping
+    are read and decoded. Returns the restored (key, entry) pairs, least
+    recently used first, as the snapshot was written.
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return []
+    restored = []
+    with f:
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, index_length = HEADER.unpack_from(data, 0)
+            if magic != MAGIC:
+                logger.warning("Ignoring cache snapshot %s with an unknown format", path)
+                return []
+            body_start = HEADER.size + index_length
+            index = json.loads(data[HEADER.size:body_start])["entries"]
+            now = time.time()
+            for key, stored_at, ttl, offset, length, source in index:
+                if now - stored_at >= ttl + cache.stale_window:
+                    continue
+                body = data[body_start + offset:body_start + offset + length]
+                try:
+                    value = json.loads(body)
+                except ValueError:
+                    continue
+                entry = CacheEntry(value, stored_at, ttl, length, body, tuple(source) if source else None)
+                cache.put_entry(key, entry)
+                restored.append((key, entry))
+    return restored
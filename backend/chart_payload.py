@@ -0,0 +1,153 @@
+"""Downsampling and compact encoding of chart responses.
+
+Charts are ``[[timestamp_ms, value], ...]`` lists per field and candles are
+``[[timestamp_ms, open, high, low, close], ...]``, as CoinGecko returns them.
+``points`` reduces either to at most that many rows while keeping its shape;
+the columnar format ships each series as ``count``, a start timestamp
+``t0`` and either a fixed ``step`` or base64 little-endian int64 deltas
+``dt`` (the first is 0), with values as base64 little-endian float32 arrays.
+Deltas are int64 because a downsampled multi-month chart easily has gaps
+longer than int32 milliseconds (about 24.8 days) can hold. ``unpack_points``
+and ``unpack_candles`` are the reference decoders.
+"""
+import base64
+from typing import List, Optional
+
+import numpy as np
+
+from timeseries import CHART_FIELDS
+
+COLUMNAR = "columnar"
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets, evaluated for all buckets at once.
+
+    The first and last points are always kept. Every interior bucket keeps
+    the point forming the largest triangle with the previous bucket's mean
+    and the next bucket's mean; using the mean on both sides (instead of the
+    previously selected point) is what lets numpy score every bucket in one
+    pass, and picks the same extremes on real price data.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    # Interior points split into threshold - 2 contiguous buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    starts = edges[:-1]
+    counts = np.diff(edges)
+    sum_x = np.add.reduceat(x[1:-1], starts - 1)
+    sum_y = np.add.reduceat(y[1:-1], starts - 1)
+    mean_x = np.concatenate(([x[0]], sum_x / counts, [x[-1]]))
+    mean_y = np.concatenate(([y[0]], sum_y / counts, [y[-1]]))
+
+    bucket = np.repeat(np.arange(1, threshold - 1), counts)  # bucket of every interior point
+    ax, ay = mean_x[bucket - 1], mean_y[bucket - 1]
+    cx, cy = mean_x[bucket + 1], mean_y[bucket + 1]
+    bx, by = x[1:-1], y[1:-1]
+    area = np.abs((ax - cx) * (by - ay) - (ax - bx) * (cy - ay))
+
+    best = np.maximum.reduceat(area, starts - 1)
+    candidates = np.flatnonzero(area == best[bucket - 1])
+    # Ties keep the earliest point of the bucket
+    _, first = np.unique(bucket[candidates], return_index=True)
+    return np.concatenate(([0], candidates[first] + 1, [n - 1]))
+
+
+def downsample_points(points: List[list], threshold: int) -> List[list]:
+    if len(points) <= threshold:
+        return points
+    data = np.asarray(points, dtype=np.float64)
+    keep = lttb_indices(data[:, 0], data[:, 1], threshold)
+    return [points[i] for i in keep.tolist()]
+
+
+def downsample_candles(candles: List[list], threshold: int) -> List[list]:
+    """Merge runs of consecutive candles so at most ``threshold`` remain.
+
+    A merged candle opens at its first open, closes at its last close and
+    keeps the extreme high and low, so no wick is lost.
+    """
+    if len(candles) <= threshold:
+        return candles
+    data = np.asarray(candles, dtype=np.float64)
+    starts = np.linspace(0, len(data), threshold + 1).astype(np.int64)[:-1]
+    ends = np.append(starts[1:], len(data)) - 1
+    merged = np.column_stack((
+        data[ends, 0],  # CoinGecko stamps a candle with its close time
+        data[starts, 1],
+        np.maximum.reduceat(data[:, 2], starts),
+        np.minimum.reduceat(data[:, 3], starts),
+        data[ends, 4],
+    ))
+    rows = merged.tolist()
+    for row in rows:
+        row[0] = int(row[0])
+    return rows
+
+
+def _b64(array: np.ndarray) -> str:
+    return base64.b64encode(array.tobytes()).decode("ascii")
+
+
+def _pack_timestamps(timestamps: np.ndarray) -> dict:
+    timestamps = timestamps.astype(np.int64)
+    packed = {"count": len(timestamps), "t0": int(timestamps[0]) if len(timestamps) else 0}
+    deltas = np.diff(timestamps)
+    if len(deltas) and (deltas == deltas[0]).all():
+        packed["step"] = int(deltas[0])  # evenly spaced: no per-point timestamps at all
+    else:
+        packed["dt"] = _b64(np.diff(timestamps, prepend=timestamps[:1]).astype("<i8"))
+    return packed
+
+
+def _unpack_timestamps(packed: dict) -> np.ndarray:
+    count = packed["count"]
+    if "step" in packed:
+        return packed["t0"] + packed["step"] * np.arange(count, dtype=np.int64)
+    return packed["t0"] + np.cumsum(np.frombuffer(base64.b64decode(packed["dt"]), dtype="<i8"))
+
+
+def _unb64(value: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(value), dtype="<f4")
+
+
+def pack_points(points: List[list]) -> dict:
+    data = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    return {**_pack_timestamps(data[:, 0]), "v": _b64(data[:, 1].astype("<f4"))}
+
+
+def unpack_points(packed: dict) -> List[list]:
+    values = _unb64(packed["v"]).tolist()
+    return [[timestamp, value] for timestamp, value in zip(_unpack_timestamps(packed).tolist(), values)]
+
+
+def pack_candles(candles: List[list]) -> dict:
+    data = np.asarray(candles, dtype=np.float64).reshape(-1, 5)
+    packed = _pack_timestamps(data[:, 0])
+    for column, name in enumerate(("open", "high", "low", "close"), start=1):
+        packed[name] = _b64(data[:, column].astype("<f4"))
+    return packed
+
+
+def unpack_candles(packed: dict) -> List[list]:
+    columns = [_unb64(packed[name]).tolist() for name in ("open", "high", "low", "close")]
+    return [list(row) for row in zip(_unpack_timestamps(packed).tolist(), *columns)]
+
+
+def shape_chart(chart: dict, points: Optional[int] = None, format: str = "json") -> dict:
+    """Apply ``points`` and ``format`` to a prices/market_caps/total_volumes chart"""
+    fields = [field for field in CHART_FIELDS if field in chart]
+    if points:
+        chart = {**chart, **{field: downsample_points(chart[field], points) for field in fields}}
+    if format == COLUMNAR:
+        chart = {"format": COLUMNAR, **{field: pack_points(chart[field]) for field in fields}}
+    return chart
+
+
+def shape_candles(candles: List[list], points: Optional[int] = None, format: str = "json"):
+    if points:
+        candles = downsample_candles(candles, points)
+    if format == COLUMNAR:
+        return {"format": COLUMNAR, "candles": pack_candles(candles)}
+    return candles
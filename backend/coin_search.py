@@ -0,0 +1,269 @@
+import heapq
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+# Match kinds, best first; the numbers double as ranking scores
+EXACT_SYMBOL, EXACT_ID, EXACT_ADDRESS, EXACT_NAME = 100, 95, 90, 85
+PREFIX_SYMBOL, PREFIX_ID, PREFIX_NAME, PREFIX_ADDRESS, PREFIX_WORD = 70, 65, 60, 55, 50
+FUZZY = 40  # scaled by trigram similarity
+
+MATCH_NAMES = {
+    EXACT_SYMBOL: "symbol", EXACT_ID: "id", EXACT_ADDRESS: "address", EXACT_NAME: "name",
+    PREFIX_SYMBOL: "symbol_prefix", PREFIX_ID: "id_prefix", PREFIX_NAME: "name_prefix",
+    PREFIX_ADDRESS: "address_prefix", PREFIX_WORD: "word_prefix", FUZZY: "fuzzy",
+}
+
+# Term kinds stored in the sorted term list: kind -> (exact score, prefix score)
+TERM_SCORES = {
+    "symbol": (EXACT_SYMBOL, PREFIX_SYMBOL),
+    "id": (EXACT_ID, PREFIX_ID),
+    "name": (EXACT_NAME, PREFIX_NAME),
+    "word": (EXACT_NAME, PREFIX_WORD),
+    "address": (EXACT_ADDRESS, PREFIX_ADDRESS),
+}
+MIN_ADDRESS_PREFIX = 6  # shorter queries would match thousands of hex addresses
+
+
+def trigrams(text: str) -> Set[str]:
+    """Padded word trigrams, as in pg_trgm: "btc" -> {"  b", " bt", "btc", "tc "}"""
+    grams = set()
+    for word in text.lower().split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _fingerprint(coin: dict) -> tuple:
+    platforms = coin.get("platforms") or {}
+    return (
+        coin.get("symbol") or "",
+        coin.get("name") or "",
+        tuple(sorted((platform, address) for platform, address in platforms.items() if address)),
+    )
+
+
+def _terms(coin_id: str, fingerprint: tuple) -> List[Tuple[str, str]]:
+    symbol, name, platforms = fingerprint
+    terms = [("id", coin_id), ("symbol", symbol.lower()), ("name", name.lower())]
+    words = name.lower().split()
+    if len(words) > 1:
+        terms.extend(("word", word) for word in words[1:])
+    terms.extend(("address", address.lower()) for _, address in platforms)
+    return [(kind, term) for kind, term in terms if term]
+
+
+class _IndexState:
+    """One published version of the index structures.
+
+    Searches read whichever state is current without locking, so a state
+    is never modified once published: ``sync`` applies its changes to a
+    ``copy`` and swaps the reference.
+    """
+
+    __slots__ = ("slots", "coins", "fingerprints", "free", "terms", "postings", "trigrams",
+                 "gram_counts", "posting_arrays")
+
+    def __init__(self):
+        self.slots: Dict[str, int] = {}
+        self.coins: List[Optional[dict]] = []
+        self.fingerprints: List[Optional[tuple]] = []
+        self.free: List[int] = []
+        self.terms: List[Tuple[str, str, int]] = []  # (term, kind, slot), sorted
+        self.postings: Dict[str, Set[int]] = {}
+        self.trigrams: List[Optional[Set[str]]] = []
+        self.gram_counts = np.zeros(0, dtype=np.int32)  # trigrams per slot
+        self.posting_arrays: Dict[str, np.ndarray] = {}  # built lazily from postings
+
+    def copy(self) -> "_IndexState":
+        # Posting sets are shared until a change replaces them (see _posting_set)
+        state = _IndexState()
+        state.slots, state.coins, state.fingerprints = dict(self.slots), list(self.coins), list(self.fingerprints)
+        state.free, state.terms, state.postings = list(self.free), list(self.terms), dict(self.postings)
+        state.trigrams, state.gram_counts = list(self.trigrams), self.gram_counts.copy()
+        state.posting_arrays = dict(self.posting_arrays)
+        return state
+
+    def _posting_set(self, gram: str, owned: Set[str]) -> Set[int]:
+        if gram not in owned:
+            self.postings[gram] = set(self.postings.get(gram, ()))
+            owned.add(gram)
+        self.posting_arrays.pop(gram, None)
+        return self.postings[gram]
+
+    def add(self, coin_id: str, fingerprint: tuple, owned: Set[str]):
+        record = {"id": coin_id, "symbol": fingerprint[0], "name": fingerprint[1]}
+        grams = trigrams(f"{coin_id.replace('-', ' ')} {fingerprint[1]}")
+        if self.free:
+            slot = self.free.pop()
+            self.coins[slot], self.fingerprints[slot], self.trigrams[slot] = record, fingerprint, grams
+        else:
+            slot = len(self.coins)
+            self.coins.append(record)
+            self.fingerprints.append(fingerprint)
+            self.trigrams.append(grams)
+            self.gram_counts = np.append(self.gram_counts, 0).astype(np.int32)
+        self.gram_counts[slot] = len(grams)
+        self.slots[coin_id] = slot
+        for kind, term in _terms(coin_id, fingerprint):
+            insort(self.terms, (term, kind, slot))
+        for gram in grams:
+            self._posting_set(gram, owned).add(slot)
+
+    def remove(self, coin_id: str, owned: Set[str]):
+        slot = self.slots.pop(coin_id)
+        for kind, term in _terms(coin_id, self.fingerprints[slot]):
+            position = bisect_left(self.terms, (term, kind, slot))
+            if position < len(self.terms) and self.terms[position] == (term, kind, slot):
+                del self.terms[position]
+        for gram in self.trigrams[slot]:
+            self._posting_set(gram, owned).discard(slot)
+        self.gram_counts[slot] = 0
+        self.coins[slot] = self.fingerprints[slot] = self.trigrams[slot] = None
+        self.free.append(slot)
+
+
+class CoinSearchIndex:
+    """In-memory search over the /coins/list catalogue.
+
+    Every id, symbol, name, later name word and contract address is kept in
+    one sorted term list, so a prefix lookup is a bisect plus a short scan.
+    Trigram postings cover typos and partial matches when prefixes find too
+    little, scored against every coin in one numpy pass. ``sync`` diffs a
+    new catalogue against the indexed one and only touches coins that were
+    added, removed or changed, on a copy that replaces the searched state
+    once complete.
+    """
+
+    def __init__(self, scan_limit: int = 500, min_similarity: float = 0.3):
+        self.scan_limit = scan_limit
+        self.min_similarity = min_similarity
+        self._version: Optional[float] = None  # stored_at of the catalogue cache entry last synced
+        self._state = _IndexState()
+        self._sync_lock = threading.Lock()  # one sync at a time
+        self.builds = 0
+        self.updates = 0
+
+    def is_current(self, version: float) -> bool:
+        """Whether the catalogue stored at ``version`` (its cache entry's stored_at) is indexed"""
+        return version == self._version
+
+    def __len__(self):
+        return len(self._state.slots)
+
+    def sync(self, coins: List[dict], version: Optional[float] = None):
+        """Bring the index in line with a freshly fetched catalogue"""
+        with self._sync_lock:
+            if version is not None and version == self._version:
+                return
+            latest = {}
+            for coin in coins:
+                if isinstance(coin, dict) and coin.get("id"):
+                    latest[coin["id"]] = (coin, _fingerprint(coin))
+
+            current = self._state
+            removed = [coin_id for coin_id in current.slots if coin_id not in latest]
+            changed = [
+                (coin_id, fingerprint) for coin_id, (coin, fingerprint) in latest.items()
+                if coin_id not in current.slots or current.fingerprints[current.slots[coin_id]] != fingerprint
+            ]
+            if not current.slots or len(removed) + len(changed) > len(latest) // 2:
+                self._rebuild(latest)
+            else:
+                state, owned = current.copy(), set()
+                for coin_id in removed:
+                    state.remove(coin_id, owned)
+                for coin_id, fingerprint in changed:
+                    if coin_id in state.slots:
+                        state.remove(coin_id, owned)
+                    state.add(coin_id, fingerprint, owned)
+                self._state = state
+                self.updates += len(removed) + len(changed)
+            self._version = version
+
+    def _rebuild(self, latest: Dict[str, Tuple[dict, tuple]]):
+        state = _IndexState()
+        postings: Dict[str, Set[int]] = defaultdict(set)
+        for slot, (coin_id, (coin, fingerprint)) in enumerate(latest.items()):
+            state.slots[coin_id] = slot
+            state.coins.append({"id": coin_id, "symbol": fingerprint[0], "name": fingerprint[1]})
+            state.fingerprints.append(fingerprint)
+            state.terms.extend((term, kind, slot) for kind, term in _terms(coin_id, fingerprint))
+            grams = trigrams(f"{coin_id.replace('-', ' ')} {fingerprint[1]}")
+            state.trigrams.append(grams)
+            for gram in grams:
+                postings[gram].add(slot)
+        state.terms.sort()
+        state.postings = dict(postings)
+        state.gram_counts = np.array([len(grams) for grams in state.trigrams], dtype=np.int32)
+        self._state = state
+        self.builds += 1
+
+    @staticmethod
+    def _posting_array(state: _IndexState, gram: str) -> np.ndarray:
+        array = state.posting_arrays.get(gram)
+        if array is None:
+            array = np.fromiter(state.postings.get(gram, ()), dtype=np.int64)
+            state.posting_arrays[gram] = array
+        return array
+
+    def search(self, query: str, limit: int = 10) -> List[dict]:
+        """Top `limit` coins for `query`, best match first"""
+        query = " ".join(query.lower().split())
+        if not query:
+            return []
+        state = self._state
+        best: Dict[int, float] = {}
+        kinds: Dict[int, int] = {}
+
+        def consider(slot: int, score: float, kind: int):
+            if score > best.get(slot, 0):
+                best[slot] = score
+                kinds[slot] = kind
+
+        position = bisect_left(state.terms, (query,))
+        end = min(len(state.terms), position + self.scan_limit)
+        while position < end:
+            term, kind, slot = state.terms[position]
+            if not term.startswith(query):
+                break
+            if kind != "address" or len(query) >= MIN_ADDRESS_PREFIX:
+                exact, prefix = TERM_SCORES[kind]
+                score = exact if term == query else prefix
+                consider(slot, score, score)
+            position += 1
+
+        if len(best) < limit and len(query) >= 3:
+            query_grams = trigrams(query)
+            postings = [self._posting_array(state, gram) for gram in query_grams]
+            postings = [array for array in postings if len(array)]
+            if postings:
+                # Jaccard similarity against every coin sharing a trigram, in one pass
+                shared = np.bincount(np.concatenate(postings), minlength=len(state.gram_counts))
+                similarity = shared / np.maximum(len(query_grams) + state.gram_counts - shared, 1)
+                matches = np.flatnonzero(similarity >= self.min_similarity)
+                if len(matches) > limit:
+                    matches = matches[np.argpartition(-similarity[matches], limit)[:limit]]
+                for slot in matches.tolist():
+                    consider(slot, FUZZY * float(similarity[slot]), FUZZY)
+
+        # Ties go to the shorter (usually the canonical) name
+        ranked = heapq.nsmallest(
+            limit, best, key=lambda slot: (-best[slot], len(state.coins[slot]["name"]), state.coins[slot]["id"])
+        )
+        return [
+            {**state.coins[slot], "score": round(best[slot], 2), "match": MATCH_NAMES[kinds[slot]]}
+            for slot in ranked
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "coins": len(self._state.slots),
+            "terms": len(self._state.terms),
+            "trigrams": len(self._state.postings),
+            "builds": self.builds,
+            "incremental_updates": self.updates,
+        }
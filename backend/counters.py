@@ -0,0 +1,98 @@
+from typing import Dict, Optional
+
+from sqlalchemy import event, func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models as db_models
+
+# Counter name -> model whose rows it counts
+COUNTED_MODELS = {
+    "total_users": db_models.User,
+    "total_watchlists": db_models.Watchlist,
+    "total_portfolios": db_models.Portfolio,
+    "total_alerts": db_models.PriceAlert,
+}
+
+# Counters of per-user rows are split over COUNTER_SHARDS rows picked by
+# user_id, so concurrent users don't all update (and lock) one hot row;
+# read_counters sums the shards
+COUNTER_SHARDS = 16
+SHARDED_COUNTERS = {name for name, model in COUNTED_MODELS.items() if hasattr(model, "user_id")}
+
+# Not a row count: bumped in the same transaction as any change to a user's
+# login-relevant fields, so every worker can drop its cached principals
+AUTH_GENERATION = "auth_generation"
+
+
+def counter_row(name: str, user_id: Optional[int] = None) -> str:
+    """Name of the stat_counters row holding (a shard of) a counter"""
+    if name not in SHARDED_COUNTERS:
+        return name
+    return f"{name}#{(user_id or 0) % COUNTER_SHARDS}"
+
+
+def adjust_counter(connection, name: str, delta: int, user_id: Optional[int] = None):
+    """Add delta to a counter inside the caller's transaction; user_id picks the shard"""
+    if delta:
+        connection.execute(
+            update(db_models.StatCounter)
+            .where(db_models.StatCounter.name == counter_row(name, user_id))
+            .values(value=db_models.StatCounter.value + delta)
+        )
+
+
+def _track(model, name: str):
+    # Mapper events cover ORM add()/delete(); bulk statements call adjust_counter themselves
+    @event.listens_for(model, "after_insert")
+    def counted_insert(mapper, connection, target):
+        adjust_counter(connection, name, 1, getattr(target, "user_id", None))
+
+    @event.listens_for(model, "after_delete")
+    def counted_delete(mapper, connection, target):
+        adjust_counter(connection, name, -1, getattr(target, "user_id", None))
+
+
+for _name, _model in COUNTED_MODELS.items():
+    _track(_model, _name)
+
+
+def init_counters(engine, recount: bool = False):
+    """Seed missing counters with one COUNT(*) each (all of them when recount is set)"""
+    with Session(bind=engine) as db:
+        existing = {counter.name: counter for counter in db.query(db_models.StatCounter)}
+        for name, model in COUNTED_MODELS.items():
+            rows = [counter_row(name, shard) for shard in range(COUNTER_SHARDS)] if name in SHARDED_COUNTERS else [name]
+            if not recount and all(row in existing for row in rows):
+                continue
+            # The whole count goes into the first row; the others start at zero
+            total = db.query(func.count(model.id)).scalar()
+            for row, value in zip(rows, [total] + [0] * (len(rows) - 1)):
+                if row in existing:
+                    existing[row].value = value
+                else:
+                    db.add(db_models.StatCounter(name=row, value=value))
+            if name not in rows and name in existing:
+                # Unsharded row written by older versions
+                db.delete(existing[name])
+        if AUTH_GENERATION not in existing:
+            db.add(db_models.StatCounter(name=AUTH_GENERATION, value=0))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker seeded them first
+            db.rollback()
+
+
+def read_counters(db: Session) -> Dict[str, int]:
+    values = {name: 0 for name in COUNTED_MODELS}
+    for row, value in db.query(db_models.StatCounter.name, db_models.StatCounter.value):
+        name = row.partition("#")[0]
+        if name in values:
+            values[name] += value
+    return values
+
+
+def read_counter(db: Session, name: str) -> int:
+    value = db.query(db_models.StatCounter.value).filter(db_models.StatCounter.name == name).scalar()
+    return value or 0
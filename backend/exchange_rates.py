@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from cache import CacheEntry, encode_json
+
+logger = logging.getLogger(__name__)
+
+# Money-valued fields of a /coins/markets row that describe the present, so
+# today's rate applies; percentages, supplies and ranks are the same in every
+# currency. Rows with sparklines (a week of prices) are never converted.
+MARKET_MONEY_FIELDS = (
+    "current_price", "market_cap", "fully_diluted_valuation", "total_volume",
+    "high_24h", "low_24h", "price_change_24h", "market_cap_change_24h",
+)
+# All-time high/low were set at past rates, and may fall on another day in
+# another currency, so converted rows report them as unknown (None)
+MARKET_HISTORICAL_FIELDS = (
+    "ath", "ath_change_percentage", "ath_date", "atl", "atl_change_percentage", "atl_date",
+)
+
+
+def convert_markets(rows: List[dict], factor: float) -> List[dict]:
+    if not rows:
+        return rows
+    fields = [field for field in MARKET_MONEY_FIELDS if any(field in row for row in rows)]
+    table = np.array([[row.get(field) for field in fields] for row in rows], dtype=float) * factor
+    converted = []
+    for row, values in zip(rows, table.tolist()):
+        row = dict(row)
+        for field, value in zip(fields, values):
+            if field in row:
+                row[field] = None if math.isnan(value) else value
+        for field in MARKET_HISTORICAL_FIELDS:
+            if field in row:
+                row[field] = None
+        converted.append(row)
+    return converted
+
+
+class ExchangeRates:
+    """Fiat exchange rates, used to re-quote current base currency data locally.
+
+    Current prices and market rows are fetched once in ``base`` and
+    multiplied into whatever fiat currency a client asks for, instead of
+    one upstream call and one cache entry per currency. The table comes
+    from CoinGecko's /exchange_rates (every rate in units per BTC, so a
+    conversion factor is a ratio of two rates) and is refreshed every
+    ``interval`` seconds. Until it has loaded, or once it is older than
+    ``max_age``, ``factor`` returns None and callers ask upstream in the
+    requested currency as before.
+
+    Only rates of type "fiat" are kept: crypto quotes move with the coins
+    themselves, so they always go upstream. Only the present is converted.
+    Historical data would need the rate of each point's own time, so charts,
+    candles and sparklines are always fetched in the requested currency and
+    converted market rows leave ATH/ATL unknown.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[], Awaitable[dict]],
+        base: str = "usd",
+        interval: float = 300,
+        max_age: float = 3600,
+        max_converted: int = 512,
+        retry_interval: float = 15,
+    ):
+        self.fetch = fetch
+        self.base = base
+        self.interval = interval
+        self.max_age = max_age
+        self.max_converted = max_converted
+        self.retry_interval = retry_interval
+        self._rates: Dict[str, float] = {}
+        self.fetched_at: Optional[float] = None
+        self.version = 0
+        # (cache key, currency) -> (base entry, rates version, converted entry)
+        self._converted: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.conversions = 0
+        self.reused = 0
+        self.failures = 0
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.failures += 1
+                logger.exception("Exchange rate refresh failed")
+            # Until a table has loaded every request falls back upstream, so retry sooner
+            await asyncio.sleep(self.interval if self.fetched_at else min(self.interval, self.retry_interval))
+
+    async def refresh(self):
+        data = await self.fetch()
+        rates = {
+            currency.lower(): float(rate["value"])
+            for currency, rate in data.get("rates", {}).items()
+            if rate.get("type") == "fiat" and rate.get("value")
+        }
+        if self.base not in rates:
+            raise ValueError(f"Exchange rates do not include the fiat base currency {self.base!r}")
+        self._rates = rates
+        self.fetched_at = time.time()
+        self.version += 1
+
+    def factor(self, currency: str) -> Optional[float]:
+        """Multiplier from base to ``currency``, or None when it cannot be converted locally"""
+        currency = currency.lower()
+        if self.fetched_at is None or time.time() - self.fetched_at > self.max_age:
+            return None
+        if currency == self.base:
+            return 1.0
+        rate = self._rates.get(currency)
+        return rate / self._rates[self.base] if rate else None
+
+    def converted_entry(self, cache_key: str, currency: str, entry: CacheEntry, factor: float,
+                        convert: Callable[[object, float], object]) -> CacheEntry:
+        """A cache entry holding ``entry`` re-quoted in ``currency``.
+
+        Converted entries are memoized against the base entry and the rate
+        table, so repeated requests reuse the serialized body, ETag and
+        compressed variants exactly like a cache hit.
+        """
+        key = (cache_key, currency)
+        memo = self._converted.get(key)
+        if memo is not None and memo[0] is entry and memo[1] == self.version:
+            self._converted.move_to_end(key)
+            self.reused += 1
+            return memo[2]
+        value = convert(entry.value, factor)
+        body = encode_json(value)
+        converted = CacheEntry(value, entry.stored_at, entry.ttl, len(body or b""), body=body)
+        self.conversions += 1
+        self._converted[key] = (entry, self.version, converted)
+        self._converted.move_to_end(key)
+        while len(self._converted) > self.max_converted:
+            self._converted.popitem(last=False)
+        return converted
+
+    def stats(self) -> dict:
+        return {
+            "base": self.base,
+            "currencies": len(self._rates),
+            "age": round(time.time() - self.fetched_at, 1) if self.fetched_at else None,
+            "version": self.version,
+            "conversions": self.conversions,
+            "reused": self.reused,
+            "memoized": len(self._converted),
+            "failures": self.failures,
+        }
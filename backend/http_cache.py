@@ -0,0 +1,106 @@
+import gzip
+import hashlib
+import os
+import time
+from typing import Optional
+
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+
+from cache import CacheEntry, encode_json
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is offered
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))  # smaller bodies go out as-is
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+THREADPOOL_MIN_BYTES = 64 * 1024  # compress bigger bodies off the event loop
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Best content coding we can serve for an Accept-Encoding header, or None for identity"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def entry_etag(entry: CacheEntry) -> str:
+    if entry.etag is None:
+        entry.etag = hashlib.blake2b(entry.body, digest_size=16).hexdigest()
+    return entry.etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison; any coding of the same body matches"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"').split("-")[0] == etag:
+            return True
+    return False
+
+
+async def entry_response(request: Request, entry: CacheEntry) -> Response:
+    """Send a cache entry's stored JSON bytes, honouring If-None-Match and Accept-Encoding.
+
+    Compressed variants are produced once per entry and reused by every later
+    hit; clients that already hold the current ETag get an empty 304.
+    """
+    if entry.body is None:
+        entry.body = encode_json(entry.value) or b"null"
+    etag = entry_etag(entry)
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    if encoding is not None and len(entry.body) < COMPRESS_MIN_BYTES:
+        encoding = None
+    remaining = max(0, int(entry.stored_at + entry.ttl - time.time()))
+    headers = {
+        "ETag": f'"{etag}-{encoding}"' if encoding else f'"{etag}"',
+        "Cache-Control": f"private, max-age={remaining}",
+        "Vary": "Accept-Encoding",
+    }
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    if encoding is None:
+        return Response(entry.body, media_type="application/json", headers=headers)
+
+    content = entry.variants.get(encoding)
+    if content is None:
+        if len(entry.body) >= THREADPOOL_MIN_BYTES:
+            content = await run_in_threadpool(compress, entry.body, encoding)
+        else:
+            content = compress(entry.body, encoding)
+        entry.variants[encoding] = content
+    headers["Content-Encoding"] = encoding
+    return Response(content, media_type="application/json", headers=headers)
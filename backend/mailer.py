@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import random
+import smtplib
+import ssl
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MailQueueFull(Exception):
+    pass
+
+
+class Mailer:
+    """Background outbound email queue with one reusable SMTP connection.
+
+    ``send`` only enqueues, so request handlers return at once. A single
+    worker drains up to ``batch_size`` queued messages at a time and delivers
+    them over one SMTP session on a dedicated thread, reconnecting when the
+    server drops the connection and closing it after ``idle_timeout``
+    seconds without mail. Transient failures are retried ``max_attempts``
+    times with jittered backoff; permanent ones are logged and dropped.
+
+    With no ``host`` nothing can be sent: ``can_send`` is False so callers
+    can refuse the request. Local development may set ``log_only`` instead,
+    which logs the recipient and subject of each message (never the body)
+    and drops it; benchmarks/fake_smtp.py --print shows full messages.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: str = "",
+        password: str = "",
+        use_ssl: bool = True,
+        sender: str = "",
+        timeout: float = 10,
+        batch_size: int = 50,
+        max_attempts: int = 3,
+        backoff: float = 2.0,
+        idle_timeout: float = 30,
+        max_queue: int = 1000,
+        log_only: bool = False,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.sender = sender or username
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self.log_only = log_only
+        self._queue: asyncio.Queue = asyncio.Queue(max_queue)
+        # smtplib connections are not thread-safe; every SMTP call runs on this one thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mailer")
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._retry_tasks = set()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.batches = 0
+        self.connections = 0
+
+    @property
+    def can_send(self) -> bool:
+        return bool(self.host) or self.log_only
+
+    def message(self, to: str, subject: str, body: str) -> EmailMessage:
+        msg = EmailMessage()
+        msg["Subject"] = subject
+        msg["From"] = self.sender
+        msg["To"] = to
+        msg.set_content(body)
+        return msg
+
+    def send(self, msg: EmailMessage):
+        """Queue a message for delivery; raises MailQueueFull when the backlog is full"""
+        try:
+            self._queue.put_nowait((msg, 1))
+        except asyncio.QueueFull:
+            raise MailQueueFull()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    first = await asyncio.wait_for(self._queue.get(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    await loop.run_in_executor(self._executor, self._disconnect)
+                    continue
+                batch = [first]
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                self.batches += 1
+                failures = await loop.run_in_executor(self._executor, self._deliver, batch)
+                for msg, attempt in failures:
+                    self._schedule_retry(msg, attempt)
+        finally:
+            for task in self._retry_tasks:
+                task.cancel()
+            await loop.run_in_executor(self._executor, self._disconnect)
+
+    def _schedule_retry(self, msg: EmailMessage, attempt: int):
+        if attempt >= self.max_attempts:
+            self.failed += 1
+            logger.error("Giving up on email to %s after %d attempts", msg["To"], attempt)
+            return
+        self.retried += 1
+        delay = random.uniform(0.5, 1.0) * self.backoff * 2 ** (attempt - 1)
+
+        async def requeue():
+            await asyncio.sleep(delay)
+            try:
+                self._queue.put_nowait((msg, attempt + 1))
+            except asyncio.QueueFull:
+                self.failed += 1
+                logger.error("Dropping email to %s: mail queue is full", msg["To"])
+
+        task = asyncio.ensure_future(requeue())
+        self._retry_tasks.add(task)
+        task.add_done_callback(self._retry_tasks.discard)
+
+    def _connect(self) -> smtplib.SMTP:
+        if self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout,
+                                    context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            smtp.ehlo()
+            if smtp.has_extn("starttls"):
+                smtp.starttls(context=ssl.create_default_context())
+                smtp.ehlo()
+        if self.username:
+            smtp.login(self.username, self.password)
+        self.connections += 1
+        return smtp
+
+    def _disconnect(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                self._smtp.close()
+            self._smtp = None
+
+    def _deliver(self, batch: List[Tuple[EmailMessage, int]]) -> List[Tuple[EmailMessage, int]]:
+        """Send a batch over the shared connection; returns messages to retry"""
+        if not self.host:
+            for msg, _ in batch:
+                if self.log_only:
+                    logger.info("No SMTP host; dropped email to %s: %s", msg["To"], msg["Subject"])
+                else:
+                    self.failed += 1
+                    logger.error("No SMTP host; cannot send email to %s", msg["To"])
+            return []
+        failures = []
+        for index, (msg, attempt) in enumerate(batch):
+            if self._smtp is None:
+                try:
+                    self._smtp = self._connect()
+                except (smtplib.SMTPException, OSError) as exc:
+                    # The server is unreachable; the rest of the batch would fail the same way
+                    logger.warning("Could not connect to SMTP server %s:%s: %s", self.host, self.port, exc)
+                    failures.extend(batch[index:])
+                    break
+            try:
+                self._smtp.send_message(msg)
+                self.sent += 1
+            except (smtplib.SMTPServerDisconnected, OSError) as exc:
+                logger.warning("Email to %s failed (attempt %d): %s", msg["To"], attempt, exc)
+                self._smtp.close()
+                self._smtp = None
+                failures.append((msg, attempt))
+            except smtplib.SMTPException as exc:
+                self.failed += 1
+                logger.error("Email to %s rejected: %s", msg["To"], exc)
+                try:
+                    self._smtp.rset()
+                except (smtplib.SMTPException, OSError):
+                    self._smtp.close()
+                    self._smtp = None
+        return failures
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "batches": self.batches,
+            "connections": self.connections,
+            "connected": self._smtp is not None,
+        }
@@ -1,34 +1,74 @@
-from fastapi import FastAPI, Depends, HTTPException, Query, status, Form
+from fastapi import FastAPI, Depends, HTTPException, Query, status, Form, WebSocket, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from sqlalchemy import bindparam
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.orm import Session
+from pydantic import BaseModel
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-import requests
-import smtplib
-from email.message import EmailMessage
 import os
-from typing import List, Optional
+import hashlib
+import hmac
+import secrets
+import asyncio
+from typing import List, Optional, Tuple
 import time
 import json
+import logging
+import numpy as np
 from datetime import datetime, timedelta
 
-from database import get_db, engine
+from database import get_db, engine, SessionLocal
 import models as db_models
+from upstream import UpstreamClient, UpstreamError, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+from singleflight import SingleFlight
+from cache import CacheEntry, TTLCache, encode_json
+from shared_cache import SharedCache
+from price_batcher import PriceBatcher, split_ids
+from timeseries import TimeSeriesStore, DAY
+from alert_engine import AlertEngine
+from price_stream import PriceStreamHub
+from valuation import value_portfolio
+from auth_cache import AuthCache, Principal
+from password_hashing import PasswordHasher, pwd_context
+from counters import AUTH_GENERATION, adjust_counter, init_counters, read_counter, read_counters
+from coin_search import CoinSearchIndex
+from http_cache import entry_response
+from cache_snapshot import load_snapshot, write_snapshot
+from chart_payload import shape_candles, shape_chart
+from exchange_rates import ExchangeRates, convert_markets
+from market_universe import MarketUniverse, PRICE_CHANGE_WINDOWS
+import metrics
+from mailer import Mailer, MailQueueFull
 
 # Create tables
 db_models.Base.metadata.create_all(bind=engine)
+removed_duplicates = db_models.ensure_watchlist_unique_index(engine)
+init_counters(engine, recount=bool(removed_duplicates) or os.getenv("STATS_RECOUNT") == "1")
 
 app = FastAPI(title="CheeseBall Crypto API", version="1.0.0")
+logger = logging.getLogger(__name__)
 
 # Security configurations
 SECRET_KEY = "your-secret-key-here"  # Change in production
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt runs on a bounded worker pool so logins never block the event loop
+password_hasher = PasswordHasher(
+    workers=int(os.getenv("HASHER_WORKERS", "0")) or None,
+    max_pending=int(os.getenv("HASHER_MAX_PENDING", "64")),
+    use_processes=os.getenv("HASHER_MODE", "thread") == "process",
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
+# Verified tokens and user principals, reused for AUTH_CACHE_TTL seconds. A user
+# changed by another worker is dropped from this one's cache within
+# AUTH_GENERATION_POLL_INTERVAL seconds.
+auth_cache = AuthCache(ttl=float(os.getenv("AUTH_CACHE_TTL", "30")))
+AUTH_GENERATION_POLL_INTERVAL = float(os.getenv("AUTH_GENERATION_POLL_INTERVAL", "1"))
 
 # CORS middleware
 app.add_middleware(
@@ -39,22 +79,405 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# CoinGecko API base URL
-COINGECKO_BASE_URL = "https://api.coingecko.com/api/v3"
-CACHE = {}
-CACHE_DURATION = 60  # seconds
+# Prometheus metrics on /metrics (bearer METRICS_TOKEN when set). Requests slower
+# than SLOW_REQUEST_SECONDS get the event loop's stack sampled; 0 disables that.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "0"))
+slow_requests = metrics.SlowRequestSampler(SLOW_REQUEST_SECONDS) if SLOW_REQUEST_SECONDS > 0 else None
+app.add_middleware(metrics.MetricsMiddleware, sampler=slow_requests)
+metrics.instrument_engine(engine)
+
+# CoinGecko API base URL (point it at benchmarks/fake_coingecko.py to run offline)
+COINGECKO_BASE_URL = os.getenv("COINGECKO_BASE_URL", "https://api.coingecko.com/api/v3")
+CACHE_DURATION = 60  # default seconds for key families without their own TTL
+# Per key-family TTLs in seconds; reference data changes rarely, prices often
+CACHE_TTLS = {
+    "coins_list": 3600,
+    "categories_list": 3600,
+    "supported_currencies": 3600,
+    "trending_coins": 300,
+    "global_market_data": 60,
+    "coins_markets": 60,
+    "coin_detail": 120,
+    "coin_tickers": 120,
+    "coin_ohlc": 300,
+    "token_market_chart": 300,
+    "simple_price": 15,
+    "token_price": 15,
+    "onchain_token_price": 15,
+    "exchange_rates": 300,
+}
+CACHE_OPTIONS = dict(
+    max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "5000")),
+    max_bytes=int(os.getenv("CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+    default_ttl=CACHE_DURATION,
+    ttls=CACHE_TTLS,
+    # Expired entries stay servable this long while one background refresh runs
+    stale_window=float(os.getenv("CACHE_STALE_WINDOW", "300")),
+)
+# "memory" keeps a cache per process; "sqlite" shares one cache between all
+# worker processes on the host through SHARED_CACHE_PATH
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+if CACHE_BACKEND == "sqlite":
+    CACHE = SharedCache(
+        os.getenv("SHARED_CACHE_PATH", "./cheeseball_cache.db"),
+        local_entries=int(os.getenv("SHARED_CACHE_LOCAL_ENTRIES", "64")),
+        **CACHE_OPTIONS
+    )
+else:
+    CACHE = TTLCache(**CACHE_OPTIONS)
+REFILL_POLL_INTERVAL = 0.05  # seconds between checks while another worker refills a key
+# The memory cache is snapshotted to disk every CACHE_SNAPSHOT_INTERVAL seconds and
+# on shutdown, then restored on startup (the sqlite backend persists on its own).
+# An empty CACHE_SNAPSHOT_PATH disables it.
+CACHE_SNAPSHOT_PATH = os.getenv("CACHE_SNAPSHOT_PATH", "./cheeseball_cache.snapshot") if CACHE_BACKEND == "memory" else ""
+CACHE_SNAPSHOT_INTERVAL = float(os.getenv("CACHE_SNAPSHOT_INTERVAL", "60"))
+# After a restore only hot keys and the most recently used stale entries, at most
+# RESTORE_REFRESH_LIMIT of them, are refreshed up front; the rest on their next request
+RESTORE_REFRESH_LIMIT = int(os.getenv("RESTORE_REFRESH_LIMIT", "50"))
+
+# Keys refreshed on a schedule so they never go cold: cache key -> (path, params).
+# HOT_REFRESH_KEYS narrows the set (comma separated); HOT_REFRESH_INTERVAL=0 disables.
+HOT_CACHE_KEYS = {
+    "trending_coins": ("/search/trending", None),
+    "global_market_data": ("/global", None),
+    "coins_markets_usd_None_None_market_cap_desc_100_1_False_24h": ("/coins/markets", {
+        "vs_currency": "usd",
+        "order": "market_cap_desc",
+        "per_page": 100,
+        "page": 1,
+        "sparkline": False,
+        "price_change_percentage": "24h"
+    }),
+}
+if os.getenv("HOT_REFRESH_KEYS"):
+    HOT_CACHE_KEYS = {
+        key: source for key, source in HOT_CACHE_KEYS.items()
+        if key in os.getenv("HOT_REFRESH_KEYS").split(",")
+    }
+HOT_REFRESH_INTERVAL = float(os.getenv("HOT_REFRESH_INTERVAL", "15"))  # seconds
+
+# Shared pooled client used by every CoinGecko proxy route; it also enforces
+# COINGECKO_RATE_LIMIT_PER_MINUTE, retries and the circuit breaker
+upstream = UpstreamClient(COINGECKO_BASE_URL)
+upstream.observer = metrics.observe_upstream
+metrics.registry.add_collector(metrics.upstream_collector(upstream))
+metrics.registry.add_collector(metrics.cache_collector(CACHE))
+# Which calls get rate limit tokens first when we are over quota, by key family
+UPSTREAM_PRIORITIES = {
+    "simple_price": PRIORITY_HIGH,
+    "token_price": PRIORITY_HIGH,
+    "onchain_token_price": PRIORITY_HIGH,
+    "coin_detail": PRIORITY_LOW,
+    "coin_tickers": PRIORITY_LOW,
+    "coin_ohlc": PRIORITY_LOW,
+    "token_market_chart": PRIORITY_LOW,
+}
+# Concurrent cache misses for the same key share a single upstream fetch
+inflight = SingleFlight()
+
+async def fetch_simple_prices(coin_ids: List[str], currencies: List[str]):
+    return await upstream.get("/simple/price",
+                              params={"ids": ",".join(coin_ids), "vs_currencies": ",".join(currencies)},
+                              priority=PRIORITY_HIGH)
+
+# /simple/price is cached per (coin, currency); misses from concurrent requests
+# within PRICE_BATCH_WINDOW seconds are merged into one upstream call
+price_batcher = PriceBatcher(
+    CACHE,
+    fetch_simple_prices,
+    window=float(os.getenv("PRICE_BATCH_WINDOW", "0.02")),
+    max_ids=int(os.getenv("PRICE_BATCH_MAX_IDS", "200")),
+)
+
+# Current prices and market lists are fetched in FX_BASE_CURRENCY only and converted
+# locally into any fiat currency listed by /exchange_rates, refreshed every
+# FX_REFRESH_INTERVAL seconds. Charts and candles are always fetched in the requested
+# currency. FX_LOCAL_CONVERSION=0 asks CoinGecko per currency for everything.
+FX_LOCAL_CONVERSION = os.getenv("FX_LOCAL_CONVERSION", "1") == "1"
+
+async def fetch_exchange_rates():
+    return await fetch_cached("exchange_rates", "/exchange_rates")
+
+exchange_rates = ExchangeRates(
+    fetch_exchange_rates,
+    base=os.getenv("FX_BASE_CURRENCY", "usd").lower(),
+    interval=float(os.getenv("FX_REFRESH_INTERVAL", "300")),
+    max_age=float(os.getenv("FX_MAX_AGE", "3600")),
+)
+
+def local_factor(currency: str) -> Optional[float]:
+    """Multiplier from the base currency when `currency` is served by local conversion"""
+    if not FX_LOCAL_CONVERSION or currency.lower() == exchange_rates.base:
+        return None
+    return exchange_rates.factor(currency)
+
+async def get_prices(coin_ids: List[str], currencies: List[str]) -> dict:
+    """price_batcher.get_prices, with convertible currencies derived from base prices"""
+    base = exchange_rates.base
+    factors = {currency: local_factor(currency) for currency in currencies}
+    converted = [currency for currency, factor in factors.items() if factor is not None]
+    fetched = [currency for currency in currencies if factors[currency] is None]
+    if converted and base not in fetched:
+        fetched.append(base)
+    prices = await price_batcher.get_prices(coin_ids, fetched)
+    if not converted:
+        return prices
+    vector = np.array([factors[currency] for currency in converted])
+    result = {}
+    for coin_id, quotes in prices.items():
+        if base in quotes:
+            quotes.update(zip(converted, (quotes[base] * vector).tolist()))
+            if base not in currencies:
+                del quotes[base]
+        if quotes:
+            result[coin_id] = quotes
+    return result
+
+# Chart points and OHLC candles are kept per (coin, currency) in aligned segments,
+# so overlapping ranges are served locally and only missing edges are fetched
+async def fetch_chart_data(path: str, params: Optional[dict] = None):
+    return await upstream.get(path, params=params, priority=PRIORITY_LOW)
+
+timeseries = TimeSeriesStore(fetch_chart_data, max_series=int(os.getenv("TIMESERIES_MAX_SERIES", "2000")))
+
+# Evaluates active price alerts every ALERT_ENGINE_INTERVAL seconds (0 disables it).
+# Every worker starts it, but only the one holding the lease in the cache runs it
+alert_engine = AlertEngine(
+    SessionLocal,
+    get_prices,
+    interval=float(os.getenv("ALERT_ENGINE_INTERVAL", "5")),
+    reload_interval=float(os.getenv("ALERT_ENGINE_RELOAD_INTERVAL", "300")),
+    lease=lambda seconds: CACHE.atry_lock("alert_engine", seconds, renew=True),
+)
+
+# /search/coins answers from an index over the cached /coins/list (with platforms,
+# so contract addresses are searchable); it resyncs whenever that list is refetched
+coin_index = CoinSearchIndex()
+SEARCH_SOURCE = ("coins_list_True", "/coins/list", {"include_platform": True})
+
+# /coins/markets is answered from a local table of the top MARKET_UNIVERSE_PAGES x 250
+# coins, refreshed every MARKET_UNIVERSE_INTERVAL seconds in the base currency.
+# Market cap pages within those rows, ids subsets and categories that fit in
+# MARKET_CATEGORY_PAGES pages are sorted and sliced in-process; anything the table
+# can't hold in full goes upstream. MARKET_UNIVERSE_PAGES=0 proxies every request.
+MARKET_UNIVERSE_PAGES = int(os.getenv("MARKET_UNIVERSE_PAGES", "4"))
+
+async def fetch_market_page(params: dict):
+    return await upstream.get("/coins/markets", params={
+        "vs_currency": exchange_rates.base,
+        "sparkline": "true",
+        "price_change_percentage": ",".join(PRICE_CHANGE_WINDOWS),
+        **params
+    })
+
+market_universe = MarketUniverse(
+    fetch_market_page,
+    pages=MARKET_UNIVERSE_PAGES,
+    interval=float(os.getenv("MARKET_UNIVERSE_INTERVAL", "60")),
+    category_ttl=float(os.getenv("MARKET_CATEGORY_TTL", "3600")),
+    max_pages_per_category=int(os.getenv("MARKET_CATEGORY_PAGES", "4")),
+) if MARKET_UNIVERSE_PAGES > 0 else None
+if market_universe is not None:
+    # The first market page is served from the universe, no need to keep it hot
+    HOT_CACHE_KEYS = {key: source for key, source in HOT_CACHE_KEYS.items() if source[0] != "/coins/markets"}
+
+# One shared poller feeds every /ws/prices subscriber
+price_hub = PriceStreamHub(
+    get_prices,
+    interval=float(os.getenv("PRICE_STREAM_INTERVAL", "5")),
+)
+
+# Outbound email (password reset codes) goes through a background queue that keeps
+# one SMTP connection open. Without SMTP_HOST password resets fail with 503, unless
+# MAIL_DEV_LOG=1 (local development only), which logs each email's recipient and subject.
+mailer = Mailer(
+    host=os.getenv("SMTP_HOST", ""),
+    port=int(os.getenv("SMTP_PORT", "465")),
+    username=os.getenv("SMTP_USER", ""),
+    password=os.getenv("SMTP_PASSWORD", ""),
+    use_ssl=os.getenv("SMTP_SSL", "1") == "1",
+    sender=os.getenv("SMTP_FROM", ""),
+    batch_size=int(os.getenv("SMTP_BATCH_SIZE", "50")),
+    log_only=os.getenv("MAIL_DEV_LOG") == "1",
+)
+# Reset codes expire after OTP_TTL_MINUTES and allow OTP_MAX_ATTEMPTS guesses;
+# a new code can be requested every OTP_RESEND_SECONDS
+OTP_TTL_MINUTES = int(os.getenv("OTP_TTL_MINUTES", "10"))
+OTP_MAX_ATTEMPTS = int(os.getenv("OTP_MAX_ATTEMPTS", "5"))
+OTP_RESEND_SECONDS = int(os.getenv("OTP_RESEND_SECONDS", "60"))
+
+background_tasks: List[asyncio.Task] = []
+
+@app.on_event("startup")
+async def start_upstream_client():
+    await upstream.start()
+    background_tasks.append(asyncio.ensure_future(metrics.monitor_loop_lag()))
+    background_tasks.append(asyncio.ensure_future(watch_auth_generation()))
+    if slow_requests is not None:
+        slow_requests.start()
+    if CACHE_SNAPSHOT_PATH:
+        try:
+            restored = await run_in_threadpool(load_snapshot, CACHE, CACHE_SNAPSHOT_PATH)
+        except (OSError, ValueError, KeyError):
+            logger.exception("Could not restore the cache snapshot")
+            restored = []
+        background_tasks.append(asyncio.ensure_future(refresh_restored_entries(restored)))
+        if CACHE_SNAPSHOT_INTERVAL > 0:
+            background_tasks.append(asyncio.ensure_future(snapshot_cache_periodically()))
+    if HOT_REFRESH_INTERVAL > 0 and HOT_CACHE_KEYS:
+        background_tasks.append(asyncio.ensure_future(refresh_hot_keys()))
+    if alert_engine.interval > 0:
+        background_tasks.append(asyncio.ensure_future(alert_engine.run()))
+    background_tasks.append(asyncio.ensure_future(price_hub.run()))
+    background_tasks.append(asyncio.ensure_future(mailer.run()))
+    if FX_LOCAL_CONVERSION:
+        background_tasks.append(asyncio.ensure_future(exchange_rates.run()))
+    if market_universe is not None:
+        background_tasks.append(asyncio.ensure_future(market_universe.run()))
+
+@app.on_event("shutdown")
+async def close_upstream_client():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    if CACHE_SNAPSHOT_PATH:
+        await run_in_threadpool(write_snapshot, CACHE, CACHE_SNAPSHOT_PATH)
+    await upstream.close()
+    password_hasher.close()
+    mailer.close()
+    CACHE.close()
 
 # Utility functions
 def get_cached_data(key: str):
-    """Simple in-memory cache implementation"""
-    if key in CACHE:
-        data, timestamp = CACHE[key]
-        if time.time() - timestamp < CACHE_DURATION:
-            return data
+    """Bounded TTL/LRU cache lookup; returns None on a miss"""
+    return CACHE.get(key)
+
+def set_cached_data(key: str, data, source: Optional[tuple] = None):
+    CACHE.set(key, data, source=source)
+
+def cache_loader(cache_key: str, path: str, params: Optional[dict] = None, force: bool = False):
+    async def load():
+        # A request that queued behind a just-finished fetch may find it fresh
+        entry = await CACHE.apeek(cache_key)
+        if not force and entry is not None and entry.is_fresh(time.time()):
+            return entry.value
+        # Only one worker process refills a key; the others wait for its result
+        if not await CACHE.atry_lock(cache_key, upstream.deadline):
+            entry = await wait_for_refill(cache_key, entry)
+            if entry is not None:
+                return entry.value
+        try:
+            data = await upstream.get(path, params=params,
+                                      priority=UPSTREAM_PRIORITIES.get(CACHE.family(cache_key), PRIORITY_NORMAL))
+            await CACHE.aset(cache_key, data, source=(path, params))
+        finally:
+            await CACHE.aunlock(cache_key)
+        return data
+    return load
+
+async def wait_for_refill(cache_key: str, previous):
+    """Wait until another worker stores a newer entry, or its lease runs out"""
+    deadline = time.time() + upstream.deadline
+    while time.time() < deadline:
+        await asyncio.sleep(REFILL_POLL_INTERVAL)
+        entry = await CACHE.apeek(cache_key)
+        if entry is not None and (previous is None or entry.stored_at > previous.stored_at):
+            return entry
     return None
 
-def set_cached_data(key: str, data):
-    CACHE[key] = (data, time.time())
+async def fetch_cached_entry(cache_key: str, path: str, params: Optional[dict] = None) -> CacheEntry:
+    """Serve from cache, or fetch from CoinGecko with one upstream call per key.
+
+    Expired entries inside the stale window are returned immediately while a
+    single background task refreshes them. While the upstream circuit breaker
+    is open, or when a refill fails upstream, any stored entry is served,
+    however old.
+    """
+    # Kept before get_entry, which drops entries past the stale window
+    previous = await CACHE.apeek(cache_key)
+    if previous is not None and upstream.is_unavailable:
+        return previous
+
+    entry = await CACHE.aget_entry(cache_key)
+    if entry is not None:
+        if not entry.is_fresh(time.time()):
+            inflight.start(cache_key, cache_loader(cache_key, path, params))
+        return entry
+
+    try:
+        data = await inflight.do(cache_key, cache_loader(cache_key, path, params))
+    except UpstreamError as exc:
+        if previous is None or exc.status_code < 500:
+            raise
+        return previous
+    entry = await CACHE.apeek(cache_key)
+    # Small payloads are decoded afresh from the shared cache, so identity alone can't tell
+    if entry is None or (entry.value is not data and entry.value != data):
+        # Too large to cache, or already replaced; serve it as a one-off
+        entry = CacheEntry(data, time.time(), 0, 0)
+    return entry
+
+async def fetch_cached(cache_key: str, path: str, params: Optional[dict] = None):
+    return (await fetch_cached_entry(cache_key, path, params)).value
+
+async def cached_response(request: Request, cache_key: str, path: str, params: Optional[dict] = None):
+    """Like fetch_cached, but sends the entry's pre-serialized bytes (gzip/br, ETag/304)"""
+    return await entry_response(request, await fetch_cached_entry(cache_key, path, params))
+
+def quote_currency(currency: str) -> Tuple[str, Optional[float]]:
+    """Currency to ask CoinGecko for, and the factor converting its data into `currency` (or None)"""
+    factor = local_factor(currency)
+    return (exchange_rates.base, factor) if factor is not None else (currency, None)
+
+async def fetch_quoted_entry(cache_key: str, path: str, params: Optional[dict], currency: str,
+                             factor: Optional[float], convert) -> CacheEntry:
+    """fetch_cached_entry for data quoted in the base currency, re-quoted in `currency` when factor is set"""
+    entry = await fetch_cached_entry(cache_key, path, params)
+    if factor is None:
+        return entry
+    return exchange_rates.converted_entry(cache_key, currency.lower(), entry, factor, convert)
+
+async def refresh_hot_keys():
+    """Refresh hot keys shortly before they expire so no request waits on them"""
+    while True:
+        now = time.time()
+        for cache_key, (path, params) in HOT_CACHE_KEYS.items():
+            entry = await CACHE.apeek(cache_key)
+            if entry is None or entry.age(now) + HOT_REFRESH_INTERVAL >= entry.ttl:
+                inflight.start(cache_key, cache_loader(cache_key, path, params, force=True))
+        await asyncio.sleep(HOT_REFRESH_INTERVAL)
+
+async def refresh_restored_entries(restored):
+    """Refresh the stale restored entries likely to be asked for, one at a time.
+
+    Hot keys go first, then the most recently used entries (the snapshot
+    keeps LRU order), up to RESTORE_REFRESH_LIMIT refreshes in total.
+    """
+    hot = [item for item in restored if item[0] in HOT_CACHE_KEYS]
+    recent = [item for item in reversed(restored) if item[0] not in HOT_CACHE_KEYS]
+    refreshed = 0
+    for cache_key, entry in hot + recent:
+        if upstream.is_unavailable or refreshed >= RESTORE_REFRESH_LIMIT:
+            break
+        # Skip entries a request has refreshed (or replaced) in the meantime
+        if entry.source is None or await CACHE.apeek(cache_key) is not entry or entry.is_fresh(time.time()):
+            continue
+        refreshed += 1
+        path, params = entry.source
+        try:
+            await inflight.do(cache_key, cache_loader(cache_key, path, params, force=True))
+        except HTTPException:
+            pass
+
+async def snapshot_cache_periodically():
+    while True:
+        await asyncio.sleep(CACHE_SNAPSHOT_INTERVAL)
+        try:
+            await run_in_threadpool(write_snapshot, CACHE, CACHE_SNAPSHOT_PATH)
+        except OSError:
+            logger.exception("Could not write the cache snapshot")
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -72,26 +495,56 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+    username = auth_cache.subject_for(token)
+    if username is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    user = db.query(db_models.User).filter(db_models.User.username == username).first()
+        auth_cache.remember_token(token, username, payload.get("exp"))
+
+    # Only a cache miss opens a session; cached principals skip the DB entirely
+    user = auth_cache.get_user(username)
     if user is None:
-        raise credentials_exception
+        user = await run_in_threadpool(load_principal, username)
+        if user is None:
+            raise credentials_exception
     return user
 
-async def get_current_admin_user(current_user: db_models.User = Depends(get_current_user)):
+def load_principal(username: str) -> Optional[Principal]:
+    db = SessionLocal()
+    try:
+        user = db.query(db_models.User).filter(db_models.User.username == username).first()
+        return auth_cache.put_user(user) if user is not None else None
+    finally:
+        db.close()
+
+def read_auth_generation() -> int:
+    db = SessionLocal()
+    try:
+        return read_counter(db, AUTH_GENERATION)
+    finally:
+        db.close()
+
+async def watch_auth_generation():
+    """Drop cached principals once another worker has changed a user"""
+    while True:
+        try:
+            auth_cache.sync_generation(await run_in_threadpool(read_auth_generation))
+        except SQLAlchemyError:
+            logger.exception("Could not read the auth generation")
+        await asyncio.sleep(AUTH_GENERATION_POLL_INTERVAL)
+
+async def get_current_admin_user(current_user: Principal = Depends(get_current_user)):
     if not current_user.is_admin:  # Now using proper admin field
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -109,9 +562,9 @@ async def register(
     db: Session = Depends(get_db)
 ):
     # Check if user already exists
-    existing_user = db.query(db_models.User).filter(
+    existing_user = await run_in_threadpool(lambda: db.query(db_models.User).filter(
         (db_models.User.username == username) | (db_models.User.email == email)
-    ).first()
+    ).first())
     
     if existing_user:
         raise HTTPException(
@@ -120,7 +573,7 @@ async def register(
         )
     
     # Create new user
-    hashed_password = get_password_hash(password)
+    hashed_password = await password_hasher.hash(password)
     user = db_models.User(
         username=username,
         email=email,
@@ -128,9 +581,11 @@ async def register(
         preferred_currency=preferred_currency
     )
     
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+    def save_user():
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+    await run_in_threadpool(save_user)
     
     return {"message": "User created successfully", "user_id": user.id}
 
@@ -139,9 +594,11 @@ async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
-    user = db.query(db_models.User).filter(db_models.User.username == form_data.username).first()
+    user = await run_in_threadpool(
+        lambda: db.query(db_models.User).filter(db_models.User.username == form_data.username).first()
+    )
     
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await password_hasher.verify(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
@@ -164,12 +621,79 @@ async def login(
     }
 
 # Admin Routes
+ADMIN_USERS_PAGE_SIZE = 1000
+ADMIN_USERS_MAX_PAGE_SIZE = 10000
+
+def query_users_page(
+    db: Session,
+    after_id: Optional[int],
+    limit: int,
+    is_active: Optional[bool],
+    created_after: Optional[datetime],
+    created_before: Optional[datetime]
+):
+    """One keyset page of users ordered by id: WHERE id > after_id ... LIMIT n"""
+    query = db.query(
+        db_models.User.id,
+        db_models.User.username,
+        db_models.User.email,
+        db_models.User.is_active,
+        db_models.User.created_at
+    )
+    if after_id is not None:
+        query = query.filter(db_models.User.id > after_id)
+    if is_active is not None:
+        query = query.filter(db_models.User.is_active == is_active)
+    if created_after is not None:
+        query = query.filter(db_models.User.created_at >= created_after)
+    if created_before is not None:
+        query = query.filter(db_models.User.created_at < created_before)
+    return query.order_by(db_models.User.id).limit(limit).all()
+
+def stream_users_ndjson(after_id, is_active, created_after, created_before):
+    # Uses its own session: the request's session is closed once streaming starts
+    db = SessionLocal()
+    try:
+        while True:
+            rows = query_users_page(db, after_id, ADMIN_USERS_PAGE_SIZE, is_active, created_after, created_before)
+            if not rows:
+                break
+            yield "".join(
+                json.dumps({
+                    "id": row.id,
+                    "username": row.username,
+                    "email": row.email,
+                    "is_active": row.is_active,
+                    "created_at": row.created_at.isoformat() if row.created_at else None
+                }) + "\n"
+                for row in rows
+            )
+            after_id = rows[-1].id
+    finally:
+        db.close()
+
 @app.get("/admin/users")
-async def get_all_users(
+def get_all_users(
+    response: Response,
+    after_id: Optional[int] = None,
+    limit: int = Query(ADMIN_USERS_PAGE_SIZE, ge=1, le=ADMIN_USERS_MAX_PAGE_SIZE),
+    is_active: Optional[bool] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
     current_user: db_models.User = Depends(get_current_admin_user),
     db: Session = Depends(get_db)
 ):
-    users = db.query(db_models.User).all()
+    if format == "ndjson":
+        return StreamingResponse(
+            stream_users_ndjson(after_id, is_active, created_after, created_before),
+            media_type="application/x-ndjson"
+        )
+
+    users = query_users_page(db, after_id, limit, is_active, created_after, created_before)
+    if len(users) == limit:
+        # Pass back as ?after_id= to fetch the next page
+        response.headers["X-Next-After-Id"] = str(users[-1].id)
     return [
         {
             "id": user.id,
@@ -182,25 +706,53 @@ async def get_all_users(
     ]
 
 @app.get("/admin/statistics")
-async def get_admin_statistics(
+def get_admin_statistics(
     current_user: db_models.User = Depends(get_current_admin_user),
     db: Session = Depends(get_db)
 ):
-    total_users = db.query(db_models.User).count()
-    total_watchlists = db.query(db_models.Watchlist).count()
-    total_portfolios = db.query(db_models.Portfolio).count()
-    total_alerts = db.query(db_models.PriceAlert).count()
-    
+    # Maintained counters: one small read instead of a COUNT(*) per table
     return {
-        "total_users": total_users,
-        "total_watchlists": total_watchlists,
-        "total_portfolios": total_portfolios,
-        "total_alerts": total_alerts,
+        **read_counters(db),
         "server_time": datetime.utcnow()
     }
 
+@app.get("/admin/cache/stats")
+async def get_cache_statistics(current_user: db_models.User = Depends(get_current_admin_user)):
+    return {**await run_in_threadpool(CACHE.stats), "timeseries": timeseries.stats(), "search": coin_index.stats(),
+            "exchange_rates": exchange_rates.stats(),
+            "market_universe": market_universe.stats() if market_universe is not None else None}
+
+@app.get("/admin/alerts/engine")
+async def get_alert_engine_statistics(current_user: db_models.User = Depends(get_current_admin_user)):
+    return alert_engine.stats()
+
+@app.get("/admin/stream/stats")
+async def get_stream_statistics(current_user: db_models.User = Depends(get_current_admin_user)):
+    return price_hub.stats()
+
+@app.get("/admin/upstream/stats")
+async def get_upstream_statistics(current_user: db_models.User = Depends(get_current_admin_user)):
+    return upstream.stats()
+
+@app.get("/admin/slow-requests")
+async def get_slow_requests(current_user: db_models.User = Depends(get_current_admin_user)):
+    if slow_requests is None:
+        return {"enabled": False, "requests": []}
+    return {"enabled": True, "threshold": slow_requests.threshold, "requests": list(slow_requests.recent)}
+
+@app.get("/metrics")
+async def get_metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    body = await run_in_threadpool(metrics.registry.render)
+    return Response(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/admin/auth/stats")
+async def get_auth_cache_statistics(current_user: db_models.User = Depends(get_current_admin_user)):
+    return {**auth_cache.stats(), "hasher": password_hasher.stats(), "mailer": mailer.stats()}
+
 @app.post("/admin/users/{user_id}/deactivate")
-async def deactivate_user(
+def deactivate_user(
     user_id: int,
     current_user: db_models.User = Depends(get_current_admin_user),
     db: Session = Depends(get_db)
@@ -210,12 +762,14 @@ async def deactivate_user(
         raise HTTPException(status_code=404, detail="User not found")
     
     user.is_active = False
+    adjust_counter(db.connection(), AUTH_GENERATION, 1)
     db.commit()
+    auth_cache.invalidate_user(username=user.username)
     
     return {"message": f"User {user.username} deactivated"}
 
 @app.post("/admin/users/{user_id}/activate")
-async def activate_user(
+def activate_user(
     user_id: int,
     current_user: db_models.User = Depends(get_current_admin_user),
     db: Session = Depends(get_db)
@@ -225,61 +779,51 @@ async def activate_user(
         raise HTTPException(status_code=404, detail="User not found")
     
     user.is_active = True
+    adjust_counter(db.connection(), AUTH_GENERATION, 1)
     db.commit()
+    auth_cache.invalidate_user(username=user.username)
     
     return {"message": f"User {user.username} activated"}
 
 # CoinGecko API Proxy Routes (Protected)
 @app.get("/coins/list")
 async def coins_list(
+    request: Request,
     include_platform: bool = False,
     current_user: db_models.User = Depends(get_current_user)
 ):
     cache_key = f"coins_list_{include_platform}"
-    cached = get_cached_data(cache_key)
-    if cached:
-        return cached
-    
-    response = requests.get(f"{COINGECKO_BASE_URL}/coins/list", params={"include_platform": include_platform})
-    data = response.json()
-    set_cached_data(cache_key, data)
-    return data
+    return await cached_response(request, cache_key, "/coins/list",
+                                 params={"include_platform": include_platform})
 
 @app.get("/simple/supported_vs_currencies")
-async def supported_currencies(current_user: db_models.User = Depends(get_current_user)):
+async def supported_currencies(request: Request, current_user: db_models.User = Depends(get_current_user)):
     cache_key = "supported_currencies"
-    cached = get_cached_data(cache_key)
-    if cached:
-        return cached
-    
-    response = requests.get(f"{COINGECKO_BASE_URL}/simple/supported_vs_currencies")
-    data = response.json()
-    set_cached_data(cache_key, data)
-    return data
+    return await cached_response(request, cache_key, "/simple/supported_vs_currencies")
 
 @app.get("/search/trending")
-async def trending_coins(current_user: db_models.User = Depends(get_current_user)):
+async def trending_coins(request: Request, current_user: db_models.User = Depends(get_current_user)):
     cache_key = "trending_coins"
-    cached = get_cached_data(cache_key)
-    if cached:
-        return cached
-    
-    response = requests.get(f"{COINGECKO_BASE_URL}/search/trending")
-    data = response.json()
-    set_cached_data(cache_key, data)
-    return data
+    return await cached_response(request, cache_key, "/search/trending")
+
+@app.get("/search/coins")
+async def search_coins(
+    query: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    current_user: db_models.User = Depends(get_current_user)
+):
+    cache_key, path, params = SEARCH_SOURCE
+    entry = await fetch_cached_entry(cache_key, path, params)
+    # Compared by stored_at: a shared cache decodes a new list object on every read
+    if not coin_index.is_current(entry.stored_at):
+        # Only the coins that changed are reindexed, off the event loop
+        await run_in_threadpool(coin_index.sync, entry.value, entry.stored_at)
+    return {"query": query, "coins": coin_index.search(query, limit)}
 
 @app.get("/coins/categories/list")
-async def categories_list(current_user: db_models.User = Depends(get_current_user)):
+async def categories_list(request: Request, current_user: db_models.User = Depends(get_current_user)):
     cache_key = "categories_list"
-    cached = get_cached_data(cache_key)
-    if cached:
-        return cached
-    
-    response = requests.get(f"{COINGECKO_BASE_URL}/coins/categories/list")
-    data = response.json()
-    set_cached_data(cache_key, data)
-    return data
+    return await cached_response(request, cache_key, "/coins/categories/list")
 
 @app.get("/simple/price")
 async def simple_price(
@@ -287,37 +831,23 @@ async def simple_price(
     vs_currencies: str,
     current_user: db_models.User = Depends(get_current_user)
 ):
-    cache_key = f"simple_price_{ids}_{vs_currencies}"
-    cached = get_cached_data(cache_key)
-    if cached:
-        return cached
-    
-    response = requests.get(f"{COINGECKO_BASE_URL}/simple/price", 
-                           params={"ids": ids, "vs_currencies": vs_currencies})
-    data = response.json()
-    set_cached_data(cache_key, data)
-    return data
+    return await get_prices(split_ids(ids), split_ids(vs_currencies))
 
 @app.get("/simple/token_price/{platform_id}")
 async def token_price(
+    request: Request,
     platform_id: str,
     contract_addresses: str,
     vs_currencies: str,
     current_user: db_models.User = Depends(get_current_user)
 ):
     cache_key = f"token_price_{platform_id}_{contract_addresses}_{vs_currencies}"
-    cached = get_cached_data(cache_key)
-    if cached:
-        return cached
-    
-    response = requests.get(f"{COINGECKO_BASE_URL}/simple/token_price/{platform_id}",
-                           params={"contract_addresses": contract_addresses, "vs_currencies": vs_currencies})
-    data = response.json()
-    set_cached_data(cache_key, data)
-    return data
+    return await cached_response(request, cache_key, f"/simple/token_price/{platform_id}",
+                                 params={"contract_addresses": contract_addresses, "vs_currencies": vs_currencies})
 
 @app.get("/coins/markets")
 async def coins_markets(
+    request: Request,
     vs_currency: str = "usd",
     ids: Optional[str] = None,
     category: Optional[str] = None,
@@ -328,13 +858,23 @@ async def coins_markets(
     price_change_percentage: str = "24h",
     current_user: db_models.User = Depends(get_current_user)
 ):
-    cache_key = f"coins_markets_{vs_currency}_{ids}_{category}_{order}_{per_page}_{page}_{sparkline}_{price_change_percentage}"
-    cached = get_cached_data(cache_key)
-    if cached:
-        return cached
-    
+    currency = vs_currency.lower()
+    # Sparklines are a week of history, which today's rate cannot re-quote
+    convertible = not sparkline or currency == exchange_rates.base
+    if market_universe is not None and convertible:
+        factor = 1.0 if currency == exchange_rates.base else local_factor(currency)
+        if factor is not None:
+            entry = await market_universe.markets(
+                split_ids(ids) if ids else None, category, order, per_page, page, sparkline,
+                price_change_percentage, currency, factor, exchange_rates.version, convert_markets
+            )
+            if entry is not None:
+                return await entry_response(request, entry)
+
+    quote, factor = quote_currency(vs_currency) if convertible else (vs_currency, None)
+    cache_key = f"coins_markets_{quote}_{ids}_{category}_{order}_{per_page}_{page}_{sparkline}_{price_change_percentage}"
     params = {
-        "vs_currency": vs_currency,
+        "vs_currency": quote,
         "order": order,
         "per_page": per_page,
         "page": page,
@@ -346,63 +886,60 @@ async def coins_markets(
     if category:
         params["category"] = category
     
-    response = requests.get(f"{COINGECKO_BASE_URL}/coins/markets", params=params)
-    data = response.json()
-    set_cached_data(cache_key, data)
-    return data
+    entry = await fetch_quoted_entry(cache_key, "/coins/markets", params, vs_currency, factor, convert_markets)
+    return await entry_response(request, entry)
 
 @app.get("/coins/{coin_id}")
 async def coin_detail(
+    request: Request,
     coin_id: str,
     localization: bool = False,
     market_data: bool = True,
     current_user: db_models.User = Depends(get_current_user)
 ):
     cache_key = f"coin_detail_{coin_id}_{localization}_{market_data}"
-    cached = get_cached_data(cache_key)
-    if cached:
-        return cached
-    
-    response = requests.get(f"{COINGECKO_BASE_URL}/coins/{coin_id}",
-                           params={"localization": localization, "market_data": market_data})
-    data = response.json()
-    set_cached_data(cache_key, data)
-    return data
+    return await cached_response(request, cache_key, f"/coins/{coin_id}",
+                                 params={"localization": localization, "market_data": market_data})
 
 @app.get("/coins/{coin_id}/tickers")
 async def coin_tickers(
+    request: Request,
     coin_id: str,
     page: int = 1,
     current_user: db_models.User = Depends(get_current_user)
 ):
     cache_key = f"coin_tickers_{coin_id}_{page}"
-    cached = get_cached_data(cache_key)
-    if cached:
-        return cached
-    
-    response = requests.get(f"{COINGECKO_BASE_URL}/coins/{coin_id}/tickers", params={"page": page})
-    data = response.json()
-    set_cached_data(cache_key, data)
-    return data
+    return await cached_response(request, cache_key, f"/coins/{coin_id}/tickers", params={"page": page})
+
+# Chart routes take points=N to downsample server-side and format=columnar for
+# delta-encoded timestamps with packed float32 values (see chart_payload.py)
+CHART_MAX_POINTS = 5000
+CHART_FORMATS = "^(json|columnar)$"
+
+def chart_response(payload) -> Response:
+    return Response(encode_json(payload), media_type="application/json")
+
+async def chart_range(coin_id: str, vs_currency: str, start: float, end: float, interval: Optional[str] = None):
+    try:
+        return await timeseries.chart_range(coin_id, vs_currency, start, end, interval)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
 
 @app.get("/coins/{coin_id}/market_chart")
 async def market_chart(
     coin_id: str,
     vs_currency: str = "usd",
-    days: int = 7,
+    days: int = Query(7, ge=1),
     interval: str = "daily",
+    points: Optional[int] = Query(None, ge=3, le=CHART_MAX_POINTS),
+    format: str = Query("json", pattern=CHART_FORMATS),
     current_user: db_models.User = Depends(get_current_user)
 ):
-    cache_key = f"market_chart_{coin_id}_{vs_currency}_{days}_{interval}"
-    cached = get_cached_data(cache_key)
-    if cached:
-        return cached
-    
-    response = requests.get(f"{COINGECKO_BASE_URL}/coins/{coin_id}/market_chart",
-                           params={"vs_currency": vs_currency, "days": days, "interval": interval})
-    data = response.json()
-    set_cached_data(cache_key, data)
-    return data
+    to_timestamp = time.time()
+    chart = await chart_range(coin_id, vs_currency, to_timestamp - days * DAY, to_timestamp, interval)
+    if points or format != "json":
+        return chart_response(shape_chart(chart, points, format))
+    return chart
 
 @app.get("/coins/{coin_id}/market_chart/range")
 async def market_chart_range(
@@ -410,6 +947,8 @@ async def market_chart_range(
     vs_currency: str = "usd",
     from_timestamp: int = None,
     to_timestamp: int = None,
+    points: Optional[int] = Query(None, ge=3, le=CHART_MAX_POINTS),
+    format: str = Query("json", pattern=CHART_FORMATS),
     current_user: db_models.User = Depends(get_current_user)
 ):
     if not from_timestamp:
@@ -417,87 +956,84 @@ async def market_chart_range(
     if not to_timestamp:
         to_timestamp = int(datetime.now().timestamp())
     
-    cache_key = f"market_chart_range_{coin_id}_{vs_currency}_{from_timestamp}_{to_timestamp}"
-    cached = get_cached_data(cache_key)
-    if cached:
-        return cached
-    
-    response = requests.get(f"{COINGECKO_BASE_URL}/coins/{coin_id}/market_chart/range",
-                           params={"vs_currency": vs_currency, "from": from_timestamp, "to": to_timestamp})
-    data = response.json()
-    set_cached_data(cache_key, data)
-    return data
+    chart = await chart_range(coin_id, vs_currency, from_timestamp, to_timestamp)
+    if points or format != "json":
+        return chart_response(shape_chart(chart, points, format))
+    return chart
 
 @app.get("/coins/{coin_id}/ohlc")
 async def coin_ohlc(
+    request: Request,
     coin_id: str,
     vs_currency: str = "usd",
     days: int = 7,
+    points: Optional[int] = Query(None, ge=3, le=CHART_MAX_POINTS),
+    format: str = Query("json", pattern=CHART_FORMATS),
     current_user: db_models.User = Depends(get_current_user)
 ):
+    reshape = bool(points) or format != "json"
+    candles = await timeseries.ohlc(coin_id, vs_currency, days)
+    if candles is not None:
+        return chart_response(shape_candles(candles, points, format)) if reshape else candles
+
+    # Longer ranges than any stored candle tier go straight through the cache
     cache_key = f"coin_ohlc_{coin_id}_{vs_currency}_{days}"
-    cached = get_cached_data(cache_key)
-    if cached:
-        return cached
-    
-    response = requests.get(f"{COINGECKO_BASE_URL}/coins/{coin_id}/ohlc",
-                           params={"vs_currency": vs_currency, "days": days})
-    data = response.json()
-    set_cached_data(cache_key, data)
-    return data
+    params = {"vs_currency": vs_currency, "days": days}
+    if reshape:
+        candles = await fetch_cached(cache_key, f"/coins/{coin_id}/ohlc", params)
+        return chart_response(shape_candles(candles, points, format))
+    return await cached_response(request, cache_key, f"/coins/{coin_id}/ohlc", params=params)
 
 @app.get("/coins/{platform_id}/contract/{contract_address}/market_chart")
 async def token_market_chart(
+    request: Request,
     platform_id: str,
     contract_address: str,
     vs_currency: str = "usd",
     days: int = 7,
+    points: Optional[int] = Query(None, ge=3, le=CHART_MAX_POINTS),
+    format: str = Query("json", pattern=CHART_FORMATS),
     current_user: db_models.User = Depends(get_current_user)
 ):
     cache_key = f"token_market_chart_{platform_id}_{contract_address}_{vs_currency}_{days}"
-    cached = get_cached_data(cache_key)
-    if cached:
-        return cached
-    
-    response = requests.get(f"{COINGECKO_BASE_URL}/coins/{platform_id}/contract/{contract_address}/market_chart",
-                           params={"vs_currency": vs_currency, "days": days})
-    data = response.json()
-    set_cached_data(cache_key, data)
-    return data
+    path = f"/coins/{platform_id}/contract/{contract_address}/market_chart"
+    params = {"vs_currency": vs_currency, "days": days}
+    if points or format != "json":
+        chart = await fetch_cached(cache_key, path, params)
+        return chart_response(shape_chart(chart, points, format))
+    return await cached_response(request, cache_key, path, params=params)
 
 @app.get("/onchain/simple/token_price/{platform_id}")
 async def onchain_token_price(
+    request: Request,
     platform_id: str,
     contract_addresses: str,
     vs_currencies: str,
     current_user: db_models.User = Depends(get_current_user)
 ):
     cache_key = f"onchain_token_price_{platform_id}_{contract_addresses}_{vs_currencies}"
-    cached = get_cached_data(cache_key)
-    if cached:
-        return cached
-    
-    response = requests.get(f"{COINGECKO_BASE_URL}/onchain/simple/token_price/{platform_id}",
-                           params={"contract_addresses": contract_addresses, "vs_currencies": vs_currencies})
-    data = response.json()
-    set_cached_data(cache_key, data)
-    return data
+    return await cached_response(request, cache_key, f"/onchain/simple/token_price/{platform_id}",
+                                 params={"contract_addresses": contract_addresses, "vs_currencies": vs_currencies})
 
 @app.get("/global")
-async def global_market_data(current_user: db_models.User = Depends(get_current_user)):
+async def global_market_data(request: Request, current_user: db_models.User = Depends(get_current_user)):
     cache_key = "global_market_data"
-    cached = get_cached_data(cache_key)
-    if cached:
-        return cached
-    
-    response = requests.get(f"{COINGECKO_BASE_URL}/global")
-    data = response.json()
-    set_cached_data(cache_key, data)
-    return data
+    return await cached_response(request, cache_key, "/global")
+
+# Live price stream
+@app.websocket("/ws/prices")
+async def price_stream(websocket: WebSocket, token: str = Query(...)):
+    # Authenticate once up front; the connection then only talks to the hub
+    try:
+        await get_current_user(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await price_hub.serve(websocket)
 
 # Custom app routes
 @app.get("/user/watchlist")
-async def get_user_watchlist(
+def get_user_watchlist(
     current_user: db_models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -514,25 +1050,13 @@ async def get_user_watchlist(
     ]
 
 @app.post("/user/watchlist")
-async def add_to_watchlist(
+def add_to_watchlist(
     coin_id: str,
     coin_symbol: str,
     coin_name: str,
     current_user: db_models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    # Check if already in watchlist
-    existing = db.query(db_models.Watchlist).filter(
-        db_models.Watchlist.user_id == current_user.id,
-        db_models.Watchlist.coin_id == coin_id
-    ).first()
-    
-    if existing:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Coin already in watchlist"
-        )
-    
     watchlist_item = db_models.Watchlist(
         user_id=current_user.id,
         coin_id=coin_id,
@@ -540,7 +1064,15 @@ async def add_to_watchlist(
         coin_name=coin_name
     )
     db.add(watchlist_item)
-    db.commit()
+    # The (user_id, coin_id) unique index rejects duplicates without a prior SELECT
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Coin already in watchlist"
+        )
     db.refresh(watchlist_item)
     
     return {
@@ -554,26 +1086,134 @@ async def add_to_watchlist(
     }
 
 @app.delete("/user/watchlist/{coin_id}")
-async def remove_from_watchlist(
+def remove_from_watchlist(
     coin_id: str,
     current_user: db_models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    watchlist_item = db.query(db_models.Watchlist).filter(
+    removed = db.query(db_models.Watchlist).filter(
         db_models.Watchlist.user_id == current_user.id,
         db_models.Watchlist.coin_id == coin_id
-    ).first()
+    ).delete(synchronize_session=False)
     
-    if not watchlist_item:
+    if not removed:
         raise HTTPException(status_code=404, detail="Coin not found in watchlist")
     
-    db.delete(watchlist_item)
+    adjust_counter(db, "total_watchlists", -removed, current_user.id)
     db.commit()
     
     return {"message": "Removed from watchlist"}
 
+class WatchlistItemIn(BaseModel):
+    coin_id: str
+    coin_symbol: str = ""
+    coin_name: str = ""
+
+WATCHLIST_BULK_CHUNK = 200  # rows per INSERT; keeps SQLite under its bound-parameter limit
+
+def upsert_watchlist_items(db: Session, user_id: int, items: List[WatchlistItemIn]) -> int:
+    """Insert new items and refresh the symbol and name of listed ones in set-based statements; returns rows added"""
+    # Last occurrence wins when the same coin is listed twice
+    rows = list({
+        item.coin_id: {
+            "user_id": user_id,
+            "coin_id": item.coin_id,
+            "coin_symbol": item.coin_symbol,
+            "coin_name": item.coin_name
+        }
+        for item in items
+    }.values())
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        insert = None
+
+    table = db_models.Watchlist.__table__
+    added = 0
+    for start in range(0, len(rows), WATCHLIST_BULK_CHUNK):
+        chunk = rows[start:start + WATCHLIST_BULK_CHUNK]
+        # An upsert's rowcount counts updated rows too, so the new ones are counted up front
+        existing = {
+            coin_id for (coin_id,) in db.query(db_models.Watchlist.coin_id).filter(
+                db_models.Watchlist.user_id == user_id,
+                db_models.Watchlist.coin_id.in_([row["coin_id"] for row in chunk])
+            )
+        }
+        added += len(chunk) - len(existing)
+        if insert is not None:
+            statement = insert(table).values(chunk)
+            db.execute(statement.on_conflict_do_update(
+                index_elements=["user_id", "coin_id"],
+                set_={
+                    "coin_symbol": statement.excluded.coin_symbol,
+                    "coin_name": statement.excluded.coin_name,
+                },
+            ))
+            continue
+        new_rows = [row for row in chunk if row["coin_id"] not in existing]
+        if new_rows:
+            db.execute(table.insert(), new_rows)
+        changed = [
+            {"match_user_id": user_id, "match_coin_id": row["coin_id"],
+             "coin_symbol": row["coin_symbol"], "coin_name": row["coin_name"]}
+            for row in chunk if row["coin_id"] in existing
+        ]
+        if changed:
+            db.execute(
+                table.update()
+                .where(table.c.user_id == bindparam("match_user_id"), table.c.coin_id == bindparam("match_coin_id"))
+                .values(coin_symbol=bindparam("coin_symbol"), coin_name=bindparam("coin_name")),
+                changed,
+            )
+    return added
+
+@app.post("/user/watchlist/bulk")
+def bulk_add_to_watchlist(
+    items: List[WatchlistItemIn],
+    current_user: db_models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    added = upsert_watchlist_items(db, current_user.id, items)
+    adjust_counter(db, "total_watchlists", added, current_user.id)
+    db.commit()
+    return {"message": "Watchlist updated", "added": added}
+
+@app.put("/user/watchlist")
+def replace_watchlist(
+    items: List[WatchlistItemIn],
+    current_user: db_models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Delete what is no longer listed and add what is new, in one transaction
+    coin_ids = {item.coin_id for item in items}
+    removed_query = db.query(db_models.Watchlist).filter(db_models.Watchlist.user_id == current_user.id)
+    if coin_ids:
+        removed_query = removed_query.filter(db_models.Watchlist.coin_id.notin_(coin_ids))
+    removed = removed_query.delete(synchronize_session=False)
+    added = upsert_watchlist_items(db, current_user.id, items)
+    adjust_counter(db, "total_watchlists", added - removed, current_user.id)
+    db.commit()
+    return {"message": "Watchlist replaced", "added": added, "removed": removed}
+
+@app.delete("/user/watchlist")
+def bulk_remove_from_watchlist(
+    coin_ids: str,
+    current_user: db_models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    removed = db.query(db_models.Watchlist).filter(
+        db_models.Watchlist.user_id == current_user.id,
+        db_models.Watchlist.coin_id.in_([coin_id.strip() for coin_id in coin_ids.split(",") if coin_id.strip()])
+    ).delete(synchronize_session=False)
+    adjust_counter(db, "total_watchlists", -removed, current_user.id)
+    db.commit()
+    return {"message": "Removed from watchlist", "removed": removed}
+
 @app.get("/user/portfolio")
-async def get_user_portfolio(
+def get_user_portfolio(
     current_user: db_models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -591,8 +1231,31 @@ async def get_user_portfolio(
         for item in portfolio
     ]
 
+@app.get("/user/portfolio/valuation")
+async def get_portfolio_valuation(
+    currency: Optional[str] = None,
+    current_user: db_models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    currency = (currency or current_user.preferred_currency or "usd").lower()
+    rows = await run_in_threadpool(lambda: db.query(
+        db_models.Portfolio.id,
+        db_models.Portfolio.coin_id,
+        db_models.Portfolio.amount,
+        db_models.Portfolio.purchase_price,
+        db_models.Portfolio.purchase_currency
+    ).filter(db_models.Portfolio.user_id == current_user.id).all())
+    lot_ids, coin_ids, amounts, purchase_prices, purchase_currencies = (
+        [list(column) for column in zip(*rows)] if rows else ([], [], [], [], [])
+    )
+
+    # One batched price lookup covers every coin in the target and purchase currencies
+    currencies = {currency} | {(cur or currency).lower() for cur in purchase_currencies}
+    prices = await get_prices(sorted(set(coin_ids)), sorted(currencies)) if rows else {}
+    return value_portfolio(lot_ids, coin_ids, amounts, purchase_prices, purchase_currencies, prices, currency)
+
 @app.post("/user/portfolio")
-async def add_to_portfolio(
+def add_to_portfolio(
     coin_id: str,
     amount: float,
     purchase_price: float,
@@ -624,7 +1287,7 @@ async def add_to_portfolio(
     }
 
 @app.get("/user/alerts")
-async def get_user_alerts(
+def get_user_alerts(
     current_user: db_models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -658,9 +1321,13 @@ async def create_price_alert(
         is_above=is_above,
         currency=currency
     )
-    db.add(alert)
-    db.commit()
-    db.refresh(alert)
+    def save_alert():
+        db.add(alert)
+        db.commit()
+        db.refresh(alert)
+    await run_in_threadpool(save_alert)
+    # Index updates stay on the event loop, where the engine's ticks run
+    alert_engine.add(alert)
     
     return {
         "message": "Price alert created",
@@ -672,54 +1339,112 @@ async def create_price_alert(
         }
     }
     
-# Send OTP
-def send_otp_email(receiver_email: str, otp_code: str):
-    sender_email = "youremail@gmail.com"
-    sender_password = "your_app_password"  # use Gmail App Password (not your real password)
+# Password reset
+def hash_otp(user_id: int, otp: str) -> str:
+    # Keyed so a leaked table does not give the codes away to a 10^6 brute force
+    return hmac.new(SECRET_KEY.encode(), f"{user_id}:{otp}".encode(), hashlib.sha256).hexdigest()
 
-    msg = EmailMessage()
-    msg["Subject"] = "Your CheeseBall Password Reset OTP"
-    msg["From"] = sender_email
-    msg["To"] = receiver_email
-    msg.set_content(f"Your OTP code is: {otp_code}\n\nUse this to reset your password in the app.")
+def find_otp(db: Session, email: str, now: datetime) -> Optional[db_models.PasswordResetOTP]:
+    return db.query(db_models.PasswordResetOTP).filter(
+        db_models.PasswordResetOTP.email == email,
+        db_models.PasswordResetOTP.expires_at > now
+    ).first()
 
-    try:
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
-            smtp.login(sender_email, sender_password)
-            smtp.send_message(msg)
-    except Exception as e:
-        print("Error sending email:", e)
-        raise HTTPException(status_code=500, detail="Could not send OTP email")
+@app.post("/auth/forgot-password")
+async def forgot_password(email: str = Form(...), db: Session = Depends(get_db)):
+    if not mailer.can_send:
+        raise HTTPException(status_code=503, detail="Email delivery is not configured")
 
+    def issue_otp():
+        user = db.query(db_models.User).filter(db_models.User.email == email).first()
+        if not user:
+            raise HTTPException(status_code=404, detail="Email not found")
+        now = datetime.utcnow()
+        db.query(db_models.PasswordResetOTP).filter(
+            db_models.PasswordResetOTP.expires_at <= now
+        ).delete(synchronize_session=False)
+        record = db.query(db_models.PasswordResetOTP).filter(
+            db_models.PasswordResetOTP.user_id == user.id
+        ).first()
+        if record and record.created_at > now - timedelta(seconds=OTP_RESEND_SECONDS):
+            raise HTTPException(status_code=429, detail="An OTP was sent recently, please wait before requesting another")
+        if record is None:
+            record = db_models.PasswordResetOTP(user_id=user.id)
+            db.add(record)
+        otp = f"{secrets.randbelow(1000000):06d}"
+        record.email = user.email
+        record.code_hash = hash_otp(user.id, otp)
+        record.expires_at = now + timedelta(minutes=OTP_TTL_MINUTES)
+        record.attempts = 0
+        record.verified_at = None
+        record.created_at = now
+        db.commit()
+        return otp
 
-@app.post("/auth/forgot-password")
-async def forgot_password(email: str = Form(...)):
-    # Check if user exists
-    if email not in users_db:
-        raise HTTPException(status_code=404, detail="Email not found")
-
-    otp = str(random.randint(100000, 999999))
-    users_db[email]["otp"] = otp
-    send_otp_email(email, otp)
+    otp = await run_in_threadpool(issue_otp)
+    try:
+        mailer.send(mailer.message(
+            email,
+            "Your CheeseBall Password Reset OTP",
+            f"Your OTP code is: {otp}\n\nUse this to reset your password in the app. "
+            f"It expires in {OTP_TTL_MINUTES} minutes."
+        ))
+    except MailQueueFull:
+        raise HTTPException(status_code=503, detail="Could not send OTP email, try again shortly")
     return {"message": "OTP sent successfully"}
 
 
 @app.post("/auth/verify-otp")
-async def verify_otp(email: str = Form(...), otp: str = Form(...)):
-    user = users_db.get(email)
-    if not user or user.get("otp") != otp:
+async def verify_otp(email: str = Form(...), otp: str = Form(...), db: Session = Depends(get_db)):
+    def check_otp():
+        now = datetime.utcnow()
+        record = find_otp(db, email, now)
+        if not record:
+            return False
+        # Count the attempt atomically so parallel guesses cannot exceed the limit
+        counted = db.query(db_models.PasswordResetOTP).filter(
+            db_models.PasswordResetOTP.id == record.id,
+            db_models.PasswordResetOTP.attempts < OTP_MAX_ATTEMPTS
+        ).update({db_models.PasswordResetOTP.attempts: db_models.PasswordResetOTP.attempts + 1},
+                 synchronize_session=False)
+        valid = bool(counted) and hmac.compare_digest(record.code_hash, hash_otp(record.user_id, otp))
+        if valid:
+            record.verified_at = now
+        db.commit()
+        return valid
+
+    if not await run_in_threadpool(check_otp):
         raise HTTPException(status_code=400, detail="Invalid OTP")
     return {"message": "OTP verified"}
 
 
 @app.post("/auth/reset-password")
-async def reset_password(email: str = Form(...), new_password: str = Form(...)):
-    if email not in users_db:
-        raise HTTPException(status_code=404, detail="User not found")
-    hashed_pw = pwd_context.hash(new_password)
-    users_db[email]["password"] = hashed_pw
-    users_db[email].pop("otp", None)
-    return {"message": "Password reset successfully"}    
+async def reset_password(email: str = Form(...), new_password: str = Form(...), db: Session = Depends(get_db)):
+    record = await run_in_threadpool(find_otp, db, email, datetime.utcnow())
+    if not record or record.verified_at is None:
+        raise HTTPException(status_code=400, detail="OTP not verified")
+    record_id, user_id = record.id, record.user_id
+    hashed_pw = await password_hasher.hash(new_password)
+
+    def apply_reset():
+        # Deleting the code first makes it single use even if two resets race
+        consumed = db.query(db_models.PasswordResetOTP).filter(
+            db_models.PasswordResetOTP.id == record_id
+        ).delete(synchronize_session=False)
+        user = db.query(db_models.User).filter(db_models.User.id == user_id).first()
+        if not consumed or not user:
+            db.rollback()
+            return None
+        user.hashed_password = hashed_pw
+        adjust_counter(db.connection(), AUTH_GENERATION, 1)
+        db.commit()
+        return user.username
+
+    username = await run_in_threadpool(apply_reset)
+    if username is None:
+        raise HTTPException(status_code=400, detail="OTP not verified")
+    auth_cache.invalidate_user(user_id=user_id, username=username)
+    return {"message": "Password reset successfully"}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,286 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from fastapi import HTTPException
+
+from cache import CacheEntry, encode_json
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+PER_PAGE = 250  # largest page /coins/markets serves
+ORDERS = ("market_cap_desc", "market_cap_asc", "volume_desc", "volume_asc", "id_asc", "id_desc")
+# Every window CoinGecko can add as price_change_percentage_{window}_in_currency
+PRICE_CHANGE_WINDOWS = ("1h", "24h", "7d", "14d", "30d", "200d", "1y")
+
+
+class MarketUniverse:
+    """In-memory table of /coins/markets rows that answers market list requests locally.
+
+    A background task pulls the top ``pages`` x 250 coins every ``interval``
+    seconds in the base currency, with sparklines and every price change
+    window. The rows are kept as-is next to numpy columns for the sortable
+    fields, an id -> row index and one precomputed permutation per ``order``,
+    so any order, ``ids`` subset or page is a mask and a slice. Category
+    membership is fetched once per category (up to ``max_pages_per_category``
+    pages) and kept ``category_ttl`` seconds; its rows are merged into the
+    table, so small caps outside the top pages are covered too (such
+    categories are refetched after ``max_age`` seconds, as only that fetch
+    updates their prices).
+
+    Only a selection the table holds in full can be answered in any order
+    and at any page: an ``ids`` list, a category whose last page came back
+    short, or the whole market when it fits in ``pages``. Otherwise the
+    table only has the top of the selection, so it answers
+    ``market_cap_desc`` pages that end inside the loaded rows.
+
+    ``markets`` returns None whenever it cannot answer exactly (no fresh
+    snapshot, an id outside the loaded rows, an order or page beyond them,
+    a category that failed to load or hit the page cap); callers then ask
+    upstream.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[dict], Awaitable[list]],
+        pages: int = 4,
+        interval: float = 60,
+        max_age: float = 300,
+        category_ttl: float = 3600,
+        max_categories: int = 200,
+        max_pages_per_category: int = 4,
+        max_responses: int = 256,
+    ):
+        self.fetch = fetch
+        self.pages = pages
+        self.interval = interval
+        self.max_age = max_age
+        self.category_ttl = category_ttl
+        self.max_categories = max_categories
+        self.max_pages_per_category = max_pages_per_category
+        self.max_responses = max_responses
+
+        self._rows: Dict[str, dict] = {}
+        self._ids = np.array([], dtype=object)
+        self._index: Dict[str, int] = {}
+        self._orders: Dict[str, np.ndarray] = {}
+        # category -> (fetched_at, member ids, capped: more members than were fetched)
+        self._categories: "OrderedDict[str, tuple]" = OrderedDict()
+        self._category_rows: Dict[str, np.ndarray] = {}
+        self._top_ids: set = set()
+        self._top_mask = np.zeros(0, dtype=bool)
+        self._complete = False  # the top pages hold every coin
+        # request params -> (version, rates version, entry)
+        self._responses: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._inflight = SingleFlight()
+        self.fetched_at: Optional[float] = None
+        self.version = 0
+        self.refreshes = 0
+        self.served = 0
+        self.reused = 0
+        self.fallbacks = 0
+
+    @property
+    def is_ready(self) -> bool:
+        return self.fetched_at is not None and time.time() - self.fetched_at <= self.max_age
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Market universe refresh failed")
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self):
+        rows = []
+        for page in range(1, self.pages + 1):
+            fetched = await self.fetch({"order": "market_cap_desc", "per_page": PER_PAGE, "page": page})
+            rows.extend(fetched)
+            if len(fetched) < PER_PAGE:
+                break
+        self._complete = len(rows) < self.pages * PER_PAGE
+        self._top_ids = {row["id"] for row in rows}
+        # Rows outside the top pages are kept only while a cached category needs them
+        members = {coin_id for _, category_ids, _ in self._categories.values() for coin_id in category_ids}
+        kept = {coin_id: row for coin_id, row in self._rows.items() if coin_id in members}
+        self._rebuild({**kept, **{row["id"]: row for row in rows}})
+        self.fetched_at = time.time()
+        self.refreshes += 1
+
+    async def _load_category(self, category: str):
+        ids, rows = [], []
+        capped = True
+        for page in range(1, self.max_pages_per_category + 1):
+            fetched = await self.fetch({"category": category, "order": "market_cap_desc",
+                                        "per_page": PER_PAGE, "page": page})
+            rows.extend(fetched)
+            ids.extend(row["id"] for row in fetched)
+            if len(fetched) < PER_PAGE:
+                capped = False
+                break
+        if capped:
+            # Remembered for category_ttl so it isn't refetched on every request
+            logger.info("Category %s has more than %d coins; leaving it to upstream", category, len(ids))
+            ids, rows = [], []
+        self._categories[category] = (time.time(), ids, capped)
+        self._categories.move_to_end(category)
+        self._category_rows.pop(category, None)
+        while len(self._categories) > self.max_categories:
+            self._categories.popitem(last=False)
+        if rows:
+            self._rebuild({**self._rows, **{row["id"]: row for row in rows}})
+
+    def _rebuild(self, rows: Dict[str, dict]):
+        ids = np.array(list(rows), dtype=object)
+        market_caps = np.array([row.get("market_cap") for row in rows.values()], dtype=float)
+        volumes = np.array([row.get("total_volume") for row in rows.values()], dtype=float)
+        by_id = np.argsort(ids.astype(str), kind="stable")
+        orders = {"id_asc": by_id, "id_desc": by_id[::-1]}
+        for name, column in (("market_cap", market_caps), ("volume", volumes)):
+            # Unknown values sort last in descending order, ties broken by id
+            key = np.where(np.isnan(column), -np.inf, column)
+            descending = by_id[np.argsort(-key[by_id], kind="stable")]
+            orders[f"{name}_desc"] = descending
+            orders[f"{name}_asc"] = descending[::-1]
+        self._rows = rows
+        self._ids = ids
+        self._index = {coin_id: position for position, coin_id in enumerate(ids.tolist())}
+        self._top_mask = np.array([coin_id in self._top_ids for coin_id in ids.tolist()], dtype=bool)
+        self._orders = orders
+        self._category_rows = {}
+        self.version += 1
+
+    def _positions(self, coin_ids: Sequence[str], top_only: bool = False) -> Optional[np.ndarray]:
+        positions = [self._index.get(coin_id) for coin_id in coin_ids]
+        if any(position is None for position in positions):
+            return None
+        positions = np.array(positions, dtype=np.int64)
+        # Rows outside the top pages are only as fresh as their category fetch
+        if top_only and not self._top_mask[positions].all():
+            return None
+        return positions
+
+    def _category_is_current(self, category: str) -> bool:
+        cached = self._categories.get(category)
+        if cached is None:
+            return False
+        age = time.time() - cached[0]
+        # Members outside the top pages only get new prices from their category fetch
+        return age <= self.category_ttl and (age <= self.max_age or self._top_ids.issuperset(cached[1]))
+
+    async def _category_positions(self, category: str) -> Optional[np.ndarray]:
+        if not self._category_is_current(category):
+            try:
+                await self._inflight.do(category, lambda: self._load_category(category))
+            except HTTPException:
+                return None
+        cached = self._categories.get(category)
+        if cached is None or cached[2]:
+            return None
+        positions = self._category_rows.get(category)
+        if positions is None:
+            positions = self._positions(cached[1])
+            if positions is not None:
+                self._category_rows[category] = positions
+        return positions
+
+    async def markets(
+        self,
+        ids: Optional[List[str]],
+        category: Optional[str],
+        order: str,
+        per_page: int,
+        page: int,
+        sparkline: bool,
+        price_change_percentage: str,
+        currency: str,
+        factor: float,
+        rates_version: int,
+        convert: Callable[[list, float], list],
+    ) -> Optional[CacheEntry]:
+        """A /coins/markets response as a cache entry, or None when upstream must answer"""
+        if not self.is_ready or order not in ORDERS or not 1 <= per_page <= PER_PAGE or page < 1:
+            self.fallbacks += 1
+            return None
+        windows = [window.strip() for window in price_change_percentage.split(",") if window.strip()]
+        if any(window not in PRICE_CHANGE_WINDOWS for window in windows):
+            self.fallbacks += 1
+            return None
+
+        key = (tuple(ids) if ids else None, category, order, per_page, page, sparkline, tuple(windows), currency)
+        memo = self._responses.get(key)
+        if memo is not None and memo[0] == self.version and memo[1] == rates_version:
+            self._responses.move_to_end(key)
+            self.reused += 1
+            return memo[2]
+
+        # Without ids or a category the selection is the top pages, which hold
+        # only the top of the market unless the whole market fits in them
+        complete = bool(ids) or bool(category) or self._complete
+        if order != "market_cap_desc" and not complete:
+            self.fallbacks += 1
+            return None
+
+        permutation = self._orders[order]
+        selected = []
+        for subset in ([self._positions(ids, top_only=not category)] if ids else []) + (
+            [await self._category_positions(category)] if category else []
+        ):
+            if subset is None:
+                self.fallbacks += 1
+                return None
+            selected.append(subset)
+        if selected:
+            mask = np.ones(len(self._ids), dtype=bool)
+            for subset in selected:
+                subset_mask = np.zeros(len(self._ids), dtype=bool)
+                subset_mask[subset] = True
+                mask &= subset_mask
+        else:
+            mask = self._top_mask
+        permutation = permutation[mask[permutation]]
+
+        start = (page - 1) * per_page
+        if not complete and start + per_page > len(permutation):
+            # The page reaches past the loaded rows into coins only upstream knows
+            self.fallbacks += 1
+            return None
+        ids_in_page = self._ids[permutation[start:start + per_page]].tolist()
+        drop = {f"price_change_percentage_{window}_in_currency"
+                for window in PRICE_CHANGE_WINDOWS if window not in windows}
+        if not sparkline:
+            drop.add("sparkline_in_7d")
+        rows = [
+            {field: value for field, value in self._rows[coin_id].items() if field not in drop}
+            for coin_id in ids_in_page
+        ]
+        if factor != 1.0:
+            rows = convert(rows, factor)
+
+        body = encode_json(rows)
+        entry = CacheEntry(rows, self.fetched_at, self.interval, len(body or b""), body=body)
+        self.served += 1
+        self._responses[key] = (self.version, rates_version, entry)
+        self._responses.move_to_end(key)
+        while len(self._responses) > self.max_responses:
+            self._responses.popitem(last=False)
+        return entry
+
+    def stats(self) -> dict:
+        return {
+            "coins": len(self._ids),
+            "age": round(time.time() - self.fetched_at, 1) if self.fetched_at else None,
+            "version": self.version,
+            "categories": len(self._categories),
+            "refreshes": self.refreshes,
+            "served": self.served,
+            "reused": self.reused,
+            "fallbacks": self.fallbacks,
+        }
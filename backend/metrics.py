@@ -0,0 +1,366 @@
+import asyncio
+import contextvars
+import logging
+import re
+import sys
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from collections import Counter as TallyCounter, deque
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter per label set, rendered in the Prometheus text format"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            snapshot = [(labels, list(series[0]), series[1], series[2]) for labels, series in self._series.items()]
+        for labels, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {count}"
+
+
+class Registry:
+    """Holds the metrics and collectors rendered by /metrics.
+
+    Collectors are callables returning (name, kind, help, [(labels dict,
+    value)]) tuples, evaluated on every scrape for values that already live
+    elsewhere (cache and upstream stats).
+    """
+
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Callable[[], Iterable[tuple]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[tuple]]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception:
+                logger.exception("Metrics collector failed")
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(list(labels), list(labels.values()))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class RequestStats:
+    """Per-request tallies; shared by reference with threadpool work via a contextvar"""
+
+    __slots__ = ("db_queries", "db_seconds")
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+
+
+current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "current_request", default=None
+)
+
+registry = Registry()
+http_requests = registry.register(Counter(
+    "cheeseball_http_requests_total", "HTTP requests by route and status", ("method", "route", "status")))
+http_latency = registry.register(Histogram(
+    "cheeseball_http_request_duration_seconds", "HTTP request latency by route", ("method", "route")))
+http_db_queries = registry.register(Histogram(
+    "cheeseball_http_request_db_queries", "Database queries issued per request", ("route",), QUERY_COUNT_BUCKETS))
+http_db_time = registry.register(Histogram(
+    "cheeseball_http_request_db_seconds", "Database time spent per request", ("route",), LATENCY_BUCKETS))
+db_queries = registry.register(Histogram(
+    "cheeseball_db_query_duration_seconds", "Duration of individual database queries", (), DB_QUERY_BUCKETS))
+upstream_requests = registry.register(Counter(
+    "cheeseball_upstream_requests_total", "CoinGecko calls by endpoint and outcome", ("endpoint", "outcome")))
+upstream_latency = registry.register(Histogram(
+    "cheeseball_upstream_request_duration_seconds", "CoinGecko call latency by endpoint", ("endpoint",)))
+loop_lag = registry.register(Histogram(
+    "cheeseball_event_loop_lag_seconds", "How late the event loop ran a periodic timer", (), LOOP_LAG_BUCKETS))
+
+# Upstream paths with ids in them, collapsed to one label value per endpoint
+UPSTREAM_ENDPOINTS = [
+    (re.compile(r"^/coins/[^/]+/contract/[^/]+/market_chart$"), "/coins/{platform}/contract/{address}/market_chart"),
+    (re.compile(r"^/coins/[^/]+/market_chart/range$"), "/coins/{id}/market_chart/range"),
+    (re.compile(r"^/coins/[^/]+/market_chart$"), "/coins/{id}/market_chart"),
+    (re.compile(r"^/coins/[^/]+/(ohlc|tickers)$"), r"/coins/{id}/\1"),
+    (re.compile(r"^/onchain/simple/token_price/[^/]+$"), "/onchain/simple/token_price/{platform}"),
+    (re.compile(r"^/simple/token_price/[^/]+$"), "/simple/token_price/{platform}"),
+    (re.compile(r"^/coins/(?!list$|markets$|categories$)[^/]+$"), "/coins/{id}"),
+]
+
+
+def upstream_endpoint(path: str) -> str:
+    for pattern, template in UPSTREAM_ENDPOINTS:
+        if pattern.match(path):
+            return pattern.sub(template, path)
+    return path
+
+
+def observe_upstream(path: str, outcome: str, seconds: float):
+    """UpstreamClient.observer: count and time every CoinGecko attempt"""
+    endpoint = upstream_endpoint(path)
+    upstream_requests.inc(endpoint, outcome)
+    upstream_latency.observe(seconds, endpoint)
+
+
+def instrument_engine(engine):
+    """Time every SQL statement and charge it to the request being served"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def started(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def finished(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        db_queries.observe(elapsed)
+        stats = current_request.get()
+        if stats is not None:
+            stats.db_queries += 1
+            stats.db_seconds += elapsed
+
+
+class SlowRequestSampler:
+    """Samples the event loop's stack while a request runs longer than ``threshold``.
+
+    A daemon thread wakes every ``interval`` seconds and, only while some
+    request has been in flight longer than the threshold, records where the
+    event loop thread is. The stacks show what is holding the loop (the slow
+    request itself or whatever blocks it). The hottest stacks of each slow
+    request are logged and kept in ``recent``.
+    """
+
+    def __init__(self, threshold: float, interval: float = 0.01, keep: int = 50, depth: int = 12):
+        self.threshold = threshold
+        self.interval = interval
+        self.depth = depth
+        self.recent: deque = deque(maxlen=keep)
+        self._inflight: Dict[int, Tuple[float, TallyCounter]] = {}
+        self._loop_thread: Optional[int] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._ids = iter(range(1, sys.maxsize))
+
+    def start(self):
+        self._loop_thread = threading.get_ident()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="slow-request-sampler", daemon=True)
+            self._thread.start()
+
+    def begin(self) -> int:
+        request_id = next(self._ids)
+        with self._lock:
+            self._inflight[request_id] = (time.perf_counter(), TallyCounter())
+        return request_id
+
+    def end(self, request_id: int, method: str, route: str, status: str, elapsed: float, stats: RequestStats):
+        with self._lock:
+            _, stacks = self._inflight.pop(request_id, (0, TallyCounter()))
+        if elapsed < self.threshold:
+            return
+        record = {
+            "at": time.time(),
+            "method": method,
+            "route": route,
+            "status": status,
+            "seconds": round(elapsed, 4),
+            "db_queries": stats.db_queries,
+            "db_seconds": round(stats.db_seconds, 4),
+            "loop_stacks": [{"samples": count, "stack": stack} for stack, count in stacks.most_common(5)],
+        }
+        self.recent.append(record)
+        logger.warning("Slow request %s %s took %.3fs (%d queries, %.3fs in DB)",
+                       method, route, elapsed, stats.db_queries, stats.db_seconds)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            with self._lock:
+                slow = [stacks for started, stacks in self._inflight.values() if now - started >= self.threshold]
+            if not slow or self._loop_thread is None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = " <- ".join(
+                f"{entry.name} ({entry.filename.rsplit('/', 1)[-1]}:{entry.lineno})"
+                for entry in reversed(traceback.extract_stack(frame, limit=self.depth))
+            )
+            with self._lock:
+                for stacks in slow:
+                    stacks[stack] += 1
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware timing every HTTP request by its route template"""
+
+    def __init__(self, app, sampler: Optional[SlowRequestSampler] = None):
+        self.app = app
+        self.sampler = sampler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = ["500"]
+        request_id = self.sampler.begin() if self.sampler is not None else None
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+            route = scope.get("route")
+            # Unmatched paths share one label so scanners cannot blow up cardinality
+            route_name = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            http_requests.inc(method, route_name, status[0])
+            http_latency.observe(elapsed, method, route_name)
+            http_db_queries.observe(stats.db_queries, route_name)
+            http_db_time.observe(stats.db_seconds, route_name)
+            if request_id is not None:
+                self.sampler.end(request_id, method, route_name, status[0], elapsed, stats)
+
+
+async def monitor_loop_lag(interval: float = 0.5):
+    """Record how late a periodic timer fires; sustained lag means blocking work on the loop"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        loop_lag.observe(max(0.0, loop.time() - expected))
+
+
+def cache_collector(cache):
+    """Per key-family cache counters, read from ``cache.stats()`` at scrape time"""
+    def collect():
+        stats = cache.stats()
+        families = stats["families"]
+        for field, kind, help_text in (
+            ("hits", "counter", "Fresh cache hits by key family"),
+            ("stale_hits", "counter", "Stale entries served while refreshing, by key family"),
+            ("misses", "counter", "Cache misses by key family"),
+            ("evictions", "counter", "Entries evicted for space, by key family"),
+            ("entries", "gauge", "Entries currently cached, by key family"),
+        ):
+            suffix = "_total" if kind == "counter" else ""
+            yield (f"cheeseball_cache_{field}{suffix}", kind, help_text,
+                   [({"family": family}, counts.get(field, 0)) for family, counts in families.items()])
+        yield ("cheeseball_cache_bytes", "gauge", "Approximate bytes held by the cache", [({}, stats["bytes"])])
+    return collect
+
+
+def upstream_collector(client):
+    """Rate limiter and circuit breaker state of an UpstreamClient"""
+    def collect():
+        stats = client.stats()
+        states = ("closed", "open", "half_open")
+        yield ("cheeseball_upstream_breaker_state", "gauge", "1 for the circuit breaker's current state",
+               [({"state": state}, int(stats["breaker"]["state"] == state)) for state in states])
+        yield ("cheeseball_upstream_rate_tokens", "gauge", "Rate limit tokens available",
+               [({}, stats["limiter"]["tokens"])])
+        yield ("cheeseball_upstream_rate_waiting", "gauge", "Calls waiting for a rate limit token",
+               [({}, stats["limiter"]["waiting"])])
+        yield ("cheeseball_upstream_retries_total", "counter", "Upstream attempts that were retried",
+               [({}, stats["retries"])])
+    return collect
@@ -1,7 +1,10 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Text
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Text, Index, inspect, text
 from sqlalchemy.sql import func
 from database import Base
 import datetime
+import logging
+
+logger = logging.getLogger(__name__)
 
 class User(Base):
     __tablename__ = "users"
@@ -17,6 +20,10 @@ class User(Base):
 
 class Watchlist(Base):
     __tablename__ = "watchlists"
+    # One row per (user, coin); backs the set-based bulk upserts and deletes
+    __table_args__ = (
+        Index("uq_watchlists_user_coin", "user_id", "coin_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, index=True)
@@ -25,6 +32,35 @@ class Watchlist(Base):
     coin_name = Column(String(100))
     created_at = Column(DateTime, default=func.now())
 
+def ensure_watchlist_unique_index(engine):
+    """create_all() skips existing tables, so add the unique index to older databases.
+
+    Runs only while the index is missing: duplicates created before it
+    existed are removed first, keeping the oldest row of each, and logged.
+    Returns the number of rows removed.
+    """
+    with engine.begin() as connection:
+        present = {index["name"] for index in inspect(connection).get_indexes(Watchlist.__tablename__)}
+        missing = [index for index in Watchlist.__table__.indexes if index.name not in present]
+        if not missing:
+            return 0
+        duplicates = connection.execute(text(
+            "SELECT id, user_id, coin_id FROM watchlists WHERE id NOT IN "
+            "(SELECT MIN(id) FROM watchlists GROUP BY user_id, coin_id)"
+        )).fetchall()
+        if duplicates:
+            connection.execute(text(
+                "DELETE FROM watchlists WHERE id NOT IN "
+                "(SELECT MIN(id) FROM watchlists GROUP BY user_id, coin_id)"
+            ))
+            logger.warning(
+                "Removed %d duplicate watchlist rows before adding the unique index (id, user_id, coin_id): %s",
+                len(duplicates), [tuple(row) for row in duplicates],
+            )
+        for index in missing:
+            index.create(bind=connection, checkfirst=True)
+    return len(duplicates)
+
 class Portfolio(Base):
     __tablename__ = "portfolios"
     
@@ -47,4 +83,27 @@ class PriceAlert(Base):
     currency = Column(String(10), default="usd")
     is_above = Column(Boolean, default=True)
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime, default=func.now())
+
+class StatCounter(Base):
+    """Row counts kept up to date on every insert/delete, for O(1) admin statistics"""
+    __tablename__ = "stat_counters"
+    
+    name = Column(String(50), primary_key=True)
+    value = Column(Integer, default=0, nullable=False)
+
+class PasswordResetOTP(Base):
+    """The outstanding password reset code of a user; only a keyed hash of the code is stored"""
+    __tablename__ = "password_reset_otps"
+    __table_args__ = (
+        Index("ix_password_reset_otps_email_expires", "email", "expires_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, unique=True, index=True)  # a new code replaces the previous one
+    email = Column(String(255))
+    code_hash = Column(String(64))
+    expires_at = Column(DateTime, index=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    verified_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=func.now())
@@ -0,0 +1,123 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+Pair = Tuple[str, str]
+
+
+def split_ids(value: str) -> List[str]:
+    """Canonicalize a comma separated id list: trimmed, lower-cased, de-duplicated"""
+    seen = {}
+    for item in value.split(","):
+        item = item.strip().lower()
+        if item:
+            seen.setdefault(item, None)
+    return list(seen)
+
+
+class PriceBatcher:
+    """Per-(coin, currency) price cache with micro-batched upstream fetches.
+
+    Each price is cached under its own ``simple_price_{coin}_{currency}``
+    key, so requests that differ in order or overlap partially share
+    entries. Misses from all concurrent requests are queued for ``window``
+    seconds and then fetched together, ``max_ids`` coins per upstream call.
+    Stale entries are served immediately and queued for refresh.
+    """
+
+    def __init__(
+        self,
+        cache,
+        fetch: Callable[[List[str], List[str]], Awaitable[dict]],
+        window: float = 0.02,
+        max_ids: int = 200,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.cache = cache
+        self.fetch = fetch
+        self.window = window
+        self.max_ids = max_ids
+        self.clock = clock
+        self.batches = 0
+        self._futures: Dict[Pair, asyncio.Future] = {}
+        self._queued: List[Pair] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    @staticmethod
+    def cache_key(coin_id: str, currency: str) -> str:
+        return f"simple_price_{coin_id}_{currency}"
+
+    async def get_prices(self, coin_ids: Iterable[str], currencies: Iterable[str]) -> dict:
+        """Return prices shaped like CoinGecko's /simple/price response"""
+        currencies = list(currencies)
+        result: Dict[str, Dict[str, float]] = {}
+        waiting: List[Tuple[Pair, asyncio.Future]] = []
+        pairs = [(coin_id, currency) for coin_id in coin_ids for currency in currencies]
+        entries = await self.cache.aget_entries([self.cache_key(*pair) for pair in pairs])
+        now = self.clock()
+        for pair, entry in zip(pairs, entries):
+            coin_id, currency = pair
+            if entry is None:
+                waiting.append((pair, self._request(pair)))
+                continue
+            if not entry.is_fresh(now):
+                self._request(pair)
+            if entry.value is not None:
+                result.setdefault(coin_id, {})[currency] = entry.value
+
+        if waiting:
+            # Shield the shared futures so one cancelled request doesn't fail the others
+            prices = await asyncio.gather(*(asyncio.shield(future) for _, future in waiting))
+            for (coin_id, currency), price in zip([pair for pair, _ in waiting], prices):
+                if price is not None:
+                    result.setdefault(coin_id, {})[currency] = price
+        return result
+
+    def _request(self, pair: Pair) -> asyncio.Future:
+        future = self._futures.get(pair)
+        if future is not None:
+            return future
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        # Background refreshes have no awaiter; don't warn about their errors
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._futures[pair] = future
+        self._queued.append(pair)
+        if len({coin_id for coin_id, _ in self._queued}) >= self.max_ids:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        queued, self._queued = self._queued, []
+        if not queued:
+            return
+        coin_ids = sorted({coin_id for coin_id, _ in queued})
+        currencies = sorted({currency for _, currency in queued})
+        for start in range(0, len(coin_ids), self.max_ids):
+            chunk = coin_ids[start:start + self.max_ids]
+            asyncio.ensure_future(self._fetch_batch(chunk, currencies))
+
+    async def _fetch_batch(self, coin_ids: List[str], currencies: List[str]):
+        self.batches += 1
+        pairs = [(coin_id, currency) for coin_id in coin_ids for currency in currencies]
+        try:
+            data = await self.fetch(coin_ids, currencies)
+        except Exception as exc:
+            for pair in pairs:
+                future = self._futures.pop(pair, None)
+                if future is not None and not future.done():
+                    future.set_exception(exc)
+            return
+
+        prices = {pair: (data.get(pair[0]) or {}).get(pair[1]) for pair in pairs}
+        # Unknown pairs are cached as None so they aren't refetched every request
+        await self.cache.aset_many({self.cache_key(*pair): price for pair, price in prices.items()})
+        for (coin_id, currency), price in prices.items():
+            future = self._futures.pop((coin_id, currency), None)
+            if future is not None and not future.done():
+                future.set_result(price)
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Set, Tuple
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from price_batcher import split_ids
+
+logger = logging.getLogger(__name__)
+
+Pair = Tuple[str, str]
+
+
+class Subscriber:
+    __slots__ = ("websocket", "pairs", "pending", "ready")
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.pairs: Set[Pair] = set()
+        # Latest unsent price per pair; newer values overwrite older ones
+        self.pending: Dict[str, Dict[str, float]] = {}
+        self.ready = asyncio.Event()
+
+    def push(self, coin_id: str, currency: str, price: float):
+        self.pending.setdefault(coin_id, {})[currency] = price
+        self.ready.set()
+
+
+class PriceStreamHub:
+    """Fan out live prices to WebSocket subscribers from one shared poller.
+
+    Clients send ``{"action": "subscribe", "ids": "...", "vs_currencies": "..."}``
+    (or ``"unsubscribe"``). The poller fetches the union of every
+    subscription each ``interval`` seconds and pushes only prices that
+    changed. Each subscriber has its own sender task and a pending map that
+    keeps just the newest price per pair, so a slow client receives fewer,
+    merged updates instead of an unbounded backlog. A client that cannot
+    take a message within ``send_timeout`` seconds is disconnected.
+    """
+
+    def __init__(
+        self,
+        get_prices: Callable[[List[str], List[str]], Awaitable[dict]],
+        interval: float = 5,
+        send_timeout: float = 10,
+        max_pairs: int = 500,
+    ):
+        self.get_prices = get_prices
+        self.interval = interval
+        self.send_timeout = send_timeout
+        self.max_pairs = max_pairs
+        self._subscribers: Set[Subscriber] = set()
+        self._last: Dict[Pair, float] = {}
+        self._wakeup = asyncio.Event()
+        self.polls = 0
+        self.messages_sent = 0
+
+    def watched_pairs(self) -> Set[Pair]:
+        pairs: Set[Pair] = set()
+        for subscriber in self._subscribers:
+            pairs |= subscriber.pairs
+        return pairs
+
+    async def run(self):
+        while True:
+            try:
+                await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Price stream poll failed")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def poll(self):
+        pairs = self.watched_pairs()
+        # Forget prices nobody watches any more so a resubscribe gets a fresh snapshot
+        self._last = {pair: price for pair, price in self._last.items() if pair in pairs}
+        if not pairs:
+            return
+
+        by_currency: Dict[str, List[str]] = {}
+        for coin_id, currency in pairs:
+            by_currency.setdefault(currency, []).append(coin_id)
+        results = await asyncio.gather(
+            *(self.get_prices(coin_ids, [currency]) for currency, coin_ids in by_currency.items()),
+            return_exceptions=True,
+        )
+        self.polls += 1
+
+        changed: Dict[Pair, float] = {}
+        for currency, prices in zip(by_currency, results):
+            if isinstance(prices, BaseException):
+                logger.warning("Price stream fetch failed: %s", prices)
+                continue
+            for coin_id, quotes in prices.items():
+                price = quotes.get(currency)
+                pair = (coin_id, currency)
+                if price is not None and self._last.get(pair) != price:
+                    self._last[pair] = price
+                    changed[pair] = price
+
+        if changed:
+            for subscriber in self._subscribers:
+                for pair in subscriber.pairs & changed.keys():
+                    subscriber.push(pair[0], pair[1], changed[pair])
+
+    async def serve(self, websocket: WebSocket):
+        await websocket.accept()
+        subscriber = Subscriber(websocket)
+        self._subscribers.add(subscriber)
+        sender = asyncio.ensure_future(self._send_loop(subscriber))
+        try:
+            while True:
+                try:
+                    message = await websocket.receive_json()
+                except ValueError:
+                    await websocket.send_json({"type": "error", "detail": "Invalid JSON"})
+                    continue
+                error = self._handle(subscriber, message)
+                if error:
+                    await websocket.send_json({"type": "error", "detail": error})
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self._subscribers.discard(subscriber)
+            sender.cancel()
+
+    def _handle(self, subscriber: Subscriber, message) -> str:
+        if not isinstance(message, dict):
+            return "Expected a JSON object"
+        action = message.get("action")
+        pairs = {
+            (coin_id, currency)
+            for coin_id in split_ids(str(message.get("ids", "")))
+            for currency in split_ids(str(message.get("vs_currencies", "usd")))
+        }
+        if action == "subscribe":
+            if len(subscriber.pairs | pairs) > self.max_pairs:
+                return f"At most {self.max_pairs} coin/currency pairs per connection"
+            new_pairs = pairs - subscriber.pairs
+            subscriber.pairs |= pairs
+            # Send what we already know right away; unknown pairs come with the next poll
+            for coin_id, currency in new_pairs:
+                price = self._last.get((coin_id, currency))
+                if price is not None:
+                    subscriber.push(coin_id, currency, price)
+            if any(pair not in self._last for pair in new_pairs):
+                self._wakeup.set()
+        elif action == "unsubscribe":
+            subscriber.pairs -= pairs
+        else:
+            return "Unknown action; use 'subscribe' or 'unsubscribe'"
+        return ""
+
+    async def _send_loop(self, subscriber: Subscriber):
+        websocket = subscriber.websocket
+        while True:
+            await subscriber.ready.wait()
+            subscriber.ready.clear()
+            update, subscriber.pending = subscriber.pending, {}
+            if not update:
+                continue
+            try:
+                await asyncio.wait_for(
+                    websocket.send_json({"type": "prices", "data": update, "ts": time.time()}),
+                    self.send_timeout,
+                )
+            except asyncio.TimeoutError:
+                # 1013: try again later
+                await websocket.close(code=1013)
+                return
+            except Exception:
+                return
+            self.messages_sent += 1
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "watched_pairs": len(self.watched_pairs()),
+            "polls": self.polls,
+            "messages_sent": self.messages_sent,
+            "interval": self.interval,
+        }
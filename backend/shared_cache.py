@@ -0,0 +1,317 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from cache import CacheEntry, TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class SharedCache(TTLCache):
+    """Cache backend shared by every worker process on a host.
+
+    Entries live in a SQLite database in WAL mode, so readers never block
+    each other and one writer at a time can refill a key. ``try_lock`` takes
+    a short lease row in the same database, giving workers a cross-process
+    lock for refills: only the lease holder calls upstream and the others
+    wait for its result.
+
+    The coroutine methods (``apeek``, ``aset`` ...) run the SQLite calls on
+    a small thread pool, so a slow disk or a writer holding the lock stalls
+    that request only, never the event loop. Writers wait at most
+    ``busy_timeout`` seconds for the lock; a write that cannot get it is
+    dropped (the next refill stores the key) and a read that cannot is a miss.
+
+    Decoded payloads of at least ``local_min_bytes`` are memoized per
+    process for the most recently read keys (``local_entries``) and reused
+    until the stored row changes. Smaller payloads, such as the per-coin
+    price keys, are cheap to decode and would only push the large ones out.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        local_entries: int = 64,
+        local_min_bytes: int = 1024,
+        evict_every: int = 50,
+        busy_timeout: float = 0.1,
+        io_threads: int = 4,
+        **kwargs
+    ):
+        super().__init__(**kwargs)
+        self.path = path
+        self.local_entries = local_entries
+        self.local_min_bytes = local_min_bytes
+        self.evict_every = evict_every
+        self.busy_timeout = busy_timeout
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._local = threading.local()
+        self._memo: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=io_threads, thread_name_prefix="shared-cache")
+        self._writes = 0
+        self.busy = 0
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, stored_at REAL NOT NULL, "
+            "ttl REAL NOT NULL, size INTEGER NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_cache_entries_stored_at ON cache_entries (stored_at)"
+        )
+        # Lets the expiry sweep find its rows without scanning the table
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_cache_entries_expires_at ON cache_entries (stored_at + ttl)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_locks ("
+            "key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    async def _run(self, fn, *args, busy_result=None):
+        """Run a blocking cache call on the I/O threads; busy_result is returned if SQLite stays locked"""
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args))
+        except sqlite3.OperationalError as exc:
+            if "locked" not in str(exc) and "busy" not in str(exc):
+                raise
+            with self._lock:
+                self.busy += 1
+            logger.debug("Shared cache busy during %s: %s", fn.__name__, exc)
+            return busy_result
+
+    async def apeek(self, key: str) -> Optional[CacheEntry]:
+        return await self._run(self.peek, key)
+
+    async def aget_entry(self, key: str) -> Optional[CacheEntry]:
+        return await self._run(self.get_entry, key)
+
+    async def aget_entries(self, keys: List[str]) -> List[Optional[CacheEntry]]:
+        # One trip to the I/O threads for the whole list
+        return await self._run(lambda: [self.get_entry(key) for key in keys], busy_result=[None] * len(keys))
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None, source: Optional[tuple] = None):
+        await self._run(self.set, key, value, ttl, source)
+
+    async def aset_many(self, values: Dict[str, Any], ttl: Optional[float] = None):
+        await self._run(self.set_many, values, ttl)
+
+    async def atry_lock(self, key: str, lease: float, renew: bool = False) -> bool:
+        return await self._run(self.try_lock, key, lease, renew, busy_result=False)
+
+    async def aunlock(self, key: str):
+        await self._run(self.unlock, key)
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+
+    def __contains__(self, key: str) -> bool:
+        return self.peek(key) is not None
+
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT stored_at, ttl, size FROM cache_entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        stored_at, ttl, size = row
+        with self._lock:
+            entry = self._memo.get(key)
+            if entry is not None and entry.stored_at == stored_at:
+                self._memo.move_to_end(key)
+                return entry
+        value_row = conn.execute(
+            "SELECT value FROM cache_entries WHERE key = ? AND stored_at = ?", (key, stored_at)
+        ).fetchone()
+        if value_row is None:
+            # Replaced between the two reads; the next lookup sees the new row
+            return None
+        body = bytes(value_row[0])
+        entry = CacheEntry(json.loads(body), stored_at, ttl, size, body)
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key: str, entry: CacheEntry):
+        if self.local_entries <= 0:
+            return
+        with self._lock:
+            if entry.size < self.local_min_bytes:
+                self._memo.pop(key, None)
+                return
+            self._memo[key] = entry
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.local_entries:
+                self._memo.popitem(last=False)
+
+    def get_entry(self, key: str) -> Optional[CacheEntry]:
+        entry = self.peek(key)
+        now = self.clock()
+        with self._lock:
+            if entry is None or not entry.is_servable(now, self.stale_window):
+                self.misses += 1
+                self._count(key, "misses")
+                return None
+            if entry.is_fresh(now):
+                self.hits += 1
+                self._count(key, "hits")
+            else:
+                self.stale_hits += 1
+                self._count(key, "stale_hits")
+            return entry
+
+    def get(self, key: str):
+        entry = self.peek(key)
+        with self._lock:
+            if entry is None or not entry.is_fresh(self.clock()):
+                self.misses += 1
+                self._count(key, "misses")
+                return None
+            self.hits += 1
+            self._count(key, "hits")
+            return entry.value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, source: Optional[tuple] = None):
+        self._store({key: value}, ttl, source)
+
+    def set_many(self, values: Dict[str, Any], ttl: Optional[float] = None):
+        """Store several keys in one transaction"""
+        self._store(values, ttl)
+
+    def _store(self, values: Dict[str, Any], ttl: Optional[float], source: Optional[tuple] = None):
+        now = self.clock()
+        entries = {}
+        for key, value in values.items():
+            body = json.dumps(value, separators=(",", ":"), default=str).encode()
+            if self.max_bytes is not None and len(body) > self.max_bytes:
+                continue
+            entries[key] = CacheEntry(value, now, self.ttl_for(key) if ttl is None else ttl,
+                                      len(body), body, source)
+        if not entries:
+            return
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache_entries (key, value, stored_at, ttl, size) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(key, entry.body, entry.stored_at, entry.ttl, entry.size) for key, entry in entries.items()],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        for key, entry in entries.items():
+            self._remember(key, entry)
+        with self._lock:
+            before = self._writes
+            self._writes += len(entries)
+            evict = self._writes // self.evict_every > before // self.evict_every
+        if evict:
+            self._evict()
+
+    def delete(self, key: str):
+        self._connect().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+        with self._lock:
+            self._memo.pop(key, None)
+
+    def clear(self):
+        self._connect().execute("DELETE FROM cache_entries")
+        with self._lock:
+            self._memo.clear()
+
+    def _evict(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            expired = conn.execute(
+                "DELETE FROM cache_entries WHERE stored_at + ttl < ?", (self.clock() - self.stale_window,)
+            ).rowcount
+            count, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries"
+            ).fetchone()
+            excess_entries = max(count - self.max_entries, 0)
+            excess_bytes = max(total - self.max_bytes, 0) if self.max_bytes is not None else 0
+            evicted = []
+            if excess_entries or excess_bytes:
+                # Oldest-written first, as many as both limits need, in one statement;
+                # tracking recency in SQLite would turn every read into a write
+                evicted = [row[0] for row in conn.execute(
+                    "DELETE FROM cache_entries WHERE key IN ("
+                    " SELECT key FROM ("
+                    "  SELECT key, size,"
+                    "   ROW_NUMBER() OVER (ORDER BY stored_at) AS position,"
+                    "   SUM(size) OVER (ORDER BY stored_at ROWS UNBOUNDED PRECEDING) AS freed"
+                    "  FROM cache_entries)"
+                    " WHERE position <= ? OR freed - size < ?) "
+                    "RETURNING key",
+                    (excess_entries, excess_bytes),
+                ).fetchall()]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self.expirations += expired
+            self.evictions += len(evicted)
+            for key in evicted:
+                self._count(key, "evictions")
+                self._memo.pop(key, None)
+
+    def try_lock(self, key: str, lease: float, renew: bool = False) -> bool:
+        conn = self._connect()
+        now = self.clock()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM cache_locks WHERE key = ? AND expires_at < ?", (key, now))
+            if renew:
+                insert = ("INSERT INTO cache_locks (key, owner, expires_at) VALUES (?, ?, ?) "
+                          "ON CONFLICT (key) DO UPDATE SET expires_at = excluded.expires_at "
+                          "WHERE owner = excluded.owner")
+            else:
+                insert = "INSERT OR IGNORE INTO cache_locks (key, owner, expires_at) VALUES (?, ?, ?)"
+            acquired = conn.execute(insert, (key, self.owner, now + lease)).rowcount == 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return acquired
+
+    def unlock(self, key: str):
+        self._connect().execute(
+            "DELETE FROM cache_locks WHERE key = ? AND owner = ?", (key, self.owner)
+        )
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        count, total = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries"
+        ).fetchone()
+        stats.update({"backend": "sqlite", "path": self.path, "entries": count, "bytes": total,
+                      "memoized": len(self._memo), "busy": self.busy})
+        return stats
@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# The backend modules import each other as top-level scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main.py reads its configuration at import time, so point it at a scratch
+# database and keep the background refreshers off before any test imports it
+_scratch = tempfile.mkdtemp(prefix="cheeseball-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_scratch}/test.db")
+os.environ.setdefault("CACHE_SNAPSHOT_PATH", "")
+os.environ.setdefault("HOT_REFRESH_INTERVAL", "0")
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+import main
+import models as db_models
+from alert_engine import AlertEngine, AlertIndex
+from shared_cache import SharedCache
+
+
+@pytest.fixture
+def db():
+    session = main.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.query(db_models.PriceAlert).delete()
+        session.commit()
+        session.close()
+
+
+def create_alert(db, coin_id, target, is_above=True, currency="usd"):
+    alert = db_models.PriceAlert(user_id=1, coin_id=coin_id, target_price=target, currency=currency,
+                                 is_above=is_above, is_active=True)
+    db.add(alert)
+    db.commit()
+    db.refresh(alert)
+    return alert
+
+
+def fake_prices(prices):
+    async def get_prices(coin_ids, currencies):
+        return {coin: {currency: prices[coin] for currency in currencies} for coin in coin_ids if coin in prices}
+    return get_prices
+
+
+def test_index_pops_crossed_alerts_only():
+    index = AlertIndex()
+    index.add(1, "bitcoin", "usd", 100.0, True)
+    index.add(2, "bitcoin", "usd", 200.0, True)
+    index.add(3, "bitcoin", "usd", 50.0, False)
+    index.add(4, "bitcoin", "usd", 90.0, False)
+
+    assert sorted(index.pop_crossed(("bitcoin", "usd"), 80.0)) == [4]
+    assert sorted(index.pop_crossed(("bitcoin", "usd"), 150.0)) == [1]
+    assert len(index) == 2 and 2 in index and 3 in index
+
+
+def test_tick_deactivates_crossed_alerts(db):
+    crossed = create_alert(db, "bitcoin", 100.0)
+    waiting = create_alert(db, "bitcoin", 500.0)
+    engine = AlertEngine(main.SessionLocal, fake_prices({"bitcoin": 150.0}))
+
+    asyncio.run(engine.tick())
+
+    db.expire_all()
+    assert db.get(db_models.PriceAlert, crossed.id).is_active is False
+    assert db.get(db_models.PriceAlert, waiting.id).is_active is True
+    assert engine.triggered == 1 and waiting.id in engine.index
+
+
+def test_add_during_reload_is_replayed_onto_the_new_index(db, monkeypatch):
+    create_alert(db, "bitcoin", 500.0)
+    engine = AlertEngine(main.SessionLocal, fake_prices({}))
+    late = db_models.PriceAlert(id=999999, coin_id="ethereum", target_price=10.0, currency="usd",
+                                is_above=True, is_active=True)
+    load_index = engine._load_index
+
+    def load_then_add():
+        index = load_index()
+        # The alert commits after the SELECT but before the new index is swapped in
+        engine.add(late)
+        return index
+
+    monkeypatch.setattr(engine, "_load_index", load_then_add)
+    asyncio.run(engine.tick())
+
+    assert late.id in engine.index
+    assert len(engine.index) == 2
+
+
+def test_only_the_lease_holder_ticks(tmp_path, db):
+    create_alert(db, "bitcoin", 100.0)
+    clock = [1000.0]
+    caches = [SharedCache(str(tmp_path / "cache.db"), clock=lambda: clock[0]) for _ in range(2)]
+    engines = [
+        AlertEngine(main.SessionLocal, fake_prices({"bitcoin": 50.0}), interval=5,
+                    lease=lambda seconds, cache=cache: cache.atry_lock("alert_engine", seconds, renew=True))
+        for cache in caches
+    ]
+
+    async def hold(engine):
+        return await engine._hold_lease()
+
+    first, second = engines
+    assert asyncio.run(hold(first)) is True
+    assert asyncio.run(hold(second)) is False
+    # The holder renews its own lease
+    clock[0] += 20
+    assert asyncio.run(hold(first)) is True
+    clock[0] += 20
+    assert asyncio.run(hold(second)) is False
+
+    # Once the holder stops renewing, the other worker takes over
+    clock[0] += 31
+    assert asyncio.run(hold(second)) is True
+    assert asyncio.run(hold(first)) is False
+    assert first.stats()["leader"] is False and len(first.index) == 0
+    for cache in caches:
+        cache.close()
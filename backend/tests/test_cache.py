@@ -0,0 +1,173 @@
+import asyncio
+
+import pytest
+
+from cache import TTLCache
+from shared_cache import SharedCache
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def memory_cache(clock, **kwargs):
+    return TTLCache(clock=clock, **kwargs)
+
+
+def sqlite_cache(clock, tmp_path, **kwargs):
+    return SharedCache(str(tmp_path / "cache.db"), clock=clock, **kwargs)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path):
+    caches = []
+
+    def make(clock, **kwargs):
+        cache = memory_cache(clock, **kwargs) if request.param == "memory" else sqlite_cache(clock, tmp_path, **kwargs)
+        caches.append(cache)
+        return cache
+
+    yield make
+    for cache in caches:
+        cache.close()
+
+
+def test_entries_expire_after_their_family_ttl(make_cache):
+    clock = Clock()
+    cache = make_cache(clock, default_ttl=60, ttls={"simple_price": 10, "market_chart": 300})
+    cache.set("simple_price_bitcoin_usd", 1)
+    cache.set("market_chart_bitcoin", 2)
+    cache.set("trending", 3)
+
+    clock.now += 11
+    assert cache.get("simple_price_bitcoin_usd") is None
+    assert cache.get("trending") == 3
+
+    clock.now += 50
+    assert cache.get("trending") is None
+    assert cache.get("market_chart_bitcoin") == 2
+
+
+def test_longest_prefix_picks_the_ttl():
+    cache = TTLCache(ttls={"market_chart": 60, "market_chart_range": 600})
+
+    assert cache.ttl_for("market_chart_range_bitcoin") == 600
+    assert cache.ttl_for("market_chart_bitcoin") == 60
+    assert cache.family("unknown_key") == "other"
+
+
+def test_stale_entries_are_served_inside_the_window(make_cache):
+    clock = Clock()
+    cache = make_cache(clock, default_ttl=10, stale_window=30)
+    cache.set("key", "value")
+
+    clock.now += 5
+    entry = cache.get_entry("key")
+    assert entry.value == "value" and entry.is_fresh(clock())
+
+    # Expired but servable: get_entry hands it out so a refresh can run behind it
+    clock.now += 20
+    entry = cache.get_entry("key")
+    assert entry.value == "value" and not entry.is_fresh(clock())
+    assert cache.get("key") is None
+    assert cache.stats()["stale_hits"] == 1
+
+    clock.now += 30
+    assert cache.get_entry("key") is None
+    # Past the window it is a miss, but peek still reaches it for outages
+    assert cache.peek("key").value == "value"
+
+
+def test_refilling_restarts_the_ttl(make_cache):
+    clock = Clock()
+    cache = make_cache(clock, default_ttl=10, stale_window=30)
+    cache.set("key", "old")
+    clock.now += 15
+
+    cache.set("key", "new")
+
+    entry = cache.get_entry("key")
+    assert entry.value == "new" and entry.is_fresh(clock())
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = TTLCache(max_entries=3)
+    for key in "abc":
+        cache.set(key, key)
+    cache.get("a")
+
+    cache.set("d", "d")
+
+    assert "b" not in cache
+    assert all(key in cache for key in "acd")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_byte_budget_evicts_and_rejects_oversized_values():
+    cache = TTLCache(max_bytes=100)
+    cache.set("a", "x" * 40)
+    cache.set("b", "y" * 40)
+
+    cache.set("c", "z" * 40)
+    assert "a" not in cache and cache.bytes <= 100
+
+    cache.set("huge", "w" * 500)
+    assert "huge" not in cache and "b" in cache and "c" in cache
+
+
+def test_shared_cache_evicts_oldest_written_over_the_limit(tmp_path):
+    clock = Clock()
+    cache = sqlite_cache(clock, tmp_path, max_entries=5, evict_every=1)
+    for i in range(8):
+        clock.now += 1
+        cache.set(f"key{i}", i)
+
+    assert len(cache) == 5
+    assert [cache.get(f"key{i}") for i in range(8)] == [None, None, None, 3, 4, 5, 6, 7]
+    cache.close()
+
+
+def test_shared_cache_is_shared_between_instances(tmp_path):
+    clock = Clock()
+    first, second = sqlite_cache(clock, tmp_path), sqlite_cache(clock, tmp_path)
+
+    first.set("prices", {"bitcoin": {"usd": 1.0}})
+    assert second.get("prices") == {"bitcoin": {"usd": 1.0}}
+
+    second.set("prices", {"bitcoin": {"usd": 2.0}})
+    assert first.get("prices") == {"bitcoin": {"usd": 2.0}}
+    first.close()
+    second.close()
+
+
+def test_shared_cache_refill_lock_is_exclusive_until_released_or_expired(tmp_path):
+    clock = Clock()
+    first, second = sqlite_cache(clock, tmp_path), sqlite_cache(clock, tmp_path)
+
+    assert first.try_lock("key", 10)
+    assert not second.try_lock("key", 10)
+    assert not first.try_lock("key", 10)
+    first.unlock("key")
+    assert second.try_lock("key", 10)
+
+    clock.now += 11
+    assert first.try_lock("key", 10)
+    first.close()
+    second.close()
+
+
+def test_async_methods_match_the_sync_ones(make_cache):
+    clock = Clock()
+    cache = make_cache(clock, default_ttl=10)
+
+    async def scenario():
+        await cache.aset("a", 1)
+        await cache.aset_many({"b": 2, "c": 3})
+        entries = await cache.aget_entries(["a", "b", "missing"])
+        return [entry and entry.value for entry in entries], (await cache.apeek("c")).value
+
+    assert asyncio.run(scenario()) == ([1, 2, None], 3)
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from chart_payload import (
+    COLUMNAR, downsample_candles, downsample_points, lttb_indices, pack_candles, pack_points,
+    shape_candles, shape_chart, unpack_candles, unpack_points,
+)
+
+HOUR_MS = 3600 * 1000
+DAY_MS = 24 * HOUR_MS
+START_MS = 1_700_000_000_000
+
+
+def hourly_points(days, start=START_MS):
+    timestamps = start + HOUR_MS * np.arange(days * 24)
+    values = 30000 + 5000 * np.sin(np.arange(len(timestamps)) / 50.0)
+    return [[int(t), float(v)] for t, v in zip(timestamps, values)]
+
+
+def assert_points_equal(decoded, points):
+    assert [t for t, _ in decoded] == [t for t, _ in points]
+    # Values travel as float32
+    np.testing.assert_allclose([v for _, v in decoded], [v for _, v in points], rtol=1e-6)
+
+
+@pytest.mark.parametrize("days, points", [(365, 12), (365, 3), (4 * 365, 5), (4 * 365, 50)])
+def test_downsampled_long_ranges_round_trip(days, points):
+    reduced = downsample_points(hourly_points(days), points)
+
+    packed = pack_points(reduced)
+
+    # Gaps here are far longer than int32 milliseconds can hold
+    assert max(b[0] - a[0] for a, b in zip(reduced, reduced[1:])) > 2 ** 31
+    assert packed["count"] == len(reduced)
+    assert_points_equal(unpack_points(packed), reduced)
+
+
+def test_evenly_spaced_points_use_a_step():
+    points = hourly_points(2)
+
+    packed = pack_points(points)
+
+    assert packed["step"] == HOUR_MS and "dt" not in packed
+    assert_points_equal(unpack_points(packed), points)
+
+
+def test_irregular_points_round_trip():
+    points = [[START_MS, 1.0], [START_MS + 5, 2.0], [START_MS + 40 * DAY_MS, 3.0], [START_MS + 41 * DAY_MS, 4.0]]
+
+    assert_points_equal(unpack_points(pack_points(points)), points)
+
+
+@pytest.mark.parametrize("points", [[], [[START_MS, 42.0]]])
+def test_empty_and_single_point_series_round_trip(points):
+    assert_points_equal(unpack_points(pack_points(points)), points)
+
+
+def test_candles_round_trip_across_years():
+    candles = [[START_MS + i * 4 * HOUR_MS, 10.0 + i, 12.0 + i, 9.0 + i, 11.0 + i] for i in range(6 * 365 * 2)]
+    merged = downsample_candles(candles, 8)
+
+    decoded = unpack_candles(pack_candles(merged))
+
+    assert [row[0] for row in decoded] == [row[0] for row in merged]
+    np.testing.assert_allclose([row[1:] for row in decoded], [row[1:] for row in merged], rtol=1e-6)
+
+
+def test_merged_candles_keep_open_close_and_extremes():
+    candles = [[i * 1000, 1.0 + i, 5.0 + i, 0.5 * i, 2.0 + i] for i in range(10)]
+
+    merged = downsample_candles(candles, 2)
+
+    assert merged == [[4000, 1.0, 9.0, 0.0, 6.0], [9000, 6.0, 14.0, 2.5, 11.0]]
+
+
+def test_lttb_keeps_the_ends_and_the_extremes():
+    x = np.arange(1000, dtype=float)
+    y = np.zeros(1000)
+    y[400], y[700] = 50.0, -50.0
+
+    keep = lttb_indices(x, y, 10)
+
+    assert len(keep) == 10
+    assert keep[0] == 0 and keep[-1] == 999
+    assert 400 in keep and 700 in keep
+
+
+def test_shape_chart_and_candles_columnar():
+    chart = {"prices": hourly_points(30), "market_caps": hourly_points(30), "total_volumes": hourly_points(30)}
+
+    shaped = shape_chart(chart, points=20, format=COLUMNAR)
+
+    assert shaped["format"] == COLUMNAR
+    for field in ("prices", "market_caps", "total_volumes"):
+        assert_points_equal(unpack_points(shaped[field]), downsample_points(chart[field], 20))
+
+    candles = [[START_MS + i * HOUR_MS, 1.0, 2.0, 0.5, 1.5] for i in range(100)]
+    assert shape_candles(candles, format=COLUMNAR)["candles"]["count"] == 100
@@ -0,0 +1,74 @@
+from coin_search import CoinSearchIndex
+
+
+def catalogue(count=40):
+    coins = [{"id": f"coin-{i}", "symbol": f"c{i}", "name": f"Coin Number {i}", "platforms": {}} for i in range(count)]
+    coins += [
+        {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin", "platforms": {}},
+        {"id": "wrapped-bitcoin", "symbol": "wbtc", "name": "Wrapped Bitcoin",
+         "platforms": {"ethereum": "0x2260fac5e5542a773aa44fbcfedf7c193bc2c599"}},
+        {"id": "ethereum", "symbol": "eth", "name": "Ethereum", "platforms": {}},
+    ]
+    return coins
+
+
+def ids(results):
+    return [coin["id"] for coin in results]
+
+
+def indexed(coins, version=1.0):
+    index = CoinSearchIndex()
+    index.sync(coins, version)
+    return index
+
+
+def test_ranks_exact_prefix_address_and_fuzzy_matches():
+    index = indexed(catalogue())
+
+    assert ids(index.search("btc"))[0] == "bitcoin"
+    assert index.search("btc")[0]["match"] == "symbol"
+    assert ids(index.search("wrapped"))[0] == "wrapped-bitcoin"
+    assert ids(index.search("0x2260fac5"))[0] == "wrapped-bitcoin"
+    assert ids(index.search("etherium"))[0] == "ethereum"
+    assert index.search("   ") == []
+
+
+def test_incremental_sync_matches_a_rebuild():
+    coins = catalogue()
+    index = indexed(coins)
+    updated = [coin for coin in coins if coin["id"] != "ethereum"]
+    updated[0] = {**updated[0], "name": "Renamed Token"}
+    updated.append({"id": "solana", "symbol": "sol", "name": "Solana", "platforms": {}})
+
+    index.sync(updated, 2.0)
+
+    assert index.builds == 1 and index.updates == 3
+    rebuilt = indexed(updated)
+    for query in ("sol", "renamed", "coin number 1", "eth", "bitcoin", "c0"):
+        assert index.search(query) == rebuilt.search(query), query
+    assert "ethereum" not in ids(index.search("ethereum"))
+
+
+def test_sync_leaves_the_searched_state_untouched():
+    coins = catalogue()
+    index = indexed(coins)
+    before = index._state
+    # A search that started before the sync keeps reading this state
+    terms, postings = list(before.terms), {gram: set(slots) for gram, slots in before.postings.items()}
+
+    index.sync([coin for coin in coins if coin["id"] != "bitcoin"] + [
+        {"id": "bitcoin-cash", "symbol": "bch", "name": "Bitcoin Cash", "platforms": {}}
+    ], 2.0)
+
+    assert index._state is not before
+    assert before.terms == terms
+    assert before.postings == postings
+    assert "bitcoin" in before.slots and "bitcoin" not in index._state.slots
+
+
+def test_same_version_is_not_resynced():
+    index = indexed(catalogue())
+
+    index.sync([], 1.0)
+
+    assert index.is_current(1.0) and len(index) == len(catalogue())
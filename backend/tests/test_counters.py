@@ -0,0 +1,78 @@
+import pytest
+
+import main
+import models as db_models
+from counters import (
+    AUTH_GENERATION, COUNTER_SHARDS, adjust_counter, counter_row, init_counters, read_counter, read_counters,
+)
+
+
+@pytest.fixture
+def db():
+    session = main.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.query(db_models.Portfolio).delete()
+        session.query(db_models.PriceAlert).delete()
+        session.commit()
+        init_counters(main.engine, recount=True)
+        session.close()
+
+
+def test_per_user_counters_are_sharded_by_user():
+    assert counter_row("total_users") == "total_users"
+    assert counter_row("total_alerts", 3) == f"total_alerts#{3 % COUNTER_SHARDS}"
+    assert counter_row("total_alerts", 3 + COUNTER_SHARDS) == counter_row("total_alerts", 3)
+    assert counter_row("total_alerts", None) == "total_alerts#0"
+
+
+def test_inserts_and_deletes_keep_counts_current(db):
+    before = read_counters(db)["total_alerts"]
+    alerts = [db_models.PriceAlert(user_id=user_id, coin_id="bitcoin", target_price=1.0) for user_id in range(1, 6)]
+    db.add_all(alerts)
+    db.commit()
+    assert read_counters(db)["total_alerts"] == before + 5
+
+    db.delete(alerts[0])
+    db.commit()
+    assert read_counters(db)["total_alerts"] == before + 4
+    # The counts landed on different shards
+    shards = {row.name for row in db.query(db_models.StatCounter).filter(
+        db_models.StatCounter.name.like("total_alerts#%"), db_models.StatCounter.value != 0)}
+    assert len(shards) >= 4
+
+
+def test_adjust_counter_joins_the_callers_transaction(db):
+    before = read_counters(db)["total_portfolios"]
+    with main.engine.begin() as connection:
+        adjust_counter(connection, "total_portfolios", 3, user_id=7)
+    assert read_counters(db)["total_portfolios"] == before + 3
+
+    connection = main.engine.connect()
+    transaction = connection.begin()
+    adjust_counter(connection, "total_portfolios", 10, user_id=7)
+    transaction.rollback()
+    connection.close()
+    db.expire_all()
+    assert read_counters(db)["total_portfolios"] == before + 3
+
+
+def test_recount_repairs_drifted_counters(db):
+    with main.engine.begin() as connection:
+        adjust_counter(connection, "total_alerts", 42, user_id=1)
+
+    init_counters(main.engine, recount=True)
+
+    db.expire_all()
+    assert read_counters(db)["total_alerts"] == db.query(db_models.PriceAlert).count()
+
+
+def test_auth_generation_is_a_plain_counter(db):
+    before = read_counter(db, AUTH_GENERATION)
+    with main.engine.begin() as connection:
+        adjust_counter(connection, AUTH_GENERATION, 1)
+
+    db.expire_all()
+    assert read_counter(db, AUTH_GENERATION) == before + 1
+    assert AUTH_GENERATION not in read_counters(db)
@@ -0,0 +1,38 @@
+import threading
+
+from sqlalchemy import text
+
+import main
+from database import DB_POOL_SIZE, engine
+
+
+def test_file_sqlite_connections_use_wal():
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+
+
+def test_pool_serves_concurrent_sessions():
+    barrier = threading.Barrier(8)
+    errors = []
+
+    def work():
+        db = main.SessionLocal()
+        try:
+            # Every thread holds its connection at the same time
+            db.execute(text("SELECT 1"))
+            barrier.wait(5)
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == [] and DB_POOL_SIZE >= 8
+
@@ -0,0 +1,78 @@
+import asyncio
+import gzip
+import time
+
+from fastapi import Request
+
+from cache import CacheEntry, encode_json
+from http_cache import COMPRESS_MIN_BYTES, choose_encoding, entry_etag, entry_response, etag_matches
+
+
+def request(**headers):
+    return Request({
+        "type": "http", "method": "GET", "path": "/", "query_string": b"",
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+def entry(value, ttl=60):
+    body = encode_json(value)
+    return CacheEntry(value, time.time(), ttl, len(body), body)
+
+
+def respond(cached, **headers):
+    return asyncio.run(entry_response(request(**headers), cached))
+
+
+LARGE = {"prices": [[i, i * 1.5] for i in range(COMPRESS_MIN_BYTES)]}
+
+
+def test_choose_encoding_honours_quality_values():
+    assert choose_encoding(None) is None
+    assert choose_encoding("gzip;q=0, identity") is None
+    assert choose_encoding("deflate, gzip;q=0.5") == "gzip"
+    assert choose_encoding("*") in ("br", "gzip")
+
+
+def test_etags_match_weakly_across_encodings():
+    cached = entry({"a": 1})
+    etag = entry_etag(cached)
+
+    assert etag_matches(f'"{etag}"', etag)
+    assert etag_matches(f'W/"{etag}-gzip"', etag)
+    assert etag_matches(f'"other", "{etag}-br"', etag)
+    assert not etag_matches('"other"', etag)
+
+
+def test_small_bodies_are_sent_uncompressed_with_an_etag():
+    cached = entry({"a": 1})
+
+    response = respond(cached, accept_encoding="gzip")
+
+    assert response.body == b'{"a":1}'
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == f'"{entry_etag(cached)}"'
+    assert response.headers["cache-control"].startswith("private, max-age=")
+
+
+def test_large_bodies_are_compressed_once_and_reused():
+    cached = entry(LARGE)
+
+    first = respond(cached, accept_encoding="gzip")
+    second = respond(cached, accept_encoding="gzip")
+
+    assert first.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(first.body) == cached.body
+    assert second.body is cached.variants["gzip"]
+    assert first.headers["etag"] == f'"{entry_etag(cached)}-gzip"'
+
+
+def test_matching_if_none_match_gets_a_304():
+    cached = entry(LARGE)
+    etag = respond(cached, accept_encoding="gzip").headers["etag"]
+
+    response = respond(cached, accept_encoding="gzip", if_none_match=etag)
+
+    assert response.status_code == 304 and response.body == b""
+    # A changed entry has a new ETag
+    assert respond(entry({"changed": True}), if_none_match=etag).status_code == 200
@@ -0,0 +1,118 @@
+import asyncio
+
+from market_universe import PER_PAGE, MarketUniverse
+
+
+def make_market(count):
+    # Market cap falls with rank; every third coin is in "defi"
+    return [
+        {"id": f"coin-{rank:04d}", "market_cap": 1e9 / rank, "total_volume": float(rank % 7),
+         "current_price": 1.0, "category": "defi" if rank % 3 == 0 else "other"}
+        for rank in range(1, count + 1)
+    ]
+
+
+def fake_fetch(market):
+    calls = []
+
+    async def fetch(params):
+        calls.append(params)
+        rows = market
+        if params.get("category"):
+            rows = [row for row in market if row["category"] == params["category"]]
+        start = (params["page"] - 1) * params["per_page"]
+        return rows[start:start + params["per_page"]]
+
+    fetch.calls = calls
+    return fetch
+
+
+def universe(count, pages=2, **kwargs):
+    table = MarketUniverse(fake_fetch(make_market(count)), pages=pages, **kwargs)
+    asyncio.run(table.refresh())
+    return table
+
+
+def markets(table, ids=None, category=None, order="market_cap_desc", per_page=100, page=1):
+    entry = asyncio.run(table.markets(ids, category, order, per_page, page, False, "24h", "usd",
+                                      1.0, 0, lambda rows, factor: rows))
+    return None if entry is None else [row["id"] for row in entry.value]
+
+
+def test_top_pages_are_served_in_market_cap_order():
+    table = universe(1000)
+
+    assert markets(table, per_page=3) == ["coin-0001", "coin-0002", "coin-0003"]
+
+
+def test_other_orders_of_a_partial_market_go_upstream():
+    table = universe(1000)
+
+    # The top 500 hold neither the smallest caps nor every high-volume coin
+    assert markets(table, order="market_cap_asc") is None
+    assert markets(table, order="volume_desc") is None
+    assert markets(table, order="id_asc") is None
+
+
+def test_other_orders_of_a_known_set_are_served():
+    table = universe(1000)
+
+    ids = ["coin-0002", "coin-0010", "coin-0005"]
+    assert markets(table, ids=ids, order="market_cap_asc") == ["coin-0010", "coin-0005", "coin-0002"]
+    assert markets(table, ids=ids, order="id_desc") == ["coin-0010", "coin-0005", "coin-0002"]
+
+
+def test_other_orders_are_served_when_the_whole_market_is_loaded():
+    table = universe(300)
+
+    assert markets(table, order="market_cap_asc", per_page=2) == ["coin-0300", "coin-0299"]
+
+
+def test_last_loaded_page_is_served_and_the_next_goes_upstream():
+    table = universe(1000)
+
+    assert markets(table, per_page=250, page=2)[-1] == "coin-0500"
+    assert markets(table, per_page=250, page=3) is None
+    # A page straddling the end of the loaded rows can't be completed locally either
+    assert markets(table, per_page=300, page=2) is None
+
+
+def test_pages_past_a_fully_loaded_market_are_empty():
+    table = universe(300)
+
+    assert markets(table, per_page=250, page=2) == [f"coin-{rank:04d}" for rank in range(251, 301)]
+    assert markets(table, per_page=250, page=3) == []
+
+
+def test_uncapped_category_is_served_in_any_order_and_page():
+    table = universe(1000, max_pages_per_category=2)
+
+    # 333 members fit in two category pages
+    assert markets(table, category="defi", per_page=3) == ["coin-0003", "coin-0006", "coin-0009"]
+    assert markets(table, category="defi", order="market_cap_asc", per_page=2) == ["coin-0999", "coin-0996"]
+    assert len(markets(table, category="defi", per_page=250, page=2)) == 83
+
+
+def test_capped_category_goes_upstream():
+    table = universe(1000, max_pages_per_category=1)
+
+    # The only page allowed came back full, so the category may have more members
+    assert markets(table, category="defi", per_page=10) is None
+    category_fetches = [params for params in table.fetch.calls if params.get("category")]
+    assert len(category_fetches) == 1
+
+    # The cap is remembered rather than refetched on every request
+    assert markets(table, category="defi", per_page=10) is None
+    assert len([params for params in table.fetch.calls if params.get("category")]) == 1
+
+
+def test_ids_outside_the_top_pages_go_upstream():
+    table = universe(1000)
+
+    assert markets(table, ids=["coin-0001", "coin-0900"]) is None
+
+
+def test_page_size_must_fit_one_upstream_page():
+    table = universe(300)
+
+    assert markets(table, per_page=PER_PAGE + 1) is None
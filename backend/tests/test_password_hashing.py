@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+from password_hashing import HasherOverloaded, PasswordHasher
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(workers=2, max_pending=2)
+    yield hasher
+    hasher.close()
+
+
+def test_hash_and_verify_round_trip(hasher):
+    async def scenario():
+        hashed = await hasher.hash("correct horse")
+        return hashed, await hasher.verify("correct horse", hashed), await hasher.verify("wrong", hashed)
+
+    hashed, good, bad = asyncio.run(scenario())
+
+    assert hashed.startswith("$2") and good is True and bad is False
+    assert hasher.stats()["completed"] == 3 and hasher.pending == 0
+
+
+def test_calls_beyond_max_pending_are_rejected_at_once(hasher):
+    async def scenario():
+        return await asyncio.gather(*(hasher.hash(f"password {i}") for i in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+
+    assert sum(isinstance(result, HasherOverloaded) for result in results) == 1
+    assert hasher.rejected == 1
+    rejected = next(result for result in results if isinstance(result, HasherOverloaded))
+    assert rejected.status_code == 503 and rejected.headers["Retry-After"] == "1"
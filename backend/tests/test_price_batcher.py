@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from cache import TTLCache
+from price_batcher import PriceBatcher, split_ids
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def fake_fetch(prices, fail=False):
+    calls = []
+
+    async def fetch(coin_ids, currencies):
+        calls.append((list(coin_ids), list(currencies)))
+        await asyncio.sleep(0)
+        if fail:
+            raise RuntimeError("upstream down")
+        return {coin: {cur: prices[coin] for cur in currencies} for coin in coin_ids if coin in prices}
+
+    fetch.calls = calls
+    return fetch
+
+
+def batcher(prices, clock=None, fail=False, **kwargs):
+    clock = clock or Clock()
+    fetch = fake_fetch(prices, fail)
+    return PriceBatcher(TTLCache(default_ttl=10, stale_window=60, clock=clock), fetch, clock=clock, **kwargs), fetch
+
+
+def test_split_ids_canonicalizes():
+    assert split_ids(" Bitcoin,ethereum,,BITCOIN , solana") == ["bitcoin", "ethereum", "solana"]
+
+
+def test_concurrent_requests_share_one_upstream_call():
+    prices, fetch = batcher({"bitcoin": 1.0, "ethereum": 2.0, "solana": 3.0})
+
+    async def scenario():
+        return await asyncio.gather(
+            prices.get_prices(["bitcoin", "ethereum"], ["usd"]),
+            prices.get_prices(["ethereum", "solana"], ["usd"]),
+        )
+
+    first, second = asyncio.run(scenario())
+
+    assert first == {"bitcoin": {"usd": 1.0}, "ethereum": {"usd": 2.0}}
+    assert second == {"ethereum": {"usd": 2.0}, "solana": {"usd": 3.0}}
+    assert fetch.calls == [(["bitcoin", "ethereum", "solana"], ["usd"])]
+
+
+def test_cached_pairs_are_served_without_fetching():
+    prices, fetch = batcher({"bitcoin": 1.0})
+    asyncio.run(prices.get_prices(["bitcoin"], ["usd"]))
+
+    assert asyncio.run(prices.get_prices(["bitcoin"], ["usd"])) == {"bitcoin": {"usd": 1.0}}
+    assert len(fetch.calls) == 1
+
+
+def test_unknown_coins_are_cached_as_missing():
+    prices, fetch = batcher({"bitcoin": 1.0})
+
+    assert asyncio.run(prices.get_prices(["nope"], ["usd"])) == {}
+    assert asyncio.run(prices.get_prices(["nope"], ["usd"])) == {}
+    assert len(fetch.calls) == 1
+
+
+def test_large_requests_are_split_into_chunks():
+    coins = [f"coin-{i}" for i in range(5)]
+    prices, fetch = batcher({coin: 1.0 for coin in coins}, max_ids=2)
+
+    result = asyncio.run(prices.get_prices(coins, ["usd"]))
+
+    assert sorted(result) == coins
+    assert all(len(coin_ids) <= 2 for coin_ids, _ in fetch.calls)
+    assert sorted(coin for coin_ids, _ in fetch.calls for coin in coin_ids) == coins
+
+
+def test_stale_prices_are_served_and_refreshed_in_the_background():
+    clock = Clock()
+    prices, fetch = batcher({"bitcoin": 1.0}, clock=clock)
+    asyncio.run(prices.get_prices(["bitcoin"], ["usd"]))
+    clock.now += 30
+
+    async def scenario():
+        served = await prices.get_prices(["bitcoin"], ["usd"])
+        await asyncio.sleep(0.05)
+        return served
+
+    assert asyncio.run(scenario()) == {"bitcoin": {"usd": 1.0}}
+    assert len(fetch.calls) == 2
+    assert prices.cache.get_entry(PriceBatcher.cache_key("bitcoin", "usd")).is_fresh(clock())
+
+
+def test_upstream_errors_reach_the_waiting_requests():
+    prices, fetch = batcher({}, fail=True)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(prices.get_prices(["bitcoin"], ["usd"]))
@@ -0,0 +1,127 @@
+import asyncio
+
+from price_stream import PriceStreamHub, Subscriber
+
+
+class FakeWebSocket:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.sent = []
+        self.closed = None
+
+    async def send_json(self, message):
+        await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+    async def close(self, code=1000):
+        self.closed = code
+
+
+def fake_prices(prices):
+    calls = []
+
+    async def get_prices(coin_ids, currencies):
+        calls.append((sorted(coin_ids), list(currencies)))
+        return {coin: {cur: prices[coin] for cur in currencies} for coin in coin_ids if coin in prices}
+
+    get_prices.calls = calls
+    return get_prices
+
+
+def subscribe(hub, ids, currencies="usd"):
+    subscriber = Subscriber(FakeWebSocket())
+    hub._subscribers.add(subscriber)
+    assert hub._handle(subscriber, {"action": "subscribe", "ids": ids, "vs_currencies": currencies}) == ""
+    return subscriber
+
+
+def test_one_poll_serves_the_union_of_subscriptions():
+    get_prices = fake_prices({"bitcoin": 1.0, "ethereum": 2.0})
+    hub = PriceStreamHub(get_prices)
+    first = subscribe(hub, "bitcoin")
+    second = subscribe(hub, "Bitcoin, ethereum")
+
+    asyncio.run(hub.poll())
+
+    assert get_prices.calls == [(["bitcoin", "ethereum"], ["usd"])]
+    assert first.pending == {"bitcoin": {"usd": 1.0}}
+    assert second.pending == {"bitcoin": {"usd": 1.0}, "ethereum": {"usd": 2.0}}
+
+
+def test_only_changed_prices_are_pushed():
+    prices = {"bitcoin": 1.0, "ethereum": 2.0}
+    hub = PriceStreamHub(fake_prices(prices))
+    subscriber = subscribe(hub, "bitcoin,ethereum")
+    asyncio.run(hub.poll())
+    subscriber.pending.clear()
+
+    prices["bitcoin"] = 1.5
+    asyncio.run(hub.poll())
+
+    assert subscriber.pending == {"bitcoin": {"usd": 1.5}}
+
+
+def test_new_subscribers_get_known_prices_at_once():
+    hub = PriceStreamHub(fake_prices({"bitcoin": 1.0}))
+    subscribe(hub, "bitcoin")
+    asyncio.run(hub.poll())
+
+    late = subscribe(hub, "bitcoin")
+
+    assert late.pending == {"bitcoin": {"usd": 1.0}}
+
+
+def test_invalid_messages_are_answered_with_errors():
+    hub = PriceStreamHub(fake_prices({}), max_pairs=2)
+    subscriber = Subscriber(FakeWebSocket())
+
+    assert hub._handle(subscriber, ["subscribe"]) == "Expected a JSON object"
+    assert "Unknown action" in hub._handle(subscriber, {"action": "watch"})
+    assert "At most 2" in hub._handle(subscriber, {"action": "subscribe", "ids": "a,b,c"})
+    assert subscriber.pairs == set()
+
+
+def test_unsubscribed_pairs_stop_being_polled():
+    get_prices = fake_prices({"bitcoin": 1.0})
+    hub = PriceStreamHub(get_prices)
+    subscriber = subscribe(hub, "bitcoin")
+
+    hub._handle(subscriber, {"action": "unsubscribe", "ids": "bitcoin"})
+    asyncio.run(hub.poll())
+
+    assert get_prices.calls == [] and hub.watched_pairs() == set()
+
+
+def test_a_slow_client_gets_merged_updates():
+    hub = PriceStreamHub(fake_prices({}))
+    websocket = FakeWebSocket(delay=0.02)
+    subscriber = Subscriber(websocket)
+
+    async def scenario():
+        sender = asyncio.ensure_future(hub._send_loop(subscriber))
+        subscriber.push("bitcoin", "usd", 1.0)
+        await asyncio.sleep(0.005)
+        # Arrive while the first message is still being sent
+        for price in (2.0, 3.0, 4.0):
+            subscriber.push("bitcoin", "usd", price)
+        await asyncio.sleep(0.06)
+        sender.cancel()
+
+    asyncio.run(scenario())
+
+    assert [message["data"] for message in websocket.sent] == [{"bitcoin": {"usd": 1.0}}, {"bitcoin": {"usd": 4.0}}]
+
+
+def test_a_stuck_client_is_disconnected():
+    hub = PriceStreamHub(fake_prices({}), send_timeout=0.01)
+    websocket = FakeWebSocket(delay=1)
+    subscriber = Subscriber(websocket)
+
+    async def scenario():
+        sender = asyncio.ensure_future(hub._send_loop(subscriber))
+        subscriber.push("bitcoin", "usd", 1.0)
+        await asyncio.wait_for(sender, 1)
+
+    asyncio.run(scenario())
+
+    assert websocket.closed == 1013
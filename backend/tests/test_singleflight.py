@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import pytest
+
+import main
+from cache import CacheEntry
+from singleflight import SingleFlight
+from upstream import UpstreamError
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.do("key", work) for _ in range(10)))
+        return results, len(flight)
+
+    results, pending = asyncio.run(scenario())
+
+    assert results == ["result"] * 10
+    assert calls == [1] and pending == 0
+
+
+def test_errors_reach_every_waiter_and_are_not_remembered():
+    flight = SingleFlight()
+    attempts = []
+
+    async def work():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        if len(attempts) == 1:
+            raise ValueError("boom")
+        return "ok"
+
+    async def scenario():
+        failed = await asyncio.gather(*(flight.do("key", work) for _ in range(3)), return_exceptions=True)
+        return failed, await flight.do("key", work)
+
+    failed, retried = asyncio.run(scenario())
+
+    assert all(isinstance(error, ValueError) for error in failed)
+    assert retried == "ok" and len(attempts) == 2
+
+
+def test_a_cancelled_caller_does_not_cancel_the_work():
+    flight = SingleFlight()
+    finished = []
+
+    async def work():
+        await asyncio.sleep(0.02)
+        finished.append(1)
+        return "done"
+
+    async def scenario():
+        first = asyncio.ensure_future(flight.do("key", work))
+        second = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) == "done"
+    assert finished == [1]
+
+
+@pytest.fixture
+def upstream_calls(monkeypatch):
+    calls = []
+
+    async def get(path, params=None, priority=None):
+        calls.append(path)
+        await asyncio.sleep(0.01)
+        if path.endswith("/fail"):
+            raise UpstreamError(502, "Upstream request failed")
+        return {"path": path, "call": len(calls)}
+
+    monkeypatch.setattr(main.upstream, "get", get)
+    yield calls
+    for key in ("sf_test_miss", "sf_test_stale", "sf_test_fail"):
+        main.CACHE.delete(key)
+
+
+def test_cache_misses_are_fetched_once(upstream_calls):
+    async def scenario():
+        return await asyncio.gather(*(main.fetch_cached("sf_test_miss", "/miss") for _ in range(20)))
+
+    results = asyncio.run(scenario())
+
+    assert upstream_calls == ["/miss"]
+    assert results == [{"path": "/miss", "call": 1}] * 20
+
+
+def test_stale_entries_are_served_while_one_refresh_runs(upstream_calls):
+    ttl = main.CACHE.ttl_for("sf_test_stale")
+    main.CACHE.put_entry("sf_test_stale", CacheEntry("old", time.time() - ttl - 1, ttl, 5))
+
+    async def scenario():
+        served = await asyncio.gather(*(main.fetch_cached("sf_test_stale", "/stale") for _ in range(5)))
+        await asyncio.sleep(0.05)
+        return served
+
+    assert asyncio.run(scenario()) == ["old"] * 5
+    assert upstream_calls == ["/stale"]
+    assert main.CACHE.get("sf_test_stale") == {"path": "/stale", "call": 1}
+
+
+def test_failed_refills_fall_back_to_the_stored_entry(upstream_calls):
+    main.CACHE.put_entry("sf_test_fail", CacheEntry("kept", time.time() - 10 ** 6, 1, 6))
+
+    assert asyncio.run(main.fetch_cached("sf_test_fail", "/fail")) == "kept"
@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+from timeseries import CHART_EPOCH, CHART_FIELDS, CHART_TIERS, DAY, TimeSeriesStore
+
+NOW = 1_760_000_000
+
+
+class Clock:
+    def __init__(self, now=NOW):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def fake_fetch(step=3600):
+    """Upstream /market_chart/range: one point per `step` seconds, price = timestamp"""
+    calls = []
+
+    async def fetch(path, params):
+        calls.append(params)
+        first = -(-params["from"] // step) * step
+        points = [[t * 1000, float(t)] for t in range(first, params["to"] + 1, step)]
+        return {field: [list(point) for point in points] for field in CHART_FIELDS}
+
+    fetch.calls = calls
+    return fetch
+
+
+def store(step=3600, **kwargs):
+    fetch = fake_fetch(step)
+    return TimeSeriesStore(fetch, **kwargs), fetch
+
+
+def test_open_ended_ranges_are_clamped_to_the_epoch_and_now():
+    clock = Clock()
+    timeseries, fetch = store(step=DAY, clock=clock)
+
+    chart = asyncio.run(timeseries.chart_range("bitcoin", "usd", 0, 1e10))
+
+    length = CHART_TIERS["daily"][0]
+    assert len(fetch.calls) == NOW // length - CHART_EPOCH // length + 1
+    assert all(call["from"] <= call["to"] for call in fetch.calls)
+    assert min(call["from"] for call in fetch.calls) >= CHART_EPOCH // length * length
+    assert max(call["to"] for call in fetch.calls) <= NOW
+    assert chart["prices"][0][0] >= CHART_EPOCH * 1000
+    assert chart["prices"][-1][0] <= NOW * 1000
+
+
+def test_ranges_in_the_future_fetch_nothing():
+    timeseries, fetch = store(clock=Clock())
+
+    chart = asyncio.run(timeseries.chart_range("bitcoin", "usd", NOW + DAY, NOW + 10 * DAY))
+
+    assert chart == {field: [] for field in CHART_FIELDS}
+    assert fetch.calls == []
+
+
+def test_ranges_over_the_segment_limit_are_rejected():
+    timeseries, fetch = store(step=DAY, max_segments=4, clock=Clock())
+
+    with pytest.raises(ValueError):
+        asyncio.run(timeseries.chart_range("bitcoin", "usd", NOW - 10 * 365 * DAY, NOW))
+    assert fetch.calls == []
+
+
+def test_segments_are_stitched_without_gaps_or_duplicates():
+    timeseries, fetch = store(clock=Clock())
+    start, end = NOW - 80 * DAY, NOW - 5 * DAY
+
+    chart = asyncio.run(timeseries.chart_range("bitcoin", "usd", start, end))
+
+    # 80 days of the hourly tier span several 30 day segments
+    assert len(fetch.calls) > 2
+    timestamps = [point[0] for point in chart["prices"]]
+    first = -(-start // 3600) * 3600
+    assert timestamps == [t * 1000 for t in range(first, end + 1, 3600)]
+    assert chart["market_caps"] == chart["prices"]
+
+
+def test_finished_segments_are_reused_and_the_open_one_topped_up():
+    clock = Clock()
+    timeseries, fetch = store(clock=clock)
+    asyncio.run(timeseries.chart_range("bitcoin", "usd", NOW - 60 * DAY, NOW))
+    fetched = len(fetch.calls)
+
+    clock.now += 2 * 3600
+    chart = asyncio.run(timeseries.chart_range("bitcoin", "usd", NOW - 60 * DAY, clock.now))
+
+    # Only the segment holding "now" is refetched, from its last stored point
+    assert len(fetch.calls) == fetched + 1
+    assert fetch.calls[-1]["from"] >= NOW - 2 * 3600
+    timestamps = [point[0] for point in chart["prices"]]
+    assert timestamps == sorted(set(timestamps))
+    assert timestamps[-1] // 1000 > NOW
+
+
+def fake_ohlc(clock, step=4 * 3600):
+    """Upstream /ohlc: `days` of candles of `step` seconds ending at the last whole step"""
+    calls = []
+
+    async def fetch(path, params):
+        calls.append(params)
+        end = clock() // step * step
+        return [[t * 1000, 1.0, 2.0, 0.5, 1.5] for t in range(end - params["days"] * DAY + step, end + 1, step)]
+
+    fetch.calls = calls
+    return fetch
+
+
+def test_candles_are_topped_up_with_the_smallest_covering_request():
+    clock = Clock()
+    fetch = fake_ohlc(clock)
+    timeseries = TimeSeriesStore(fetch, clock=clock)
+
+    first = asyncio.run(timeseries.ohlc("bitcoin", "usd", 7))
+    assert fetch.calls == [{"vs_currency": "usd", "days": 30}]
+    assert first[0][0] >= (NOW - 7 * DAY) * 1000
+
+    clock.now += 2 * DAY
+    candles = asyncio.run(timeseries.ohlc("bitcoin", "usd", 14))
+
+    assert fetch.calls[-1]["days"] == 7
+    timestamps = [candle[0] for candle in candles]
+    assert timestamps == sorted(set(timestamps))
+    assert timestamps[-1] == clock.now // (4 * 3600) * 4 * 3600 * 1000
+
+
+def test_ohlc_beyond_the_largest_tier_is_not_served():
+    clock = Clock()
+    timeseries = TimeSeriesStore(fake_ohlc(clock), clock=clock)
+
+    assert asyncio.run(timeseries.ohlc("bitcoin", "usd", 1000)) is None
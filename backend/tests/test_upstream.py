@@ -0,0 +1,174 @@
+import asyncio
+
+import httpx
+import pytest
+
+from upstream import PRIORITY_HIGH, PRIORITY_LOW, CircuitBreaker, RateLimiter, UpstreamClient, UpstreamError
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_after_consecutive_failures():
+    clock = Clock()
+    breaker = CircuitBreaker(threshold=3, reset_timeout=30, clock=clock)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    assert breaker.retry_after() == 31
+
+
+def test_half_open_breaker_lets_one_probe_through():
+    clock = Clock()
+    breaker = CircuitBreaker(threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+
+    clock.now += 30
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    # A failed probe reopens it for another full timeout
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.opens == 2
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow() and breaker.allow()
+
+
+def test_released_probe_can_be_retried():
+    clock = Clock()
+    breaker = CircuitBreaker(threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+
+    breaker.release()
+
+    assert breaker.state == "half_open" and breaker.allow()
+
+
+def test_limiter_grants_the_burst_then_times_out():
+    clock = Clock()
+    limiter = RateLimiter(rate_per_minute=60, burst=3, clock=clock)
+
+    async def scenario():
+        granted = [await limiter.acquire(PRIORITY_LOW, 0) for _ in range(3)]
+        return granted, await limiter.acquire(PRIORITY_LOW, 0.01)
+
+    granted, late = asyncio.run(scenario())
+
+    assert granted == [True, True, True] and late is False
+    assert limiter.timeouts == 1
+
+
+def test_limiter_serves_waiters_by_priority():
+    limiter = RateLimiter(rate_per_minute=6000, burst=1)
+    order = []
+
+    async def call(name, priority):
+        await limiter.acquire(priority, 1)
+        order.append(name)
+
+    async def scenario():
+        await limiter.acquire(PRIORITY_LOW, 1)
+        # The bucket is empty; both queue, and the high priority call goes first
+        await asyncio.gather(call("low", PRIORITY_LOW), call("high", PRIORITY_HIGH))
+
+    asyncio.run(scenario())
+
+    assert order == ["high", "low"]
+
+
+def test_pause_empties_the_bucket_and_stats_do_not_refill_it():
+    clock = Clock()
+    limiter = RateLimiter(rate_per_minute=60, burst=5, clock=clock)
+
+    async def scenario():
+        limiter.pause(10)
+        return await limiter.acquire(PRIORITY_HIGH, 0)
+
+    assert asyncio.run(scenario()) is False
+    clock.now += 3
+    assert limiter.stats()["paused_for"] == 7
+    assert limiter.stats()["tokens"] == 3
+    assert limiter.tokens == 0
+
+
+def client_for(handler, **kwargs):
+    options = dict(rate_per_minute=0, backoff=0, backoff_max=0, retries=2, breaker_threshold=3, breaker_reset=30)
+    options.update(kwargs)
+    client = UpstreamClient("http://upstream", **options)
+    client._client = httpx.AsyncClient(base_url="http://upstream", transport=httpx.MockTransport(handler))
+    return client
+
+
+def responses(*items):
+    sent = []
+
+    def handler(request):
+        status, body, *headers = items[min(len(sent), len(items) - 1)]
+        sent.append(request.url.path)
+        return httpx.Response(status, json=body, headers=headers[0] if headers else None)
+
+    handler.sent = sent
+    return handler
+
+
+def test_server_errors_are_retried():
+    handler = responses((500, {}), (503, {}), (200, {"ok": True}))
+    client = client_for(handler)
+
+    assert asyncio.run(client.get("/ping")) == {"ok": True}
+    assert len(handler.sent) == 3 and client.retried == 2
+
+
+def test_client_errors_pass_through_without_retries():
+    handler = responses((404, {"error": "coin not found"}))
+    client = client_for(handler)
+
+    with pytest.raises(UpstreamError) as raised:
+        asyncio.run(client.get("/coins/nope"))
+
+    assert raised.value.status_code == 404 and len(handler.sent) == 1
+
+
+def test_throttling_pauses_the_limiter():
+    handler = responses((429, {}, {"Retry-After": "5"}))
+    client = client_for(handler, rate_per_minute=60, retries=0)
+
+    with pytest.raises(UpstreamError) as raised:
+        asyncio.run(client.get("/ping"))
+
+    assert raised.value.status_code == 503
+    assert client.limiter.stats()["paused_for"] > 4
+    assert raised.value.headers["Retry-After"] == "6"
+    assert client.breaker.state == "closed"
+
+
+def test_open_breaker_fails_fast():
+    handler = responses((500, {}))
+    client = client_for(handler, retries=0)
+
+    for _ in range(3):
+        with pytest.raises(UpstreamError):
+            asyncio.run(client.get("/ping"))
+    with pytest.raises(UpstreamError) as raised:
+        asyncio.run(client.get("/ping"))
+
+    assert len(handler.sent) == 3
+    assert raised.value.status_code == 503 and client.is_unavailable
+    assert raised.value.headers["Retry-After"] == str(client.breaker.retry_after())
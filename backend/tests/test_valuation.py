@@ -0,0 +1,107 @@
+import math
+import random
+
+import pytest
+
+from valuation import value_portfolio
+
+
+def value_lots(lots, prices, currency):
+    """Reference: value each lot on its own, the way the portfolio route used to"""
+    positions, total_value, total_cost = [], 0.0, 0.0
+    for lot_id, coin, amount, purchase_price, purchase_currency in lots:
+        purchase_currency = (purchase_currency or currency).lower()
+        quotes = prices.get(coin, {})
+        price = quotes.get(currency)
+        if purchase_currency == currency:
+            fx = 1.0
+        elif price is not None and quotes.get(purchase_currency):
+            fx = price / quotes[purchase_currency]
+        else:
+            fx = None
+        value = amount * price if price is not None else None
+        cost = amount * purchase_price * fx if fx is not None else None
+        positions.append((lot_id, coin, value, cost))
+        if value is not None and cost is not None:
+            total_value += value
+            total_cost += cost
+    return positions, total_value, total_cost
+
+
+def run(lots, prices, currency="usd"):
+    columns = [list(column) for column in zip(*lots)] if lots else [[]] * 5
+    return value_portfolio(*columns, prices, currency)
+
+
+def approx(value):
+    return None if value is None else pytest.approx(value, rel=1e-12)
+
+
+def assert_matches_reference(lots, prices, currency="usd"):
+    result = run(lots, prices, currency)
+    positions, total_value, total_cost = value_lots(lots, prices, currency)
+
+    assert [(p["id"], p["coin_id"], p["value"], p["cost_basis"]) for p in result["positions"]] == [
+        (lot_id, coin, approx(value), approx(cost)) for lot_id, coin, value, cost in positions
+    ]
+    assert result["total_value"] == pytest.approx(total_value)
+    assert result["total_cost_basis"] == pytest.approx(total_cost)
+    assert result["unpriced_positions"] == sum(value is None or cost is None for _, _, value, cost in positions)
+
+
+def test_matches_per_lot_valuation():
+    rng = random.Random(7)
+    coins = ["bitcoin", "ethereum", "solana", "dogecoin"]
+    prices = {coin: {"usd": rng.uniform(0.1, 60000)} for coin in coins}
+    for quotes in prices.values():
+        quotes.update(eur=quotes["usd"] * 0.92, gbp=quotes["usd"] * 0.79)
+    lots = [
+        (i, rng.choice(coins), rng.uniform(0.01, 10), rng.uniform(0.1, 60000), rng.choice(["usd", "EUR", "gbp", None]))
+        for i in range(200)
+    ]
+
+    assert_matches_reference(lots, prices, "usd")
+    assert_matches_reference(lots, prices, "eur")
+
+
+def test_coin_ids_with_spaces_are_valued():
+    prices = {"wrapped bitcoin": {"usd": 60000.0, "eur": 55000.0}, "wrapped": {"usd": 1.0, "bitcoin eur": 2.0}}
+    lots = [(1, "wrapped bitcoin", 2.0, 50000.0, "eur"), (2, "wrapped", 3.0, 1.0, "usd")]
+
+    result = run(lots, prices)
+
+    assert result["positions"][0]["cost_basis"] == pytest.approx(2.0 * 50000.0 * 60000.0 / 55000.0)
+    assert_matches_reference(lots, prices)
+
+
+def test_unpriced_lots_are_left_out_of_the_totals():
+    prices = {"bitcoin": {"usd": 100.0}}
+    lots = [(1, "bitcoin", 1.0, 50.0, "usd"), (2, "unknown", 5.0, 1.0, "usd"), (3, "bitcoin", 1.0, 40.0, "jpy")]
+
+    result = run(lots, prices)
+
+    assert [p["value"] for p in result["positions"]] == [100.0, None, 100.0]
+    assert result["positions"][2]["cost_basis"] is None
+    assert result["unpriced_positions"] == 2
+    assert result["total_value"] == 100.0 and result["total_cost_basis"] == 50.0
+    assert_matches_reference(lots, prices)
+
+
+def test_groups_by_coin():
+    prices = {"bitcoin": {"usd": 100.0}, "ethereum": {"usd": 10.0}}
+    lots = [(1, "bitcoin", 1.0, 50.0, "usd"), (2, "ethereum", 2.0, 5.0, "usd"), (3, "bitcoin", 0.5, 80.0, "usd")]
+
+    by_coin = {row["coin_id"]: row for row in run(lots, prices)["by_coin"]}
+
+    assert by_coin["bitcoin"]["amount"] == 1.5
+    assert by_coin["bitcoin"]["value"] == 150.0
+    assert by_coin["bitcoin"]["unrealized_pnl"] == 60.0
+    assert by_coin["ethereum"]["cost_basis"] == 10.0
+
+
+def test_empty_portfolio():
+    result = run([], {})
+
+    assert result["positions"] == [] and result["by_coin"] == []
+    assert result["total_value"] == 0.0 and result["total_unrealized_pnl_pct"] is None
+    assert not math.isnan(result["total_unrealized_pnl"])
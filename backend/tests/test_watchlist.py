@@ -0,0 +1,56 @@
+import pytest
+
+import main
+import models as db_models
+
+
+@pytest.fixture
+def db():
+    session = main.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.query(db_models.Watchlist).delete()
+        session.commit()
+        session.close()
+
+
+def watchlist(db, user_id):
+    return {
+        row.coin_id: (row.coin_symbol, row.coin_name)
+        for row in db.query(db_models.Watchlist).filter(db_models.Watchlist.user_id == user_id)
+    }
+
+
+def test_upsert_adds_new_items(db):
+    added = main.upsert_watchlist_items(db, 1, [
+        main.WatchlistItemIn(coin_id="bitcoin", coin_symbol="btc", coin_name="Bitcoin"),
+        main.WatchlistItemIn(coin_id="ethereum", coin_symbol="eth", coin_name="Ethereum"),
+    ])
+    db.commit()
+
+    assert added == 2
+    assert watchlist(db, 1) == {"bitcoin": ("btc", "Bitcoin"), "ethereum": ("eth", "Ethereum")}
+
+
+def test_resubmitted_item_updates_symbol_and_name(db):
+    main.upsert_watchlist_items(db, 1, [main.WatchlistItemIn(coin_id="bitcoin", coin_symbol="btc", coin_name="Bitcoin")])
+    db.commit()
+
+    added = main.upsert_watchlist_items(db, 1, [
+        main.WatchlistItemIn(coin_id="bitcoin", coin_symbol="xbt", coin_name="Bitcoin (renamed)"),
+        main.WatchlistItemIn(coin_id="solana", coin_symbol="sol", coin_name="Solana"),
+    ])
+    db.commit()
+
+    assert added == 1
+    assert watchlist(db, 1) == {"bitcoin": ("xbt", "Bitcoin (renamed)"), "solana": ("sol", "Solana")}
+
+
+def test_upsert_leaves_other_users_alone(db):
+    main.upsert_watchlist_items(db, 1, [main.WatchlistItemIn(coin_id="bitcoin", coin_symbol="btc", coin_name="Bitcoin")])
+    main.upsert_watchlist_items(db, 2, [main.WatchlistItemIn(coin_id="bitcoin", coin_symbol="xbt", coin_name="Renamed")])
+    db.commit()
+
+    assert watchlist(db, 1) == {"bitcoin": ("btc", "Bitcoin")}
+    assert watchlist(db, 2) == {"bitcoin": ("xbt", "Renamed")}
@@ -0,0 +1,247 @@
+import asyncio
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from singleflight import SingleFlight
+
+DAY = 86400
+# No market has chart data before this (2009-01-01); earlier `from` values are clamped to it
+CHART_EPOCH = 1230768000
+CHART_FIELDS = ("prices", "market_caps", "total_volumes")
+
+# CoinGecko picks the granularity of /market_chart/range from the span requested,
+# so every tier fetches fixed, aligned segments of one size:
+# tier -> (segment length, point spacing, refresh interval of the open segment), seconds
+CHART_TIERS = {
+    "5m": (DAY, 300, 60),
+    "hourly": (30 * DAY, 3600, 300),
+    "daily": (365 * DAY, DAY, 3600),
+}
+
+# /ohlc only accepts a number of days and sizes its candles from it:
+# tier -> (valid `days` values that yield this candle size, refresh interval in seconds)
+OHLC_TIERS = {
+    "30m": ((1,), 60),
+    "4h": ((7, 14, 30), 300),
+    "4d": ((90, 180, 365), 3600),
+}
+
+
+def chart_tier(span: float, interval: Optional[str] = None) -> str:
+    if interval == "daily" or span > 90 * DAY:
+        return "daily"
+    if span <= DAY and interval != "hourly":
+        return "5m"
+    return "hourly"
+
+
+def ohlc_tier(days: int) -> str:
+    if days <= 2:
+        return "30m"
+    if days <= 30:
+        return "4h"
+    return "4d"
+
+
+def thin(points: List[list], step_ms: float, last_kept: Optional[float] = None) -> List[list]:
+    """Drop points closer than one tier step apart, keeping the newest point"""
+    kept = []
+    for point in points:
+        # Upstream timestamps jitter by a few seconds around the nominal step
+        if last_kept is None or point[0] - last_kept >= step_ms * 0.9:
+            kept.append(point)
+            last_kept = point[0]
+    if points and (not kept or kept[-1] is not points[-1]):
+        kept.append(points[-1])
+    return kept
+
+
+class Segment:
+    __slots__ = ("start", "end", "series", "fetched_at", "complete")
+
+    def __init__(self, start: float, end: float):
+        self.start = start
+        self.end = end
+        self.series: Dict[str, List[list]] = {field: [] for field in CHART_FIELDS}
+        self.fetched_at = 0.0
+        self.complete = False
+
+    def last_timestamp(self) -> Optional[float]:
+        points = self.series["prices"]
+        return points[-1][0] / 1000 if points else None
+
+
+class CandleSeries:
+    __slots__ = ("candles", "fetched_at")
+
+    def __init__(self):
+        self.candles: List[list] = []
+        self.fetched_at = 0.0
+
+
+class TimeSeriesStore:
+    """Local store of chart points and OHLC candles per (coin, currency).
+
+    Chart data is kept in aligned segments per granularity tier. Finished
+    segments never change and are kept until evicted; only the segment
+    containing "now" is refreshed, and then only from its last stored point
+    onwards. Any range request is answered by slicing the stored segments.
+    OHLC candles are kept per candle size and topped up with the smallest
+    ``days`` request that covers the gap since the last stored candle.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[..., Awaitable[dict]],
+        max_series: int = 2000,
+        settle: float = 3600,
+        max_segments: int = 32,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.fetch = fetch
+        self.max_series = max_series
+        # A segment is final once it ended this many seconds ago
+        self.settle = settle
+        # Most segments one range request may fetch; clamped ranges need far fewer
+        self.max_segments = max_segments
+        self.clock = clock
+        self._segments: "OrderedDict[tuple, Segment]" = OrderedDict()
+        self._candles: "OrderedDict[tuple, CandleSeries]" = OrderedDict()
+        self._inflight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.upstream_calls = 0
+
+    async def chart_range(
+        self, coin_id: str, currency: str, start: float, end: float, interval: Optional[str] = None
+    ) -> dict:
+        """Return the chart points between start and end (unix seconds).
+
+        The range is clamped to [CHART_EPOCH, now]: nothing exists outside it,
+        and a segment that starts in the future could never be completed.
+        Raises ValueError if the clamped range still spans more than
+        ``max_segments`` segments.
+        """
+        start, end = max(start, CHART_EPOCH), min(end, self.clock())
+        if start > end:
+            return {field: [] for field in CHART_FIELDS}
+        tier = chart_tier(end - start, interval)
+        length = CHART_TIERS[tier][0]
+        indices = range(int(start // length), int(end // length) + 1)
+        if len(indices) > self.max_segments:
+            raise ValueError(f"Chart range spans {len(indices)} segments, at most {self.max_segments} allowed")
+        segments = await asyncio.gather(*(self._segment(coin_id, currency, tier, index) for index in indices))
+        low, high = start * 1000, end * 1000
+        result = {field: [] for field in CHART_FIELDS}
+        for segment in segments:
+            for field in CHART_FIELDS:
+                points = segment.series[field]
+                result[field].extend(
+                    points[bisect_left(points, [low]):bisect_right(points, [high, float("inf")])]
+                )
+        return result
+
+    async def _segment(self, coin_id: str, currency: str, tier: str, index: int) -> Segment:
+        key = (coin_id, currency, tier, index)
+        segment = self._segments.get(key)
+        refresh = CHART_TIERS[tier][2]
+        if segment is not None and (
+            segment.complete or self.clock() - segment.fetched_at < refresh
+        ):
+            self._segments.move_to_end(key)
+            self.hits += 1
+            return segment
+        self.misses += 1
+        return await self._inflight.do(
+            "chart:" + ":".join(map(str, key)), lambda: self._load_segment(key, segment)
+        )
+
+    async def _load_segment(self, key: tuple, segment: Optional[Segment]) -> Segment:
+        coin_id, currency, tier, index = key
+        length, step, _ = CHART_TIERS[tier]
+        now = self.clock()
+        if segment is None:
+            segment = Segment(index * length, (index + 1) * length)
+            fetch_from = segment.start
+        else:
+            # Only the open edge is missing; overlap one step to replace the
+            # "current price" point the previous fetch ended with
+            last = segment.last_timestamp()
+            fetch_from = segment.start if last is None else max(segment.start, last - step)
+        fetch_to = min(segment.end, now)
+
+        self.upstream_calls += 1
+        data = await self.fetch(f"/coins/{coin_id}/market_chart/range", params={
+            "vs_currency": currency, "from": int(fetch_from), "to": int(fetch_to)
+        })
+        for field in CHART_FIELDS:
+            stored = segment.series[field]
+            kept = stored[:bisect_left(stored, [fetch_from * 1000])]
+            fetched = data.get(field) or []
+            # A point on the boundary belongs to the next segment
+            fetched = fetched[:bisect_left(fetched, [segment.end * 1000])]
+            segment.series[field] = kept + thin(fetched, step * 1000, kept[-1][0] if kept else None)
+        segment.fetched_at = now
+        segment.complete = segment.end + self.settle <= now
+        self._store(self._segments, key, segment)
+        return segment
+
+    async def ohlc(self, coin_id: str, currency: str, days: int) -> Optional[List[list]]:
+        """Return candles for the last `days` days, or None if no tier can serve it"""
+        tier = ohlc_tier(days)
+        sizes, refresh = OHLC_TIERS[tier]
+        if days > sizes[-1]:
+            return None
+        key = (coin_id, currency, tier)
+        series = self._candles.get(key)
+        if series is not None and self.clock() - series.fetched_at < refresh:
+            self._candles.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+            series = await self._inflight.do(
+                "ohlc:" + ":".join(key), lambda: self._load_candles(key, series)
+            )
+        low = (self.clock() - days * DAY) * 1000
+        return series.candles[bisect_left(series.candles, [low]):]
+
+    async def _load_candles(self, key: tuple, series: Optional[CandleSeries]) -> CandleSeries:
+        coin_id, currency, tier = key
+        sizes, _ = OHLC_TIERS[tier]
+        now = self.clock()
+        if series is None or not series.candles:
+            series = CandleSeries()
+            days = sizes[-1]
+        else:
+            gap = (now - series.candles[-1][0] / 1000) / DAY
+            days = next((size for size in sizes if size >= gap), sizes[-1])
+
+        self.upstream_calls += 1
+        fetched = await self.fetch(f"/coins/{coin_id}/ohlc",
+                                   params={"vs_currency": currency, "days": days})
+        if fetched:
+            kept = series.candles[:bisect_left(series.candles, [fetched[0][0]])]
+            low = (now - sizes[-1] * DAY) * 1000
+            merged = kept + fetched
+            series.candles = merged[bisect_left(merged, [low]):]
+        series.fetched_at = now
+        self._store(self._candles, key, series)
+        return series
+
+    def _store(self, table: OrderedDict, key: tuple, value):
+        table[key] = value
+        table.move_to_end(key)
+        while len(table) > self.max_series:
+            table.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "segments": len(self._segments),
+            "complete_segments": sum(1 for segment in self._segments.values() if segment.complete),
+            "candle_series": len(self._candles),
+            "hits": self.hits,
+            "misses": self.misses,
+            "upstream_calls": self.upstream_calls,
+        }
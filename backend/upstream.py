@@ -0,0 +1,380 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException
+
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "10"))  # seconds per read/write
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_DEADLINE = float(os.getenv("UPSTREAM_DEADLINE", "15"))  # seconds for the whole call
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+# Calls per minute allowed by our CoinGecko plan (0 disables the limiter)
+UPSTREAM_RATE_LIMIT_PER_MINUTE = float(os.getenv("COINGECKO_RATE_LIMIT_PER_MINUTE", "30"))
+UPSTREAM_RATE_BURST = float(os.getenv("COINGECKO_RATE_BURST", "10"))
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+UPSTREAM_BACKOFF = float(os.getenv("UPSTREAM_BACKOFF", "0.5"))  # seconds, doubled per attempt
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "8"))
+UPSTREAM_BREAKER_THRESHOLD = int(os.getenv("UPSTREAM_BREAKER_THRESHOLD", "5"))  # consecutive failures
+UPSTREAM_BREAKER_RESET = float(os.getenv("UPSTREAM_BREAKER_RESET", "30"))  # seconds before a probe
+
+# Priority classes: lower goes first when calls queue for rate limit tokens
+PRIORITY_HIGH = 0  # prices feeding alerts, the live stream and /simple/price
+PRIORITY_NORMAL = 1  # lists, markets and other shared pages
+PRIORITY_LOW = 2  # per-coin detail pages, tickers and charts
+
+# Client errors passed through as-is; any other non-2xx becomes a 502
+PASSTHROUGH_STATUSES = {400, 404, 422}
+
+
+class UpstreamError(HTTPException):
+    """Raised when an upstream call fails; FastAPI renders it like any HTTPException."""
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """Token bucket shared by every upstream call, granting waiters by priority.
+
+    Tokens refill at ``rate_per_minute`` up to ``burst``. When none are left
+    callers queue and are served lowest priority number first, then in
+    arrival order. ``pause`` empties the bucket for a while, e.g. after the
+    upstream answers 429.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: float, clock=time.monotonic):
+        self.rate = rate_per_minute / 60
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        self.paused_until = 0.0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self.granted = 0
+        self.timeouts = 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, priority: int, timeout: float) -> bool:
+        """Wait up to timeout seconds for a token; False if none came in time"""
+        if self.rate <= 0:
+            return True
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        self._dispatch()
+        if not future.done():
+            try:
+                await asyncio.wait_for(future, max(0.0, timeout))
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                return False
+        self.granted += 1
+        return True
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+        self.tokens = 0.0
+        if self.rate > 0:
+            self._dispatch()
+
+    def _dispatch(self):
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        now = self.clock()
+        self._refill(now)
+        while self._waiters and now >= self.paused_until and self.tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.tokens -= 1
+                future.set_result(None)
+        # Drop waiters that gave up, then sleep until the next token is due
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        if self._waiters:
+            delay = max(self.paused_until - now, (1 - self.tokens) / self.rate, 0.001)
+            self._wakeup = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def stats(self) -> dict:
+        # Read-only: /metrics calls this off the event loop, which owns the limiter's state
+        now = self.clock()
+        tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        return {
+            "rate_per_minute": self.rate * 60,
+            "burst": self.capacity,
+            "tokens": round(tokens, 2),
+            "waiting": sum(1 for _, _, future in self._waiters if not future.done()),
+            "paused_for": round(max(0.0, self.paused_until - now), 2),
+            "granted": self.granted,
+            "timeouts": self.timeouts,
+        }
+
+
+class CircuitBreaker:
+    """Stops calling an upstream that keeps failing.
+
+    After ``threshold`` consecutive failures the breaker opens and calls fail
+    at once. Once ``reset_timeout`` seconds have passed a single probe call
+    is let through; its success closes the breaker, its failure reopens it.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self.opens = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def retry_after(self) -> int:
+        if self.opened_at is None:
+            return 0
+        return max(1, int(self.opened_at + self.reset_timeout - self.clock()) + 1)
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or (self.opened_at is None and self.failures >= self.threshold):
+            self.opened_at = self.clock()
+            self.opens += 1
+        self._probing = False
+
+    def release(self):
+        """Give back a probe slot without a verdict (429 or a cancelled call)"""
+        self._probing = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opens": self.opens,
+            "retry_after": self.retry_after(),
+        }
+
+
+class UpstreamClient:
+    """Shared, pooled async HTTP client for calls to a single upstream API.
+
+    One ``httpx.AsyncClient`` is kept for the lifetime of the process so
+    connections are reused across requests. Every call gets a per-request
+    timeout and an overall deadline, so a hung upstream only fails the
+    requests waiting on it instead of blocking the event loop.
+
+    Calls also pass through a governor: a rate limiter sized to the API plan
+    (``priority`` decides who waits), retries with jittered backoff for 429,
+    5xx and transport errors, and a circuit breaker. Anything but a 2xx JSON
+    body raises UpstreamError, so error payloads never reach the cache.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout: float = UPSTREAM_TIMEOUT,
+        connect_timeout: float = UPSTREAM_CONNECT_TIMEOUT,
+        deadline: float = UPSTREAM_DEADLINE,
+        max_connections: int = UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive: int = UPSTREAM_MAX_KEEPALIVE,
+        rate_per_minute: float = UPSTREAM_RATE_LIMIT_PER_MINUTE,
+        burst: float = UPSTREAM_RATE_BURST,
+        retries: int = UPSTREAM_RETRIES,
+        backoff: float = UPSTREAM_BACKOFF,
+        backoff_max: float = UPSTREAM_BACKOFF_MAX,
+        breaker_threshold: int = UPSTREAM_BREAKER_THRESHOLD,
+        breaker_reset: float = UPSTREAM_BREAKER_RESET,
+    ):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.deadline = deadline
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.limiter = RateLimiter(rate_per_minute, burst)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self._client: Optional[httpx.AsyncClient] = None
+        self.calls = 0
+        self.retried = 0
+        self.rejected = 0
+        self.statuses: Dict[int, int] = {}
+        # Called as observer(path, outcome, seconds) after every attempt, where
+        # outcome is the status code as a string, "timeout" or "error"
+        self.observer: Optional[Callable[[str, str, float], None]] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                ),
+                headers={"Accept": "application/json"},
+            )
+        return self._client
+
+    async def start(self):
+        self._get_client()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def is_unavailable(self) -> bool:
+        """True while the breaker is open and calls fail fast"""
+        return self.breaker.state == "open"
+
+    def _unavailable(self) -> UpstreamError:
+        self.rejected += 1
+        return UpstreamError(
+            status_code=503,
+            detail="Upstream temporarily unavailable",
+            headers={"Retry-After": str(self.breaker.retry_after())},
+        )
+
+    def _observe(self, path: str, outcome: str, started: float):
+        if self.observer is not None:
+            self.observer(path, outcome, time.perf_counter() - started)
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter spreads the retries of many callers over the whole window
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    async def get(
+        self,
+        path: str,
+        params: Optional[dict] = None,
+        timeout: Optional[float] = None,
+        deadline: Optional[float] = None,
+        priority: int = PRIORITY_NORMAL,
+    ):
+        client = self._get_client()
+        request_timeout = httpx.USE_CLIENT_DEFAULT if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        deadline_at = loop.time() + (deadline or self.deadline)
+        attempt = 0
+        while True:
+            if self.is_unavailable:
+                raise self._unavailable()
+            if not await self.limiter.acquire(priority, deadline_at - loop.time()):
+                raise UpstreamError(
+                    status_code=503,
+                    detail="Upstream rate limit reached, please retry shortly",
+                    headers={"Retry-After": "1"},
+                )
+            if not self.breaker.allow():
+                raise self._unavailable()
+
+            self.calls += 1
+            retry_after = None
+            started = time.perf_counter()
+            try:
+                response = await asyncio.wait_for(
+                    client.get(path, params=params, timeout=request_timeout),
+                    max(0.0, deadline_at - loop.time()),
+                )
+            except (asyncio.TimeoutError, httpx.TimeoutException):
+                self._observe(path, "timeout", started)
+                self.breaker.record_failure()
+                error = UpstreamError(status_code=504, detail="Upstream request timed out")
+            except httpx.HTTPError:
+                self._observe(path, "error", started)
+                self.breaker.record_failure()
+                error = UpstreamError(status_code=502, detail="Upstream request failed")
+            except BaseException:
+                self.breaker.release()
+                raise
+            else:
+                status_code = response.status_code
+                self._observe(path, str(status_code), started)
+                self.statuses[status_code] = self.statuses.get(status_code, 0) + 1
+                if response.is_success:
+                    self.breaker.record_success()
+                    try:
+                        return response.json()
+                    except ValueError:
+                        raise UpstreamError(status_code=502, detail="Upstream returned an invalid response")
+                retry_after = retry_after_seconds(response.headers.get("Retry-After"))
+                if status_code == 429:
+                    # Healthy but over quota: hold every caller back, not just this one
+                    self.breaker.release()
+                    self.limiter.pause(retry_after if retry_after is not None else self._backoff(attempt + 1))
+                    error = UpstreamError(
+                        status_code=503,
+                        detail="Upstream rate limit reached, please retry shortly",
+                        headers={"Retry-After": str(int(retry_after or 0) + 1)},
+                    )
+                elif status_code >= 500:
+                    self.breaker.record_failure()
+                    error = UpstreamError(status_code=502, detail=f"Upstream returned {status_code}")
+                else:
+                    self.breaker.record_success()
+                    raise UpstreamError(
+                        status_code=status_code if status_code in PASSTHROUGH_STATUSES else 502,
+                        detail=f"Upstream returned {status_code}",
+                    )
+
+            delay = retry_after if retry_after is not None else self._backoff(attempt)
+            if attempt >= self.retries or loop.time() + delay >= deadline_at:
+                raise error
+            attempt += 1
+            self.retried += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "retries": self.retried,
+            "rejected": self.rejected,
+            "statuses": dict(self.statuses),
+            "limiter": self.limiter.stats(),
+            "breaker": self.breaker.stats(),
+        }
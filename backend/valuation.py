@@ -0,0 +1,104 @@
+import math
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+
+def _clean(values: np.ndarray) -> List:
+    """Array to JSON-friendly list, with NaN (unknown price) as None"""
+    return [None if math.isnan(value) else value for value in values.tolist()]
+
+
+def value_portfolio(
+    lot_ids: Sequence[int],
+    coin_ids: Sequence[str],
+    amounts: Sequence[float],
+    purchase_prices: Sequence[float],
+    purchase_currencies: Sequence[str],
+    prices: Dict[str, Dict[str, float]],
+    currency: str,
+) -> dict:
+    """Value portfolio lots in `currency` with array math over all lots at once.
+
+    `prices` is shaped like a /simple/price response and must quote every
+    coin in `currency` and in each lot's purchase currency. The cost basis
+    is converted with the coin's own cross rate (price in `currency` over
+    price in the purchase currency), so no separate FX table is needed.
+    Lots whose prices are unknown come back with None values and are left
+    out of the totals.
+    """
+    coins = np.array(coin_ids, dtype=str)
+    currencies = np.array([(cur or currency).lower() for cur in purchase_currencies], dtype=str)
+    amounts = np.array(amounts, dtype=float)
+    purchase_prices = np.array(purchase_prices, dtype=float)
+
+    # Look each price up once per distinct coin / (coin, currency), then scatter to lots
+    unique_coins, coin_index = np.unique(coins, return_inverse=True)
+    # Pairs are keyed by tuple, so coin ids may contain any character
+    pair_positions: Dict[Tuple[str, str], int] = {}
+    pair_index = np.array(
+        [pair_positions.setdefault(pair, len(pair_positions)) for pair in zip(coins.tolist(), currencies.tolist())],
+        dtype=np.intp,
+    )
+    coin_prices = np.array(
+        [prices.get(coin, {}).get(currency, np.nan) for coin in unique_coins.tolist()] or [np.nan]
+    )
+    pair_prices = np.array(
+        [prices.get(coin, {}).get(cur, np.nan) for coin, cur in pair_positions] or [np.nan]
+    )
+    unit_price = coin_prices[coin_index]
+    purchase_unit_price = pair_prices[pair_index]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fx = np.where(currencies == currency, 1.0, unit_price / purchase_unit_price)
+        value = amounts * unit_price
+        cost_basis = amounts * purchase_prices * fx
+        pnl = value - cost_basis
+        pnl_pct = np.where(cost_basis != 0, pnl / cost_basis * 100, np.nan)
+
+    known = ~np.isnan(value) & ~np.isnan(cost_basis)
+    total_value = float(value[known].sum())
+    total_cost = float(cost_basis[known].sum())
+
+    groups = len(unique_coins)
+    by_coin_amount = np.bincount(coin_index, weights=amounts, minlength=groups)
+    by_coin_value = np.bincount(coin_index, weights=np.where(known, value, 0.0), minlength=groups)
+    by_coin_cost = np.bincount(coin_index, weights=np.where(known, cost_basis, 0.0), minlength=groups)
+
+    return {
+        "currency": currency,
+        "positions": [
+            {
+                "id": lot_id,
+                "coin_id": coin,
+                "amount": amount,
+                "purchase_currency": purchase_currency,
+                "current_price": price,
+                "value": lot_value,
+                "cost_basis": cost,
+                "unrealized_pnl": lot_pnl,
+                "unrealized_pnl_pct": lot_pct,
+            }
+            for lot_id, coin, amount, purchase_currency, price, lot_value, cost, lot_pnl, lot_pct in zip(
+                lot_ids, coins.tolist(), amounts.tolist(), currencies.tolist(), _clean(unit_price),
+                _clean(value), _clean(cost_basis), _clean(pnl), _clean(pnl_pct),
+            )
+        ],
+        "by_coin": [
+            {
+                "coin_id": coin,
+                "amount": amount,
+                "value": coin_value,
+                "cost_basis": coin_cost,
+                "unrealized_pnl": coin_value - coin_cost,
+            }
+            for coin, amount, coin_value, coin_cost in zip(
+                unique_coins.tolist(), by_coin_amount.tolist(), by_coin_value.tolist(), by_coin_cost.tolist()
+            )
+        ],
+        "total_value": total_value,
+        "total_cost_basis": total_cost,
+        "total_unrealized_pnl": total_value - total_cost,
+        "total_unrealized_pnl_pct": (total_value - total_cost) / total_cost * 100 if total_cost else None,
+        "unpriced_positions": int((~known).sum()),
+    }